@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AMSConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ams'
+
+    def ready(self):
+        from ams import signals  # noqa: F401
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+ALWAYS_OPEN_EXCHANGES = ['CC']
+HISTORY_START = date(2000, 1, 3)
+
+
+def get_seed(symbol):
+    return int(hashlib.md5(symbol.upper().encode()).hexdigest()[:8], 16)
+
+
+def get_price(symbol, day):
+    """
+    Returns the synthetic close of symbol on day, a slow trend with two cycles on top of a per-symbol base price.
+    """
+    seed = get_seed(symbol)
+    exchange = symbol.rsplit('.', 1)[-1].upper()
+    base = 0.5 + (seed % 400) / 100 if exchange == 'FOREX' else 5 + seed % 500
+    phase = (seed % 628) / 100
+    t = (day - HISTORY_START).days
+    return round(base * math.exp(0.00015 * t + 0.15 * math.sin(t / 60 + phase) + 0.03 * math.sin(t / 6.5 + phase)),
+                 4)
+
+
+def is_session(symbol, day):
+    return symbol.rsplit('.', 1)[-1].upper() in ALWAYS_OPEN_EXCHANGES or day.weekday() < 5
+
+
+def get_last_session(symbol, day):
+    while not is_session(symbol, day):
+        day -= timedelta(days=1)
+    return day
+
+
+def get_bar(symbol, day):
+    close = get_price(symbol, day)
+    previous = get_price(symbol, day - timedelta(days=1))
+    return {
+        'date': day.isoformat(),
+        'open': previous,
+        'high': round(max(close, previous) * 1.01, 4),
+        'low': round(min(close, previous) * 0.99, 4),
+        'close': close,
+        'adjusted_close': close,
+        'volume': get_seed(symbol + day.isoformat()) % 1000000,
+    }
+
+
+def get_quote(symbol, today):
+    day = get_last_session(symbol, today)
+    close = get_price(symbol, day)
+    previous_close = get_price(symbol, get_last_session(symbol, day - timedelta(days=1)))
+    return {
+        'code': symbol.upper(),
+        'timestamp': int(datetime.combine(day, datetime.min.time()).timestamp()),
+        'gmtoffset': 0,
+        'open': previous_close,
+        'high': round(max(close, previous_close) * 1.01, 4),
+        'low': round(min(close, previous_close) * 0.99, 4),
+        'close': close,
+        'volume': get_seed(symbol + day.isoformat()) % 1000000,
+        'previousClose': previous_close,
+        'change': round(close - previous_close, 4),
+        'change_p': round((close - previous_close) / previous_close * 100, 4),
+    }
+
+
+def real_time(path, query, today):
+    symbols = [path[1]] + [symbol for symbol in query.get('s', '').split(',') if symbol]
+    quotes = [get_quote(symbol, today) for symbol in symbols]
+    return quotes if len(quotes) > 1 else quotes[0]
+
+
+def parse_date(value, default):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else default
+
+
+def get_period_key(day, period):
+    if period == 'w':
+        return day.isocalendar()[:2]
+    if period == 'm':
+        return day.year, day.month
+    return day
+
+
+def eod(path, query, today):
+    symbol = path[1]
+    begin = max(parse_date(query.get('from'), HISTORY_START), HISTORY_START)
+    end = min(parse_date(query.get('to'), today), today)
+    period = query.get('period', 'd')
+
+    bars = []
+    day = begin
+    while day <= end:
+        if is_session(symbol, day):
+            bar = get_bar(symbol, day)
+            if bars and get_period_key(day, period) == get_period_key(date.fromisoformat(bars[-1]['date']), period):
+                bars[-1] = bar
+            else:
+                bars.append(bar)
+        day += timedelta(days=1)
+    return bars
+
+
+def eod_bulk_last_day(path, query, today):
+    exchange = path[1]
+    day = get_last_session(f'X.{exchange}', parse_date(query.get('date'), today))
+    symbols = [symbol for symbol in query.get('symbols', '').split(',') if symbol]
+    result = []
+    for symbol in symbols:
+        bar = get_bar(symbol, day)
+        result.append({'code': symbol.rsplit('.', 1)[0], 'exchange_short_name': exchange, **bar})
+    return result
+
+
+def get_symbol_entry(code, exchange):
+    return {
+        'Code': code,
+        'Name': f'{code} Synthetic Corp',
+        'Country': 'USA',
+        'Exchange': exchange,
+        'Currency': 'USD',
+        'Type': 'Common Stock',
+        'Isin': f'US{get_seed(code + exchange) % 10 ** 9:09d}0',
+    }
+
+
+def search(path, query, today):
+    text = urllib.parse.unquote(path[1]).upper()
+    code, exchange = text.rsplit('.', 1) if '.' in text else (text, 'US')
+    results = []
+    for suffix in ['', 'A', 'B']:
+        entry = get_symbol_entry(code + suffix, exchange)
+        entry['ISIN'] = entry.pop('Isin')
+        entry['previousClose'] = get_price(f'{code}{suffix}.{exchange}', get_last_session(text, today))
+        entry['previousCloseDate'] = get_last_session(text, today).isoformat()
+        results.append(entry)
+    return results
+
+
+def news(path, query, today):
+    symbol = query.get('s', 'AAPL.US')
+    limit = int(query.get('limit', 50))
+    return [{
+        'date': (datetime.combine(today, datetime.min.time()) - timedelta(hours=6 * i)).isoformat() + '+00:00',
+        'title': f'{symbol} synthetic headline {i}',
+        'content': '',
+        'link': f'https://finance.yahoo.com/news/{symbol.lower()}-{i}.html',
+        'symbols': [symbol],
+        'tags': [],
+    } for i in range(limit)]
+
+
+def exchange_details(path, query, today):
+    return {'Code': path[1], 'ExchangeHolidays': {}}
+
+
+def exchange_symbol_list(path, query, today):
+    exchange = path[1]
+    return [get_symbol_entry(f'S{i:04d}', exchange) for i in range(1000)]
+
+
+HANDLERS = {
+    'real-time': real_time,
+    'eod': eod,
+    'eod-bulk-last-day': eod_bulk_last_day,
+    'search': search,
+    'news': news,
+    'exchange-details': exchange_details,
+    'exchange-symbol-list': exchange_symbol_list,
+}
+
+
+def get_recording_name(path, query):
+    key = json.dumps({k: v for k, v in sorted(query.items()) if k != 'api_token'})
+    return hashlib.md5(f'{path}?{key}'.encode()).hexdigest() + '.json'
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, record_dir=None,
+                 replay_dir=None, upstream_url=None, upstream_token=None, today=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.upstream_url = upstream_url
+        self.upstream_token = upstream_token
+        self.today = today
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    def draw(self):
+        with self.random_lock:
+            return self.random.random(), self.random.random()
+
+
+class EodStubHandler(BaseHTTPRequestHandler):
+    config = StubConfig()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip('/')
+        if path.startswith('/api/'):
+            path = path[len('/api'):]
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        error_draw, latency_draw = self.config.draw()
+        delay = self.config.latency + self.config.jitter * latency_draw
+        if delay:
+            time.sleep(delay)
+        if error_draw < self.config.error_rate:
+            return self.send_json(self.config.error_status, {'error': 'Injected error'})
+
+        try:
+            status, body = self.resolve(path, query)
+        except Exception as e:
+            logger.exception(e)
+            status, body = 500, {'error': str(e)}
+        self.send_json(status, body)
+
+    def resolve(self, path, query):
+        name = get_recording_name(path, query)
+        if self.config.replay_dir and os.path.exists(os.path.join(self.config.replay_dir, name)):
+            with open(os.path.join(self.config.replay_dir, name), 'r', encoding='utf-8') as file:
+                return 200, json.load(file)
+        if self.config.record_dir:
+            return self.record(path, query, name)
+
+        parts = path.strip('/').split('/', 1)
+        handler = HANDLERS.get(parts[0])
+        if handler is None or (len(parts) < 2 and parts[0] != 'news'):
+            return 404, {'error': f'Unknown endpoint {path}'}
+        return 200, handler(parts, query, self.config.today or date.today())
+
+    def record(self, path, query, name):
+        params = urllib.parse.urlencode({**query, 'api_token': self.config.upstream_token})
+        with urllib.request.urlopen(f'{self.config.upstream_url}{path}?{params}', timeout=60) as response:
+            body = json.load(response)
+        with open(os.path.join(self.config.record_dir, name), 'w', encoding='utf-8') as file:
+            json.dump(body, file)
+        return 200, body
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(host='127.0.0.1', port=8001, config=None):
+    """
+    Returns a server standing in for the EOD API endpoints used by the app. Synthetic prices are deterministic, a
+    symbol always has the same price on the same day, so runs against the stub can be compared with each other.
+    Responses can also be recorded from the real API once and replayed offline.
+    """
+    handler = type('ConfiguredEodStubHandler', (EodStubHandler,), {'config': config or StubConfig()})
+    return ThreadingHTTPServer((host, port), handler)
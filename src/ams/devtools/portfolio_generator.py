@@ -0,0 +1,325 @@
+import logging
+import math
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from ams import models
+from ams.devtools import eod_stub
+
+logger = logging.getLogger(__name__)
+
+# Exchanges created when missing, (name, mic, country, timezone, opening hour, closing hour, currency).
+SYNTHETIC_EXCHANGES = {
+    'US': ('USA Stocks', 'XNAS', 'USA', 'America/New_York', time(9, 30), time(16, 0), 'USD'),
+    'WAR': ('Warsaw Stock Exchange', 'XWAR', 'Poland', 'Europe/Warsaw', time(9, 0), time(17, 0), 'PLN'),
+    'LSE': ('London Exchange', 'XLON', 'UK', 'Europe/London', time(8, 0), time(16, 30), 'GBP'),
+    'XETRA': ('XETRA Stock Exchange', 'XETR', 'Germany', 'Europe/Berlin', time(9, 0), time(17, 30), 'EUR'),
+    'CC': ('Cryptocurrencies', 'CC', None, 'UTC', time(0, 0), time(23, 59), 'USD'),
+}
+CENT = Decimal('0.01')
+BATCH_SIZE = 5000
+ACCOUNTS_PER_FLUSH = 50
+
+
+class GeneratorException(Exception):
+    pass
+
+
+def to_money(value):
+    return Decimal(value).quantize(CENT)
+
+
+def get_price(asset, day):
+    return to_money(eod_stub.get_price(f'{asset.ticker}.{asset.exchange.code}', day))
+
+
+def get_trading_day(asset, day):
+    return eod_stub.get_last_session(f'{asset.ticker}.{asset.exchange.code}', day)
+
+
+def get_weekday(day, end):
+    """
+    Moves day to the next weekday, or the previous one at the end of the range, every synthetic market trades then.
+    """
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    while day > end or day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def ensure_exchanges(codes):
+    exchanges = {exchange.code: exchange for exchange in models.Exchange.objects.filter(code__in=codes)}
+    for code in codes:
+        if code in exchanges:
+            continue
+        if code not in SYNTHETIC_EXCHANGES:
+            raise GeneratorException(f'Unknown exchange {code}, load it first or use one of '
+                                     f'{", ".join(SYNTHETIC_EXCHANGES)}')
+        name, mic, country, timezone, opening_hour, closing_hour, _ = SYNTHETIC_EXCHANGES[code]
+        exchanges[code] = models.Exchange.objects.create(name=name, mic=mic, country=country, code=code,
+                                                         timezone=timezone, opening_hour=opening_hour,
+                                                         closing_hour=closing_hour)
+    return [exchanges[code] for code in codes]
+
+
+def ensure_assets(count, exchanges):
+    """
+    Returns count synthetic assets spread round-robin over exchanges, reusing the ones created by earlier runs.
+    """
+    # crypto tickers are quoted against USD like real ones, kept within the 10 characters of Asset.ticker
+    wanted = [(f'SYN{i:04d}' if exchanges[i % len(exchanges)].code != 'CC' else f'S{i:04d}-USD',
+               exchanges[i % len(exchanges)]) for i in range(count)]
+    existing = {(asset.ticker, asset.exchange_id): asset for asset in models.Asset.objects.filter(
+        ticker__in=[ticker for ticker, _ in wanted], exchange__in=exchanges).select_related('exchange')}
+
+    to_create = []
+    for ticker, exchange in wanted:
+        if (ticker, exchange.id) not in existing:
+            to_create.append(models.Asset(
+                isin=eod_stub.get_symbol_entry(ticker, exchange.code)['Isin'],
+                ticker=ticker,
+                name=f'{ticker} Synthetic Corp',
+                currency=SYNTHETIC_EXCHANGES.get(exchange.code, (None,) * 6 + ('USD',))[6],
+                exchange=exchange,
+                type='STOCK' if exchange.code != 'CC' else 'CRYPTO'
+            ))
+    for asset in models.Asset.objects.bulk_create(to_create, batch_size=BATCH_SIZE):
+        existing[(asset.ticker, asset.exchange_id)] = asset
+    return [existing[(ticker, exchange.id)] for ticker, exchange in wanted]
+
+
+def generate_price_histories(assets, begin, end):
+    """
+    Stores the stand-in server's daily prices for assets, so local series and the stub agree.
+    """
+    count = 0
+    for asset in assets:
+        prices = []
+        day = begin
+        while day <= end:
+            if eod_stub.is_session(f'{asset.ticker}.{asset.exchange.code}', day):
+                prices.append(models.SymbolPrice(code=asset.ticker, exchange_code=asset.exchange.code, date=day,
+                                                 adjusted_close=get_price(asset, day)))
+            day += timedelta(days=1)
+        models.SymbolPrice.objects.bulk_create(prices, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        count += len(prices)
+    return count
+
+
+def poisson(rng, mean):
+    # Knuth's method for small means, normal approximation above it
+    if mean > 30:
+        return max(0, int(rng.gauss(mean, math.sqrt(mean))))
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k - 1
+
+
+class AccountSimulation:
+    """
+    Replays a random but plausible history of one account: monthly deposits, buys of popular assets, partial sells and
+    quarterly dividends, keeping FIFO lots to derive the final balances.
+    """
+
+    def __init__(self, rng, account, assets, weights, begin, end, trades_per_year):
+        self.rng = rng
+        self.account = account
+        self.assets = assets
+        self.assets_by_id = {asset.id: asset for asset in assets}
+        self.weights = weights
+        self.begin = begin
+        self.end = end
+        self.trades_per_year = trades_per_year
+        self.cash = dict()
+        self.lots = dict()
+        self.events = []
+
+    def deposit(self, day, currency, amount):
+        amount = to_money(amount)
+        self.cash[currency] = self.cash.get(currency, Decimal(0)) + amount
+        self.events.append((day, models.AccountTransaction(
+            account=self.account, type=models.AccountTransaction.DEPOSIT, amount=amount, currency=currency,
+            date=datetime.combine(day, time(9, 0))), None))
+
+    def trade(self, day, asset, transaction_type, quantity, price, commission=None):
+        asset_transaction = models.AssetTransaction(
+            account=self.account, asset_id=asset.id, quantity=quantity, price=price, transaction_type=transaction_type,
+            date=datetime.combine(day, time(12, 0)), pay_currency=asset.currency, exchange_rate=None,
+            commission=commission)
+        if transaction_type == models.AssetTransaction.DIVIDEND:
+            amount = price
+        else:
+            amount = quantity * price + (commission or 0)
+        account_transaction = models.AccountTransaction(
+            account=self.account, type=transaction_type, amount=amount, currency=asset.currency,
+            date=asset_transaction.date)
+        self.events.append((day, account_transaction, asset_transaction))
+        return amount
+
+    def buy(self, day, asset):
+        price = get_price(asset, day)
+        budget = Decimal(self.rng.choice([500, 1000, 2000, 5000]))
+        quantity = max(1, int(budget / price))
+        commission = to_money(self.rng.uniform(0, 5))
+        amount = quantity * price + commission
+        if self.cash.get(asset.currency, Decimal(0)) < amount:
+            self.deposit(day, asset.currency, math.ceil(amount - self.cash.get(asset.currency, Decimal(0))) + 100)
+        self.cash[asset.currency] -= self.trade(day, asset, models.AssetTransaction.BUY, quantity, price, commission)
+        self.lots.setdefault(asset.id, []).append([quantity, price])
+
+    def sell(self, day, asset):
+        lots = self.lots[asset.id]
+        held = sum(lot[0] for lot in lots)
+        quantity = max(1, int(held * self.rng.choice([0.25, 0.5, 1])))
+        price = get_price(asset, day)
+        self.cash[asset.currency] += self.trade(day, asset, models.AssetTransaction.SELL, quantity, price)
+        remaining = quantity
+        while remaining:
+            taken = min(lots[0][0], remaining)
+            lots[0][0] -= taken
+            remaining -= taken
+            if lots[0][0] == 0:
+                lots.pop(0)
+
+    def pay_dividends(self, day):
+        for asset_id, lots in self.lots.items():
+            held = sum(lot[0] for lot in lots)
+            if held and self.rng.random() < 0.5:
+                asset = self.assets_by_id[asset_id]
+                if asset.type == 'CRYPTO':
+                    continue
+                amount = to_money(held * get_price(asset, day) * Decimal('0.005'))
+                if amount > 0:
+                    self.cash[asset.currency] += self.trade(day, asset, models.AssetTransaction.DIVIDEND, held, amount)
+
+    def run(self):
+        self.deposit(self.begin, self.assets[0].currency, self.rng.choice([1000, 5000, 10000]))
+        months = (self.end.year - self.begin.year) * 12 + self.end.month - self.begin.month
+        days = (self.end - self.begin).days
+        trade_days = sorted(get_weekday(self.begin + timedelta(days=self.rng.randrange(days + 1)), self.end)
+                            for _ in range(poisson(self.rng, self.trades_per_year * days / 365)))
+
+        schedule = [(day, 'trade') for day in trade_days]
+        schedule += [(self.begin + relativedelta(months=month), 'deposit') for month in range(1, months + 1)]
+        schedule += [(self.begin + relativedelta(months=month), 'dividend') for month in range(3, months + 1, 3)]
+        for day, kind in sorted(schedule, key=lambda entry: entry[0]):
+            if kind == 'deposit':
+                self.deposit(day, self.assets[0].currency, self.rng.choice([200, 500, 1000]))
+            elif kind == 'dividend':
+                self.pay_dividends(day)
+            else:
+                asset = self.rng.choices(self.assets, self.weights)[0]
+                if self.lots.get(asset.id) and self.rng.random() < 0.3:
+                    self.sell(day, asset)
+                else:
+                    self.buy(day, asset)
+        return self
+
+    def get_asset_balances(self):
+        transactions_by_asset = dict()
+        for _, _, asset_transaction in self.events:
+            if asset_transaction is not None:
+                transactions_by_asset.setdefault(asset_transaction.asset_id, []).append(asset_transaction)
+
+        balances = []
+        for asset_id, lots in self.lots.items():
+            asset = self.assets_by_id[asset_id]
+            quantity = sum(lot[0] for lot in lots)
+            transactions = transactions_by_asset[asset_id]
+            average_price = to_money(sum(lot[0] * lot[1] for lot in lots) / quantity) if quantity else Decimal(0)
+            price = get_price(asset, get_trading_day(asset, self.end))
+            balances.append(models.AssetBalance(
+                asset_id=asset_id, account=self.account, quantity=quantity, price=price,
+                average_price=average_price,
+                result=to_money((price - average_price) / average_price) if average_price else Decimal(0),
+                first_event_date=transactions[0].date.date(),
+                last_transaction_date=transactions[-1].date,
+            ))
+        return balances
+
+    def get_account_balances(self):
+        return [models.AccountBalance(account=self.account, currency=currency, amount=amount)
+                for currency, amount in self.cash.items()]
+
+
+def save_simulations(simulations):
+    asset_transactions = [event[2] for simulation in simulations for event in simulation.events if event[2]]
+    models.AssetTransaction.objects.bulk_create(asset_transactions, batch_size=BATCH_SIZE)
+
+    account_transactions = []
+    for simulation in simulations:
+        for _, account_transaction, asset_transaction in simulation.events:
+            if asset_transaction is not None:
+                account_transaction.correlation_id = asset_transaction.id
+            account_transactions.append(account_transaction)
+    models.AccountTransaction.objects.bulk_create(account_transactions, batch_size=BATCH_SIZE)
+
+    models.AssetBalance.objects.bulk_create(
+        [balance for simulation in simulations for balance in simulation.get_asset_balances()], batch_size=BATCH_SIZE)
+    models.AccountBalance.objects.bulk_create(
+        [balance for simulation in simulations for balance in simulation.get_account_balances()],
+        batch_size=BATCH_SIZE)
+
+    accounts = []
+    for simulation in simulations:
+        if simulation.events:
+            simulation.account.last_transaction_date = max(event[1].date for event in simulation.events)
+            accounts.append(simulation.account)
+    models.Account.objects.bulk_update(accounts, ['last_transaction_date'], batch_size=BATCH_SIZE)
+    return len(asset_transactions), len(account_transactions)
+
+
+def generate(users=10, accounts_per_user=2, assets=100, exchange_codes=('US', 'WAR', 'CC'), years=5,
+             trades_per_year=50, seed=0, end=None, prefix='synthetic', password='synthetic', with_prices=True):
+    """
+    Generates users with accounts and years of transactions over a pool of synthetic assets. The same arguments
+    always give the same data, prices are the stand-in server's, so a run against run_eod_stub is fully offline.
+    Histories are not generated, they are rebuilt by the usual services.
+    """
+    if User.objects.filter(username__startswith=f'{prefix}_').exists():
+        raise GeneratorException(f'Users with prefix {prefix} already exist, use another prefix')
+
+    rng = random.Random(seed)
+    end = end or datetime.now().date()
+    begin = end - relativedelta(years=years)
+
+    exchanges = ensure_exchanges(list(exchange_codes))
+    asset_pool = ensure_assets(assets, exchanges)
+    # asset popularity follows Zipf's law, a few assets are held by most accounts
+    weights = [1 / (rank + 1) for rank in range(len(asset_pool))]
+    rng.shuffle(weights)
+
+    stats = {'users': users, 'accounts': users * accounts_per_user, 'assets': len(asset_pool), 'prices': 0}
+    if with_prices:
+        stats['prices'] = generate_price_histories(asset_pool, begin, end)
+
+    hashed_password = make_password(password)
+    user_objects = User.objects.bulk_create(
+        [User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=hashed_password)
+         for i in range(users)], batch_size=BATCH_SIZE)
+    accounts = models.Account.objects.bulk_create(
+        [models.Account(user=user, name=f'Account {j + 1}') for user in user_objects for j in range(accounts_per_user)],
+        batch_size=BATCH_SIZE)
+    models.AccountPreferences.objects.bulk_create(
+        [models.AccountPreferences(account=account, base_currency='PLN') for account in accounts],
+        batch_size=BATCH_SIZE)
+
+    stats['asset_transactions'] = stats['account_transactions'] = 0
+    for i in range(0, len(accounts), ACCOUNTS_PER_FLUSH):
+        simulations = [AccountSimulation(rng, account, asset_pool, weights, begin, end, trades_per_year).run()
+                       for account in accounts[i:i + ACCOUNTS_PER_FLUSH]]
+        with transaction.atomic():
+            asset_count, account_count = save_simulations(simulations)
+        stats['asset_transactions'] += asset_count
+        stats['account_transactions'] += account_count
+        logger.info(f'Generated {min(i + ACCOUNTS_PER_FLUSH, len(accounts))}/{len(accounts)} accounts')
+    return stats
@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...devtools import portfolio_generator
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, accounts and years of transactions for load and scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-u', '--users', type=int, default=10)
+        parser.add_argument('-a', '--accounts-per-user', type=int, default=2)
+        parser.add_argument('--assets', type=int, default=100, help='Size of the pool of synthetic assets')
+        parser.add_argument('-e', '--exchange', action='append', dest='exchanges',
+                            help='Exchange code to spread assets over, repeatable, defaults to US, WAR and CC')
+        parser.add_argument('-y', '--years', type=int, default=5)
+        parser.add_argument('-t', '--trades-per-year', type=int, default=50, help='Average trades per account')
+        parser.add_argument('-s', '--seed', type=int, default=0)
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day of generated history, defaults to today')
+        parser.add_argument('--prefix', default='synthetic', help='Prefix of generated usernames')
+        parser.add_argument('--password', default='synthetic')
+        parser.add_argument('--no-prices', action='store_true', help='Skip the local price histories')
+
+    def handle(self, *args, **options):
+        try:
+            stats = portfolio_generator.generate(
+                users=options['users'],
+                accounts_per_user=options['accounts_per_user'],
+                assets=options['assets'],
+                exchange_codes=options['exchanges'] or ['US', 'WAR', 'CC'],
+                years=options['years'],
+                trades_per_year=options['trades_per_year'],
+                seed=options['seed'],
+                end=options['end'],
+                prefix=options['prefix'],
+                password=options['password'],
+                with_prices=not options['no_prices'],
+            )
+        except portfolio_generator.GeneratorException as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{count} {name}' for name, count in stats.items())))
@@ -1,35 +1,23 @@
 import json
-from django.core.management.base import BaseCommand, CommandError
-from ams.models import Exchange
-from django.utils.dateparse import parse_time
 import os
 
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import symbol_universe_service
+
 
 class Command(BaseCommand):
     help = 'Load a list of exchanges from a JSON file into the database'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument('-f', '--file', default=os.path.join(settings.BASE_DIR, 'ams', 'data', 'exchanges.json'))
+
+    def handle(self, file, *args, **options):
 
         try:
-            with open('/code/src/ams/data/exchanges.json', 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                for entry in data:
-                    exchange, created = Exchange.objects.update_or_create(
-                        name=entry['name'],
-                        mic=entry['mic'].split(' ')[0],
-                        defaults={
-                            'country': entry['country'],
-                            'code': entry['code'],
-                            'timezone': entry['timezone'],
-                            'opening_hour': parse_time(entry['open']) if entry['open'] else None,
-                            'closing_hour': parse_time(entry['close']) if entry['close'] else None,
-                        }
-                    )
-
-                    if created:
-                        self.stdout.write(self.style.SUCCESS(f'Successfully created exchange {exchange}'))
-                    else:
-                        self.stdout.write(self.style.WARNING(f'Updated existing exchange {exchange}'))
+            count = symbol_universe_service.upsert_exchanges(symbol_universe_service.read_entries(file))
+            self.stdout.write(self.style.SUCCESS(f'Successfully loaded {count} exchanges'))
 
         except FileNotFoundError:
             raise CommandError(f'The file does not exist.')
@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import symbol_universe_service
+
+
+class Command(BaseCommand):
+    help = 'Bulk load exchanges and their symbol lists from EOD or from local files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exchanges-file', default=os.path.join(settings.BASE_DIR, 'ams', 'data', 'exchanges.json'))
+        parser.add_argument('-e', '--exchange', action='append', dest='exchanges',
+                            help='Exchange code to load symbols for, can be repeated. Defaults to all exchanges.')
+        parser.add_argument('--symbols-file', help='JSON or CSV symbol list to load instead of calling EOD')
+
+    def handle(self, exchanges_file, exchanges, symbols_file, **options):
+        if symbols_file and (not exchanges or len(exchanges) != 1):
+            raise CommandError('--symbols-file requires exactly one --exchange')
+
+        try:
+            counts = symbol_universe_service.load_symbol_universe(exchanges_file, exchanges, symbols_file)
+        except FileNotFoundError as exc:
+            raise CommandError(f'The file does not exist: {exc.filename}')
+
+        for code, count in counts.items():
+            self.stdout.write(f'{code}: {count} symbols')
+        self.stdout.write(self.style.SUCCESS(f'Successfully loaded {sum(counts.values())} symbols'))
@@ -0,0 +1,46 @@
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from ...devtools import eod_stub
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the EOD API, point EOD_API_URL at it to work offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra seconds per response')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with an error')
+        parser.add_argument('--error-status', type=int, default=500, help='Status of injected errors, e.g. 429')
+        parser.add_argument('--today', type=date.fromisoformat, help='Date the synthetic market is frozen at')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for latency and error injection')
+        parser.add_argument('--replay', help='Directory of recorded responses served before synthetic data')
+        parser.add_argument('--record', help='Directory to save responses proxied from the real EOD API to')
+        parser.add_argument('--upstream-url', default='https://eodhd.com/api')
+
+    def handle(self, *args, **options):
+        if options['record']:
+            os.makedirs(options['record'], exist_ok=True)
+        config = eod_stub.StubConfig(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            record_dir=options['record'],
+            replay_dir=options['replay'],
+            upstream_url=options['upstream_url'],
+            upstream_token=os.getenv('EOD_TOKEN'),
+            today=options['today'],
+            seed=options['seed'],
+        )
+        server = eod_stub.make_server(options['host'], options['port'], config)
+        self.stdout.write(self.style.SUCCESS(
+            f'EOD stub listening on http://{options["host"]}:{options["port"]}, set EOD_API_URL to use it'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...services import trading_calendar_service
+
+
+class Command(BaseCommand):
+    help = 'Fetch exchange holidays used by the trading calendar'
+
+    def handle(self, *args, **kwargs):
+        trading_calendar_service.update_all_exchange_holidays()
+        self.stdout.write(self.style.SUCCESS('Successfully updated exchange holidays'))
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+
+from ams.services import circuit_breaker, metrics, tracing, profiler
+from main.settings import TRACE_SERVER_TIMING, TRACE_LOG, TRACE_SLOW_REQUEST_SECONDS
+
+STALE_WARNING = '110 - "Response is Stale"'
+
+
+@sync_and_async_middleware
+def stale_data_middleware(get_response):
+    """
+    Adds a Warning header to responses built from market data served stale while the EOD circuit was open.
+    """
+    def flag(response, stale):
+        if stale:
+            response['Warning'] = STALE_WARNING
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with circuit_breaker.track_stale() as stale:
+                response = await get_response(request)
+            return flag(response, stale)
+    else:
+        def middleware(request):
+            with circuit_breaker.track_stale() as stale:
+                response = get_response(request)
+            return flag(response, stale)
+
+    return middleware
+
+
+def get_route(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match else 'unmatched'
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Records latency and SQL queries of every request, labelled with the name of the route it resolved to.
+    """
+    def observe(request, response, start, stats):
+        metrics.observe_request(get_route(request), request.method, str(response.status_code),
+                                time.perf_counter() - start, stats)
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            with metrics.track_queries() as stats:
+                response = await get_response(request)
+            return observe(request, response, start, stats)
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            with metrics.track_queries() as stats:
+                response = get_response(request)
+            return observe(request, response, start, stats)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def tracing_middleware(get_response):
+    """
+    Traces every request, spans come from the service functions decorated with tracing.traced. The trace is sent
+    back as a Server-Timing header and logged when TRACE_LOG is set or the request was slow.
+    """
+    def finish(response, trace):
+        if TRACE_SERVER_TIMING:
+            response['Server-Timing'] = trace.get_server_timing()
+        if trace.duration >= TRACE_SLOW_REQUEST_SECONDS:
+            trace.log(logging.WARNING)
+        elif TRACE_LOG:
+            trace.log()
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with tracing.start_trace(f'{request.method} {request.path}') as trace:
+                response = await get_response(request)
+            return finish(response, trace)
+    else:
+        def middleware(request):
+            with tracing.start_trace(f'{request.method} {request.path}') as trace:
+                response = get_response(request)
+            return finish(response, trace)
+
+    return middleware
+
+
+def is_async_view(request):
+    try:
+        return asyncio.iscoroutinefunction(resolve(request.path_info, getattr(request, 'urlconf', None)).func)
+    except Resolver404:
+        return False
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """
+    Profiles requests of staff users sending an X-Profile header (cprofile or sample) and a PROFILE_SAMPLE_RATE share
+    of all other requests. Requests left alone only pay for the header lookup and, with sampling on, a random number.
+    Under ASGI sync views run in the thread sensitive executor, so their requests are profiled in that thread.
+    """
+    def profile_in_view_thread(request, mode):
+        with profiler.profile(mode) as session:
+            return async_to_sync(get_response)(request), session
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            if profiler.PROFILE_HEADER in request.headers:
+                mode, sampled = await sync_to_async(profiler.get_requested_mode)(request), False
+            else:
+                mode, sampled = profiler.get_sampled_mode(), True
+            if mode is None:
+                return await get_response(request)
+
+            start = time.perf_counter()
+            if is_async_view(request):
+                with profiler.profile(mode) as session:
+                    response = await get_response(request)
+            else:
+                response, session = await sync_to_async(profile_in_view_thread)(request, mode)
+            if session is not None:
+                await sync_to_async(profiler.save_profile)(request, response, get_route(request), mode, session,
+                                                           time.perf_counter() - start, sampled)
+            return response
+    else:
+        def middleware(request):
+            if profiler.PROFILE_HEADER in request.headers:
+                mode, sampled = profiler.get_requested_mode(request), False
+            else:
+                mode, sampled = profiler.get_sampled_mode(), True
+            if mode is None:
+                return get_response(request)
+
+            start = time.perf_counter()
+            with profiler.profile(mode) as session:
+                response = get_response(request)
+            if session is not None:
+                profiler.save_profile(request, response, get_route(request), mode, session,
+                                      time.perf_counter() - start, sampled)
+            return response
+
+    return middleware
@@ -0,0 +1,76 @@
+# Generated by Django 4.0.10 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+BATCH_SIZE = 5000
+
+
+def collapse_daily_rows(apps, schema_editor):
+    AssetBalanceHistory = apps.get_model('ams', 'AssetBalanceHistory')
+    histories = AssetBalanceHistory.objects.order_by('account_id', 'asset_id', 'date').iterator(chunk_size=BATCH_SIZE)
+
+    current = None
+    to_update = []
+    to_delete = []
+    for history in histories:
+        if (current and current.account_id == history.account_id and current.asset_id == history.asset_id
+                and (history.date - current.valid_to).days == 1 and current.quantity == history.quantity
+                and current.price == history.price and current.result == history.result):
+            current.valid_to = history.date
+            to_delete.append(history.id)
+        else:
+            if current:
+                to_update.append(current)
+            current = history
+            current.valid_from = history.date
+            current.valid_to = history.date
+
+        if len(to_update) >= BATCH_SIZE:
+            AssetBalanceHistory.objects.bulk_update(to_update, ['valid_from', 'valid_to'])
+            to_update = []
+        if len(to_delete) >= BATCH_SIZE:
+            AssetBalanceHistory.objects.filter(id__in=to_delete).delete()
+            to_delete = []
+    if current:
+        to_update.append(current)
+    AssetBalanceHistory.objects.bulk_update(to_update, ['valid_from', 'valid_to'])
+    AssetBalanceHistory.objects.filter(id__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0004_remove_accountpreferences_tax_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assetbalancehistory',
+            name='valid_from',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='assetbalancehistory',
+            name='valid_to',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(collapse_daily_rows, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='assetbalancehistory',
+            name='valid_from',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='assetbalancehistory',
+            name='valid_to',
+            field=models.DateField(),
+        ),
+        migrations.RemoveField(
+            model_name='assetbalancehistory',
+            name='date',
+        ),
+        migrations.AddIndex(
+            model_name='assetbalancehistory',
+            index=models.Index(fields=['account', 'asset_id', 'valid_from'], name='ams_assetbalhist_acc_asset_idx'),
+        ),
+    ]
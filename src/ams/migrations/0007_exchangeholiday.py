@@ -0,0 +1,26 @@
+# Generated by Django 4.0.10 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0006_account_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeHoliday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('name', models.CharField(max_length=255)),
+                ('exchange', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holidays', to='ams.exchange')),
+            ],
+            options={
+                'unique_together': {('exchange', 'date')},
+            },
+        ),
+    ]
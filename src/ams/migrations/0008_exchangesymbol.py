@@ -0,0 +1,45 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0007_exchangeholiday'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='ExchangeSymbol',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('country', models.CharField(blank=True, max_length=128, null=True)),
+                ('currency', models.CharField(blank=True, max_length=10, null=True)),
+                ('type', models.CharField(blank=True, max_length=50, null=True)),
+                ('isin', models.CharField(blank=True, max_length=12, null=True)),
+                ('exchange', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symbols', to='ams.exchange')),
+            ],
+            options={
+                'unique_together': {('exchange', 'code')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='exchangesymbol',
+            index=models.Index(fields=['code'], name='ams_symbol_code_like_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='exchangesymbol',
+            index=models.Index(fields=['isin'], name='ams_symbol_isin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangesymbol',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='ams_symbol_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
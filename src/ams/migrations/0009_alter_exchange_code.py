@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0008_exchangesymbol'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exchange',
+            name='code',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.0.10 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0009_alter_exchange_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymbolPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20)),
+                ('exchange_code', models.CharField(max_length=20)),
+                ('date', models.DateField()),
+                ('adjusted_close', models.DecimalField(decimal_places=6, max_digits=17)),
+            ],
+            options={
+                'unique_together': {('code', 'exchange_code', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SymbolReturnSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20)),
+                ('exchange_code', models.CharField(max_length=20)),
+                ('as_of', models.DateField()),
+                ('first_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('week_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('month_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('three_months_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('six_months_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('year_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('three_years_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+                ('five_years_price', models.DecimalField(decimal_places=6, max_digits=17, null=True)),
+            ],
+            options={
+                'unique_together': {('code', 'exchange_code')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.10 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0010_symbolprice_symbolreturnsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=255)),
+                ('task_id', models.CharField(max_length=255)),
+                ('arguments', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('success', 'Success'), ('failure', 'Failure'), ('retry', 'Retry')], default='running', max_length=10)),
+                ('queued_at', models.DateTimeField(null=True)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('duration', models.FloatField(null=True)),
+                ('queue_wait', models.FloatField(null=True)),
+                ('queries', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('upstream_calls', models.IntegerField(default=0)),
+                ('overlapped', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task_name', 'started_at'], name='ams_jobrun_task_started_idx')],
+            },
+        ),
+    ]
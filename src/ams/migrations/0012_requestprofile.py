@@ -0,0 +1,30 @@
+# Generated by Django 4.0.10 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0011_jobrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('route', models.CharField(max_length=255)),
+                ('account_id', models.BigIntegerField(null=True)),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('status_code', models.IntegerField()),
+                ('duration', models.FloatField()),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile stats'), ('sample', 'Sampled collapsed stacks')], max_length=10)),
+                ('sampled', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+            ],
+        ),
+    ]
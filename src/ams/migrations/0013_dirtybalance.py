@@ -0,0 +1,32 @@
+# Generated by Django 4.0.10 on 2026-10-19 20:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ams', '0012_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset_id', models.IntegerField(null=True)),
+                ('dirty_from', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ams.account')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dirtybalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('asset_id__isnull', False)), fields=('account', 'asset_id'), name='unique_dirty_asset_balance'),
+        ),
+        migrations.AddConstraint(
+            model_name='dirtybalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('asset_id__isnull', True)), fields=('account',), name='unique_dirty_account_balance'),
+        ),
+    ]
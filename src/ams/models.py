@@ -1,19 +1,32 @@
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 
+class ActiveAccountManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Account(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     last_transaction_date = models.DateTimeField(blank=True, null=True)
     last_save_date = models.DateTimeField(blank=True, null=True)
     xirr = models.DecimalField(max_digits=17, decimal_places=10, blank=True, null=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = ActiveAccountManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"{self.user.username}'s {self.name} account"
 
     class Meta:
-        unique_together = ('name', 'user')
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'user'], condition=models.Q(deleted_at__isnull=True),
+                                    name='unique_active_account_name'),
+        ]
 
 
 class AccountHistory(models.Model):
@@ -67,7 +80,7 @@ class Exchange(models.Model):
     name = models.CharField(max_length=128)
     mic = models.CharField(max_length=10)
     country = models.CharField(max_length=128, null=True, blank=True)
-    code = models.CharField(max_length=20)
+    code = models.CharField(max_length=20, unique=True)
     timezone = models.CharField(max_length=100, null=True, blank=True)
     opening_hour = models.TimeField(null=True, blank=True)
     closing_hour = models.TimeField(null=True, blank=True)
@@ -76,6 +89,39 @@ class Exchange(models.Model):
         return f"{self.name}"
 
 
+class ExchangeSymbol(models.Model):
+    exchange = models.ForeignKey(Exchange, on_delete=models.CASCADE, related_name='symbols')
+    code = models.CharField(max_length=20)
+    name = models.CharField(max_length=255)
+    country = models.CharField(max_length=128, null=True, blank=True)
+    currency = models.CharField(max_length=10, null=True, blank=True)
+    type = models.CharField(max_length=50, null=True, blank=True)
+    isin = models.CharField(max_length=12, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.code} on {self.exchange}"
+
+    class Meta:
+        unique_together = ('exchange', 'code')
+        indexes = [
+            models.Index(fields=['code'], name='ams_symbol_code_like_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['isin'], name='ams_symbol_isin_idx'),
+            GinIndex(fields=['name'], name='ams_symbol_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+
+class ExchangeHoliday(models.Model):
+    exchange = models.ForeignKey(Exchange, on_delete=models.CASCADE, related_name='holidays')
+    date = models.DateField()
+    name = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.name} on {self.exchange}"
+
+    class Meta:
+        unique_together = ('exchange', 'date')
+
+
 class AssetTransaction(models.Model):
     BUY = 'buy'
     SELL = 'sell'
@@ -136,11 +182,47 @@ class AssetBalance(models.Model):
 class AssetBalanceHistory(models.Model):
     asset_id = models.IntegerField()
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
-    date = models.DateField()
+    valid_from = models.DateField()
+    valid_to = models.DateField()
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=13, decimal_places=2)
     result = models.DecimalField(max_digits=13, decimal_places=2)
 
+    def has_same_state(self, quantity, price, result):
+        return self.quantity == quantity and self.price == price and self.result == result
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'asset_id', 'valid_from'], name='ams_assetbalhist_acc_asset_idx'),
+        ]
+
+
+class SymbolPrice(models.Model):
+    code = models.CharField(max_length=20)
+    exchange_code = models.CharField(max_length=20)
+    date = models.DateField()
+    adjusted_close = models.DecimalField(max_digits=17, decimal_places=6)
+
+    class Meta:
+        unique_together = ('code', 'exchange_code', 'date')
+
+
+class SymbolReturnSnapshot(models.Model):
+    code = models.CharField(max_length=20)
+    exchange_code = models.CharField(max_length=20)
+    as_of = models.DateField()
+    first_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    week_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    month_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    three_months_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    six_months_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    year_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    three_years_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+    five_years_price = models.DecimalField(max_digits=17, decimal_places=6, null=True)
+
+    class Meta:
+        unique_together = ('code', 'exchange_code')
+
 
 class AccountPreferences(models.Model):
     account = models.OneToOneField(Account, on_delete=models.CASCADE, related_name='account_preferences', unique=True)
@@ -159,3 +241,77 @@ class FavoriteAsset(models.Model):
 
     class Meta:
         unique_together = ('code', 'exchange')
+
+
+class JobRun(models.Model):
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILURE = 'failure'
+    RETRY = 'retry'
+    STATUS_CHOICES = (
+        (RUNNING, 'Running'),
+        (SUCCESS, 'Success'),
+        (FAILURE, 'Failure'),
+        (RETRY, 'Retry'),
+    )
+
+    task_name = models.CharField(max_length=255)
+    task_id = models.CharField(max_length=255)
+    arguments = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    queued_at = models.DateTimeField(null=True)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True)
+    duration = models.FloatField(null=True)
+    queue_wait = models.FloatField(null=True)
+    queries = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    upstream_calls = models.IntegerField(default=0)
+    overlapped = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['task_name', 'started_at'], name='ams_jobrun_task_started_idx'),
+        ]
+
+
+class RequestProfile(models.Model):
+    CPROFILE = 'cprofile'
+    SAMPLE = 'sample'
+    MODE_CHOICES = (
+        (CPROFILE, 'cProfile stats'),
+        (SAMPLE, 'Sampled collapsed stacks'),
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    route = models.CharField(max_length=255)
+    # plain ids, a profile outlives the account and user it was taken for
+    account_id = models.BigIntegerField(null=True)
+    user_id = models.BigIntegerField(null=True)
+    status_code = models.IntegerField()
+    duration = models.FloatField()
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    sampled = models.BooleanField(default=False)
+    data = models.BinaryField()
+
+
+class DirtyBalance(models.Model):
+    """
+    Earliest date from which derived balances of an account need rebuilding after writes deferred in lazy rebuild
+    mode. asset_id is null for the account balances and XIRR, set for the balance of one asset.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    asset_id = models.IntegerField(null=True)
+    dirty_from = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'asset_id'], condition=models.Q(asset_id__isnull=False),
+                                    name='unique_dirty_asset_balance'),
+            models.UniqueConstraint(fields=['account'], condition=models.Q(asset_id__isnull=True),
+                                    name='unique_dirty_account_balance'),
+        ]
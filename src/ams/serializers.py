@@ -7,7 +7,7 @@ from ams.services import account_balance_service
 
 
 class AccountBalanceSerializer(serializers.ModelSerializer):
-    account_id = serializers.IntegerField(source='account.id', read_only=True)
+    account_id = serializers.IntegerField(source='account_id', read_only=True)
     amount = serializers.DecimalField(max_digits=17, decimal_places=2, coerce_to_string=False)
 
     class Meta:
@@ -22,9 +22,19 @@ class AccountCreateSerializer(serializers.ModelSerializer):
         model = models.Account
         fields = ('id', 'name', 'user', 'last_transaction_date')
 
+    def validate(self, attrs):
+        # the unique constraint only covers active accounts, DRF does not generate a validator for it
+        name = attrs.get('name', self.instance.name if self.instance is not None else None)
+        accounts = models.Account.objects.filter(user=attrs['user'], name=name)
+        if self.instance is not None:
+            accounts = accounts.exclude(pk=self.instance.pk)
+        if accounts.exists():
+            raise serializers.ValidationError({'name': 'An account with this name already exists.'})
+        return attrs
+
 
 class AccountPreferencesSerializer(serializers.ModelSerializer):
-    account_id = serializers.IntegerField(source='account.id', read_only=True)
+    account_id = serializers.IntegerField(source='account_id', read_only=True)
 
     class Meta:
         model = models.AccountPreferences
@@ -37,7 +47,7 @@ class AccountPreferencesSerializer(serializers.ModelSerializer):
 
 
 class AccountSerializer(serializers.ModelSerializer):
-    user_id = serializers.IntegerField(source='user.id')
+    user_id = serializers.IntegerField(source='user_id')
     balances = AccountBalanceSerializer(many=True)
     xirr = serializers.DecimalField(max_digits=17, decimal_places=10, coerce_to_string=False)
     preferences = AccountPreferencesSerializer(source='account_preferences', read_only=True)
@@ -48,13 +58,15 @@ class AccountSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['value'] = account_balance_service.get_account_value(instance)
+        values = self.context.get('values')
+        data['value'] = values[instance.id] if values is not None else \
+            account_balance_service.get_account_value(instance)
         return data
 
 
 class TransactionCreateSerializer(serializers.ModelSerializer):
     amount = serializers.DecimalField(max_digits=17, decimal_places=2)
-    account = serializers.IntegerField(source='account.id', read_only=True)
+    account = serializers.IntegerField(source='account_id', read_only=True)
 
     class Meta:
         model = models.AccountTransaction
@@ -69,7 +81,7 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
 
 class TransactionSerializer(serializers.ModelSerializer):
     amount = serializers.DecimalField(max_digits=17, decimal_places=2, coerce_to_string=False)
-    account_id = serializers.IntegerField(source='account.id', read_only=True)
+    account_id = serializers.IntegerField(source='account_id', read_only=True)
 
     class Meta:
         model = models.AccountTransaction
@@ -90,7 +102,7 @@ class StockSerializer(serializers.ModelSerializer):
 
 class StockTransactionSerializer(serializers.ModelSerializer):
     price = serializers.DecimalField(max_digits=17, decimal_places=2, coerce_to_string=False)
-    account_id = serializers.IntegerField(source='account.id', read_only=True)
+    account_id = serializers.IntegerField(source='account_id', read_only=True)
     pay_currency = serializers.CharField(max_length=3, required=False, allow_null=True)
     exchange_rate = serializers.DecimalField(max_digits=13, decimal_places=2, required=False, allow_null=True)
     commission = serializers.DecimalField(max_digits=17, decimal_places=2, required=False, allow_null=True)
@@ -118,7 +130,7 @@ class StockBalanceDtoSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        stock = models.Asset.objects.get(id=instance.asset_id)
+        stock = self.get_asset(instance.asset_id)
         data['name'] = stock.name
         data['ticker'] = stock.ticker
         data['currency'] = stock.currency
@@ -126,15 +138,20 @@ class StockBalanceDtoSerializer(serializers.ModelSerializer):
         data['type'] = stock.type
         return data
 
+    def get_asset(self, asset_id):
+        assets = self.context.get('assets')
+        if assets is not None:
+            return assets[asset_id]
+        return models.Asset.objects.select_related('exchange').get(id=asset_id)
+
 
-class StockBalanceHistoryDtoSerializer(serializers.ModelSerializer):
+class StockBalanceHistoryDtoSerializer(serializers.Serializer):
+    asset_id = serializers.IntegerField()
+    date = serializers.DateField()
+    quantity = serializers.IntegerField()
     price = serializers.DecimalField(max_digits=13, decimal_places=2, coerce_to_string=False)
     result = serializers.DecimalField(max_digits=13, decimal_places=2, coerce_to_string=False)
 
-    class Meta:
-        model = models.AssetBalanceHistory
-        fields = ('asset_id', 'date', 'quantity', 'price', 'result')
-
 
 class BuyCommandSerializer(serializers.Serializer):
     ticker = serializers.CharField(max_length=10)
@@ -2,28 +2,23 @@ import decimal
 from collections import defaultdict
 from datetime import timedelta, datetime
 
-from django.db import transaction
-
 from ams import models
-from ams.services import eod_service, account_xirr_service
+from ams.services import eod_service, account_xirr_service, deletion_service, tracing, unit_of_work, \
+    dirty_balance_service
 
 
 def add_transaction_to_account_balance(transaction, account):
-    account_balance, created = models.AccountBalance.objects.get_or_create(
-        account_id=transaction.account_id,
-        currency=transaction.currency,
-        defaults={
-            'amount': 0,
-        }
-    )
+    if dirty_balance_service.defer_rebuild(account.id, None, transaction.date.date()):
+        return
+
+    account_balance, created = unit_of_work.get_or_create_account_balance(account, transaction.currency)
 
     if (created or account.last_save_date.date() >= transaction.date.date()
             or account.last_transaction_date > transaction.date):
         rebuild_account_balance(account, transaction.date.date())
     else:
         update_account_balance(transaction, account, account_balance)
-        account_balance.save()
-        account.save()
+        unit_of_work.save(account_balance, account)
         account_xirr_service.calculate_account_xirr(account)
 
 
@@ -40,6 +35,7 @@ def update_account_balance(transaction, account, account_balance):
         account.last_transaction_date = transaction.date
 
 
+@tracing.traced
 def add_transaction_from_stock(stock_transaction, stock, account):
     currency = stock_transaction.pay_currency if stock_transaction.pay_currency else stock.currency
     exchange_rate = stock_transaction.exchange_rate if stock_transaction.exchange_rate else 1
@@ -103,48 +99,40 @@ def modify_transaction_from_stock(stock_transaction, stock, account):
 
     account_transaction.save()
     older_transaction_date = min(old_account_transaction_date.date(), account_transaction.date.date())
-    rebuild_account_balance(account_transaction.account, older_transaction_date)
+    if not dirty_balance_service.defer_rebuild(account.id, None, older_transaction_date):
+        rebuild_account_balance(account_transaction.account, older_transaction_date)
 
 
+@tracing.traced
+@unit_of_work.serialized(lambda account, *args: account)
 def rebuild_account_balance(account, rebuild_date):
     account_history = models.AccountHistory.objects.filter(account_id=account.id,
                                                            date=rebuild_date - timedelta(days=1)).first()
-    # TODO Put fetching account histories and account balances to function
-    account_balances = models.AccountBalance.objects.filter(account_id=account.id)
-    account_balances_by_currency = {account_balance.currency: account_balance for account_balance in account_balances}
+    account_balances_by_currency = unit_of_work.get_account_balances([account])[account.id]
     currencies = list(account_balances_by_currency.keys())
     currencies_from_transactions = models.AccountTransaction.objects.filter(account_id=account.id).values_list('currency',
                                                                                                                flat=True).distinct()
     currencies = list(set(currencies + list(currencies_from_transactions)))
 
+    account_balance_histories_by_currency = dict()
     if account_history:
         account_balance_histories = models.AccountHistoryBalance.objects.filter(account_history__id=account_history.id)
         account_balance_histories_by_currency = {account_balance_history.currency: account_balance_history
                                                  for account_balance_history in account_balance_histories}
 
-        for currency in currencies:
-            if currency in account_balance_histories_by_currency:
-                account_balances_by_currency[currency].amount = account_balance_histories_by_currency[currency].amount
-            elif currency in account_balances_by_currency:
-                account_balances_by_currency[currency].amount = 0
-            else:
-                account_balances_by_currency[currency] = models.AccountBalance.objects.create(
-                    account_id=account.id,
-                    currency=currency,
-                    amount=0
-                )
-    else:
-        for currency in currencies:
-            if currency in account_balances_by_currency:
-                account_balances_by_currency[currency].amount = 0
-            else:
-                account_balances_by_currency[currency] = models.AccountBalance.objects.create(
-                    account_id=account.id,
-                    currency=currency,
-                    amount=0
-                )
+    for currency in currencies:
+        if currency not in account_balances_by_currency:
+            account_balances_by_currency[currency] = models.AccountBalance.objects.create(
+                account_id=account.id,
+                currency=currency,
+                amount=0
+            )
+        if currency in account_balance_histories_by_currency:
+            account_balances_by_currency[currency].amount = account_balance_histories_by_currency[currency].amount
+        else:
+            account_balances_by_currency[currency].amount = 0
 
-    models.AccountHistory.objects.filter(account_id=account.id, date__gte=rebuild_date).delete()
+    deletion_service.delete_account_histories(account.id, rebuild_date)
 
     current_date = rebuild_date
     yesterday = datetime.now().date() - timedelta(days=1)
@@ -175,39 +163,50 @@ def rebuild_account_balance(account, rebuild_date):
     for transaction in models.AccountTransaction.objects.filter(account_id=account.id, date__date=current_date).order_by('date'):
         update_account_balance(transaction, account, account_balances_by_currency[transaction.currency])
 
-    for account_balance in account_balances_by_currency.values():
-        account_balance.save()
     account.last_save_date = yesterday
-    account.save()
+    unit_of_work.save(*account_balances_by_currency.values(), account)
     account_xirr_service.calculate_account_xirr(account)
 
 
 def modify_transaction(account_transaction, old_transaction_date):
     older_transaction_date = min(old_transaction_date.date(), account_transaction.date.date())
-    rebuild_account_balance(account_transaction.account, older_transaction_date)
+    if not dirty_balance_service.defer_rebuild(account_transaction.account_id, None, older_transaction_date):
+        rebuild_account_balance(unit_of_work.get_account(account_transaction.account_id), older_transaction_date)
 
 
-@transaction.atomic
+@unit_of_work.atomic()
 def delete_transaction(account_transaction):
     account_transaction.delete()
-    rebuild_account_balance(account_transaction.account, account_transaction.date.date())
+    rebuild_date = account_transaction.date.date()
+    if not dirty_balance_service.defer_rebuild(account_transaction.account_id, None, rebuild_date):
+        rebuild_account_balance(unit_of_work.get_account(account_transaction.account_id), rebuild_date)
 
 
 def get_account_value(account):
-    base_currency = account.account_preferences.base_currency
-    account_balances = models.AccountBalance.objects.filter(account=account)
-    stock_balances = models.AssetBalance.objects.filter(account=account)
-    stocks = models.Asset.objects.filter(id__in=stock_balances.values_list('asset_id', flat=True).distinct())
-    asset_id_to_currency = {stock.id: stock.currency for stock in stocks}
-
-    currencies = []
+    return get_accounts_value([account])[account.id]
+
+
+def get_accounts_value(accounts):
+    """
+    Returns {account id: value in the account's base currency}, fetching balances of all accounts at once.
+    """
+    base_currencies = {account.id: account.account_preferences.base_currency for account in accounts}
+    account_balances = [balance for balances in unit_of_work.get_account_balances(accounts).values()
+                        for balance in balances.values()]
+    stock_balances = [balance for balances in unit_of_work.get_asset_balances(accounts).values()
+                      for balance in balances.values()]
+    stocks = unit_of_work.get_assets({stock_balance.asset_id for stock_balance in stock_balances})
+    asset_id_to_currency = {stock.id: stock.currency for stock in stocks.values()}
+
+    currencies = set()
     for balance in account_balances:
-        if balance.currency != base_currency:
-            currencies.append(f'{balance.currency}{base_currency}')
-    for currency in asset_id_to_currency.values():
-        if currency != base_currency:
-            currencies.append(f'{currency}{base_currency}')
-    currencies = list(set(currencies))
+        if balance.currency != base_currencies[balance.account_id]:
+            currencies.add(f'{balance.currency}{base_currencies[balance.account_id]}')
+    for stock_balance in stock_balances:
+        currency = asset_id_to_currency[stock_balance.asset_id]
+        if currency != base_currencies[stock_balance.account_id]:
+            currencies.add(f'{currency}{base_currencies[stock_balance.account_id]}')
+    currencies = list(currencies)
     currency_pairs = {}
     if len(currencies) > 0:
         if len(currencies) == 1:
@@ -215,17 +214,20 @@ def get_account_value(account):
         else:
             currency_pairs = eod_service.get_current_currency_prices(currencies)
 
-    amount = 0
+    amounts = {account_id: 0 for account_id in base_currencies}
     for balance in account_balances:
+        base_currency = base_currencies[balance.account_id]
         if balance.currency == base_currency:
-            amount += balance.amount
+            amounts[balance.account_id] += balance.amount
         else:
-            amount += balance.amount * decimal.Decimal(currency_pairs[f'{balance.currency}{base_currency}'])
+            amounts[balance.account_id] += balance.amount * decimal.Decimal(
+                currency_pairs[f'{balance.currency}{base_currency}'])
     for stock_balance in stock_balances:
+        base_currency = base_currencies[stock_balance.account_id]
         if asset_id_to_currency[stock_balance.asset_id] == base_currency:
-            amount += stock_balance.quantity * stock_balance.price
+            amounts[stock_balance.account_id] += stock_balance.quantity * stock_balance.price
         else:
             rate = decimal.Decimal(
                 currency_pairs[f'{asset_id_to_currency[stock_balance.asset_id]}{base_currency}'])
-            amount += stock_balance.quantity * stock_balance.price * rate
-    return amount
+            amounts[stock_balance.account_id] += stock_balance.quantity * stock_balance.price * rate
+    return amounts
@@ -2,7 +2,7 @@ import decimal
 from collections import defaultdict
 
 from ams import models
-from ams.services import eod_service
+from ams.services import eod_service, asset_history_service
 
 
 class AccountHistoryDto:
@@ -24,8 +24,9 @@ def get_account_history_dtos(account):
     for balance in history_balances:
         date_to_history_balances[balance.account_history.date].append(balance)
     date_to_stock_history_balances = defaultdict(list)
-    for balance in stock_history_balances:
-        date_to_stock_history_balances[balance.date].append(balance)
+    for stock_history in stock_history_balances:
+        for balance in asset_history_service.expand_history(stock_history):
+            date_to_stock_history_balances[balance.date].append(balance)
 
     currencies = []
     for balance in history_balances:
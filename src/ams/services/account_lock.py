@@ -0,0 +1,27 @@
+from django.db import connection
+
+# first key of the two key advisory locks, keeps them apart from other advisory lock users
+BALANCES = 1
+
+
+class AccountLockedException(Exception):
+    pass
+
+
+def lock(account_id):
+    """
+    Waits for the balance lock of the account, held until the transaction ends so concurrent writers rebuild the
+    account's balances one after the other. Taking it again in the same transaction returns at once.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [BALANCES, account_id])
+
+
+def try_lock(account_id):
+    """
+    Takes the balance lock of the account when nobody holds it, returns whether it did.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [BALANCES, account_id])
+        return cursor.fetchone()[0]
+
@@ -4,10 +4,12 @@ from datetime import date
 from django.db.models.functions import TruncDate
 from pyxirr import xirr, InvalidPaymentsError
 
-from ams.models import AccountTransaction, AssetBalance, AccountPreferences, Asset, AccountBalance
+from ams.models import AccountTransaction, AccountPreferences
+from ams.services import tracing, unit_of_work
 from ams.services.eod_service import get_current_currency_prices, get_current_currency_price
 
 
+@tracing.traced
 def calculate_account_xirr(account):
     logging.debug('CALCULATING XIRR')
     try:
@@ -23,9 +25,9 @@ def calculate_account_xirr(account):
     transaction_currencies = [f'{currency}{base_currency}' for currency in
                               transactions.values_list('currency', flat=True).distinct() if currency != base_currency]
 
-    stock_balances = AssetBalance.objects.filter(account_id=account.id)
+    stock_balances = list(unit_of_work.get_asset_balances([account])[account.id].values())
     stock_currencies = []
-    stocks = Asset.objects.filter(id__in=stock_balances.values_list('asset_id', flat=True))
+    stocks = unit_of_work.get_assets([stock_balance.asset_id for stock_balance in stock_balances]).values()
 
     for stock in stocks:
         if stock.currency == base_currency:
@@ -73,7 +75,7 @@ def calculate_account_xirr(account):
             balance_amount = float(stock_balance.price) * stock_balance.quantity * currency_difference
             balance_sum += balance_amount
 
-        account_balances = AccountBalance.objects.filter(account_id=account.id)
+        account_balances = unit_of_work.get_account_balances([account])[account.id].values()
         for balance in account_balances:
             currency_pair = f'{balance.currency}{base_currency}'
             currency_difference = currency_pairs[currency_pair]
@@ -91,4 +93,4 @@ def calculate_account_xirr(account):
         except InvalidPaymentsError:
             account.xirr = None
 
-        account.save()
+        unit_of_work.save(account)
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from ams import models
+
+
+class AssetBalanceHistoryDto:
+    def __init__(self, asset_id, date, quantity, price, result):
+        self.asset_id = asset_id
+        self.date = date
+        self.quantity = quantity
+        self.price = price
+        self.result = result
+
+
+def expand_history(history, begin=None, end=None):
+    day = max(history.valid_from, begin) if begin else history.valid_from
+    last_day = min(history.valid_to, end) if end else history.valid_to
+    while day <= last_day:
+        yield AssetBalanceHistoryDto(history.asset_id, day, history.quantity, history.price, history.result)
+        day += timedelta(days=1)
+
+
+def get_history_as_of(account, asset_id, date):
+    return models.AssetBalanceHistory.objects.filter(account=account,
+                                                     asset_id=asset_id,
+                                                     valid_from__lte=date,
+                                                     valid_to__gte=date).first()
+
+
+def get_position_as_of(account, asset_id, date):
+    history = get_history_as_of(account, asset_id, date)
+    if not history:
+        return None
+    return AssetBalanceHistoryDto(asset_id, date, history.quantity, history.price, history.result)
+
+
+def get_series(account, asset_id, begin=None, end=None):
+    histories = models.AssetBalanceHistory.objects.filter(account=account, asset_id=asset_id)
+    if begin:
+        histories = histories.filter(valid_to__gte=begin)
+    if end:
+        histories = histories.filter(valid_from__lte=end)
+
+    dtos = []
+    for history in histories.order_by('valid_from'):
+        dtos.extend(expand_history(history, begin, end))
+    return dtos
+
+
+def cut_history(account, asset_id, rebuild_date):
+    """
+    Removes the history from rebuild_date onwards and returns the interval covering the day before, shortened so
+    that it ends on that day. The returned interval is not saved, callers save it once they are done extending it.
+    """
+    history_date = rebuild_date - timedelta(days=1)
+    history = get_history_as_of(account, asset_id, history_date)
+    models.AssetBalanceHistory.objects.filter(account=account,
+                                              asset_id=asset_id,
+                                              valid_from__gte=rebuild_date).delete()
+    if history:
+        history.valid_to = history_date
+    return history
+
+
+def append_day(history, to_save, account, asset_id, date, quantity, price, result):
+    """
+    Extends history by date when the state did not change, otherwise opens a new interval and adds it to to_save.
+    Returns the interval that covers date.
+    """
+    if history and history.valid_to == date - timedelta(days=1) and history.has_same_state(quantity, price, result):
+        history.valid_to = date
+        return history
+    history = models.AssetBalanceHistory(
+        asset_id=asset_id,
+        account=account,
+        valid_from=date,
+        valid_to=date,
+        quantity=quantity,
+        price=price,
+        result=result,
+    )
+    to_save.append(history)
+    return history
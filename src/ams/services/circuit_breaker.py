@@ -0,0 +1,129 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import time
+
+from django.core.cache import cache
+
+from ams.services import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+FAILURE_THRESHOLD = 5
+FAILURE_WINDOW = 30
+LATENCY_THRESHOLD = 5.0
+OPEN_SECONDS = 30
+PROBE_TIMEOUT = 30
+
+OPENED_AT_KEY = 'eod-circuit:opened-at'
+PROBE_KEY = 'eod-circuit:probe'
+
+# Seconds the last known good value of an interactive response is kept, per endpoint. Price histories are left out,
+# their date ranges make a key per request, searches make a key per typed query so they are kept only briefly.
+STALE_TIMEOUTS = {
+    'real-time': 60 * 60 * 24 * 7,
+    'exchange-details': 60 * 60 * 24 * 7,
+    'news': 60 * 60 * 24,
+    'search': 60 * 60,
+}
+
+STALE_RESPONSES = contextvars.ContextVar('stale_responses', default=None)
+
+
+# a RateLimitException, so the EOD helpers that swallow upstream errors stop batch work while the circuit is open
+class CircuitOpenException(rate_limiter.RateLimitException):
+    pass
+
+
+def get_state(now=None):
+    opened_at = cache.get(OPENED_AT_KEY)
+    if opened_at is None:
+        return CLOSED
+    if (now or time.time()) - opened_at < OPEN_SECONDS:
+        return OPEN
+    return HALF_OPEN
+
+
+def get_stale_key(path, params):
+    query = json.dumps({key: value for key, value in params.items() if key != 'api_token'}, sort_keys=True,
+                       default=str)
+    return 'eod-stale:' + hashlib.md5(f'{path}?{query}'.encode()).hexdigest()
+
+
+def check(stale_key):
+    """
+    Returns (allowed, stale) for a request. While the circuit is open only the last known good value is returned,
+    once it half-opens a single caller is allowed through to probe the upstream.
+    """
+    state = get_state()
+    if state == CLOSED:
+        return True, None
+    stale = cache.get(stale_key)
+    if state == HALF_OPEN and cache.add(PROBE_KEY, 1, PROBE_TIMEOUT):
+        return True, stale
+    return False, stale
+
+
+def get_stale(stale_key):
+    return cache.get(stale_key)
+
+
+def trip(now=None):
+    cache.set(OPENED_AT_KEY, now or time.time(), None)
+    cache.delete(PROBE_KEY)
+
+
+def record_failure(now=None):
+    now = now or time.time()
+    if cache.get(OPENED_AT_KEY) is not None:
+        logger.warning('EOD probe failed, circuit stays open')
+        trip(now)
+        return
+
+    key = f'eod-circuit:failures:{int(now // FAILURE_WINDOW)}'
+    cache.add(key, 0, 2 * FAILURE_WINDOW)
+    try:
+        failures = cache.incr(key)
+    except ValueError:
+        failures = 1
+    if failures >= FAILURE_THRESHOLD:
+        logger.warning(f'EOD circuit opened after {failures} failures')
+        trip(now)
+
+
+def record_success(path, stale_key, data, latency):
+    if latency > LATENCY_THRESHOLD:
+        record_failure()
+    elif cache.get(OPENED_AT_KEY) is not None:
+        logger.info('EOD circuit closed')
+        cache.delete_many([OPENED_AT_KEY, PROBE_KEY])
+
+    # batch work never reads the last known good value, so it does not store one either
+    endpoint = rate_limiter.get_endpoint(path)
+    if endpoint in STALE_TIMEOUTS and rate_limiter.PRIORITY.get() == rate_limiter.INTERACTIVE:
+        cache.set(stale_key, {'data': data, 'time': time.time()}, STALE_TIMEOUTS[endpoint])
+
+
+@contextlib.contextmanager
+def track_stale():
+    """
+    Collects the paths served from the last known good value while the block runs.
+    """
+    stale = []
+    token = STALE_RESPONSES.set(stale)
+    try:
+        yield stale
+    finally:
+        STALE_RESPONSES.reset(token)
+
+
+def mark_stale(path):
+    stale = STALE_RESPONSES.get()
+    if stale is not None:
+        stale.append(path)
@@ -0,0 +1,57 @@
+import logging
+
+from django.db import connection
+
+from ams import models
+from main.settings import BULK_DELETE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Tables referencing Account directly, children before parents. Account histories are handled separately
+# because their balances have to go first.
+ACCOUNT_DEPENDENT_MODELS = [
+    models.DirtyBalance,
+    models.AssetBalanceHistory,
+    models.AssetBalance,
+    models.AssetTransaction,
+    models.AccountBalance,
+    models.AccountTransaction,
+    models.AccountPreferences,
+]
+
+
+def delete_in_batches(queryset, batch_size=BULK_DELETE_BATCH_SIZE):
+    """
+    Deletes rows matched by queryset with plain DELETE statements of at most batch_size rows each. Unlike
+    QuerySet.delete() it never loads the rows or runs the cascade collector, so dependent rows must already be gone.
+    """
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    pk_column = connection.ops.quote_name(queryset.model._meta.pk.column)
+    subquery, params = queryset.values('pk')[:batch_size].query.sql_with_params()
+
+    deleted = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {pk_column} IN ({subquery})', params)
+            deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    return deleted
+
+
+def delete_account_histories(account_id, from_date=None):
+    account_histories = models.AccountHistory.objects.filter(account_id=account_id)
+    if from_date:
+        account_histories = account_histories.filter(date__gte=from_date)
+
+    delete_in_batches(models.AccountHistoryBalance.objects.filter(account_history__in=account_histories))
+    return delete_in_batches(account_histories)
+
+
+def delete_account(account_id):
+    delete_account_histories(account_id)
+    for model in ACCOUNT_DEPENDENT_MODELS:
+        deleted = delete_in_batches(model.objects.filter(account_id=account_id))
+        logger.debug(f'Deleted {deleted} {model.__name__} rows of account {account_id}')
+    delete_in_batches(models.Account.all_objects.filter(id=account_id))
+    logger.info(f'Account {account_id} deleted')
@@ -0,0 +1,48 @@
+import logging
+
+from django.db.models import Value
+from django.db.models.functions import Least
+
+from ams import models
+from main.settings import LAZY_REBUILD
+
+logger = logging.getLogger(__name__)
+
+
+def mark_dirty(account_id, asset_id, dirty_from):
+    """
+    Records that balances of the account, or of one of its assets, must be rebuilt from dirty_from, keeping the
+    earliest date when they are already dirty.
+    """
+    dirty = models.DirtyBalance.objects.filter(account_id=account_id, asset_id=asset_id)
+    if dirty.update(dirty_from=Least('dirty_from', Value(dirty_from))):
+        return
+    _, created = models.DirtyBalance.objects.get_or_create(account_id=account_id, asset_id=asset_id,
+                                                           defaults={'dirty_from': dirty_from})
+    if not created:
+        # a concurrent write marked it first
+        dirty.update(dirty_from=Least('dirty_from', Value(dirty_from)))
+
+
+def defer_rebuild(account_id, asset_id, dirty_from):
+    """
+    In lazy rebuild mode marks the balances dirty and returns True, the caller then skips its rebuild.
+    """
+    if not LAZY_REBUILD:
+        return False
+    mark_dirty(account_id, asset_id, dirty_from)
+    return True
+
+
+def defer_price(account_id, asset_id):
+    """
+    In lazy rebuild mode returns True when the asset balance is already dirty, its pending rebuild replays the price.
+    Prices of clean balances keep the incremental update, so a close does not leave every holding dirty.
+    """
+    if not LAZY_REBUILD:
+        return False
+    return models.DirtyBalance.objects.filter(account_id=account_id, asset_id=asset_id).exists()
+
+
+def get_dirty_account_ids(accounts):
+    return set(models.DirtyBalance.objects.filter(account__in=accounts).values_list('account_id', flat=True))
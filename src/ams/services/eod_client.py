@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from datetime import timedelta
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from ams.services import circuit_breaker, rate_limiter, metrics, tracing
+from main.settings import EOD_TOKEN, EOD_API_URL, EOD_MAX_CONCURRENCY, EOD_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+HOLIDAY_LOOKBACK_DAYS = 14
+
+_sessions = weakref.WeakKeyDictionary()
+_background_loop = None
+_background_loop_pid = None
+_background_loop_lock = threading.Lock()
+_revalidations = set()
+
+
+def _get_session():
+    """
+    Returns the http client and concurrency limit shared by every request made on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None:
+        client = httpx.AsyncClient(
+            base_url=EOD_API_URL,
+            limits=httpx.Limits(max_connections=EOD_MAX_CONCURRENCY, max_keepalive_connections=EOD_MAX_CONCURRENCY)
+        )
+        session = (client, asyncio.Semaphore(EOD_MAX_CONCURRENCY))
+        _sessions[loop] = session
+    return session
+
+
+async def fetch(path, params, timeout, stale_key):
+    client, semaphore = _get_session()
+    for _ in range(EOD_MAX_RETRIES):
+        await rate_limiter.acquire_async(path, params)
+        try:
+            async with semaphore:
+                start = time.monotonic()
+                response = await client.get(path, params=params, timeout=timeout)
+                latency = time.monotonic() - start
+        except httpx.TransportError:
+            metrics.observe_eod_request(path, 'error', time.monotonic() - start)
+            await sync_to_async(circuit_breaker.record_failure, thread_sensitive=False)()
+            raise
+        metrics.observe_eod_request(path, str(response.status_code), latency)
+        if response.status_code == 429:
+            logger.warning(f'EOD rate limit hit on {path}')
+            await sync_to_async(rate_limiter.penalize, thread_sensitive=False)()
+            continue
+        if response.status_code >= 500:
+            await sync_to_async(circuit_breaker.record_failure, thread_sensitive=False)()
+        response.raise_for_status()
+
+        data = response.json()
+        await sync_to_async(circuit_breaker.record_success, thread_sensitive=False)(path, stale_key, data, latency)
+        return data
+    raise rate_limiter.TooManyRequestsException(path)
+
+
+async def revalidate(path, params, timeout, stale_key):
+    try:
+        await fetch(path, params, timeout, stale_key)
+    except Exception as e:
+        logger.warning(f'EOD revalidation of {path} failed: {e}')
+
+
+async def get_with_staleness(path, params=None, timeout=10.0):
+    """
+    Returns (data, stale). While the circuit is open interactive reads get the last known good response instead of
+    waiting for the upstream, the half-open probe refreshes it in the background. Batch work never gets stale data.
+    """
+    params = {'api_token': EOD_TOKEN, 'fmt': 'json', **(params or {})}
+    stale_key = circuit_breaker.get_stale_key(path, params)
+    allow_stale = rate_limiter.PRIORITY.get() == rate_limiter.INTERACTIVE
+    allowed, stale = await sync_to_async(circuit_breaker.check, thread_sensitive=False)(stale_key)
+
+    if not allowed:
+        if stale is not None and allow_stale:
+            return stale['data'], True
+        raise circuit_breaker.CircuitOpenException(path)
+    if stale is not None and allow_stale:
+        task = asyncio.ensure_future(revalidate(path, params, timeout, stale_key))
+        _revalidations.add(task)
+        task.add_done_callback(_revalidations.discard)
+        return stale['data'], True
+
+    try:
+        return await fetch(path, params, timeout, stale_key), False
+    except (httpx.TransportError, httpx.HTTPStatusError) as e:
+        stale = await sync_to_async(circuit_breaker.get_stale, thread_sensitive=False)(stale_key)
+        if stale is None or not allow_stale or \
+                (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500):
+            raise
+        logger.warning(f'Serving stale EOD response for {path}: {e}')
+        return stale['data'], True
+
+
+async def get(path, params=None, timeout=10.0):
+    data, stale = await get_with_staleness(path, params, timeout)
+    if stale:
+        circuit_breaker.mark_stale(path)
+        metrics.observe_eod_stale(path)
+    return data
+
+
+async def get_current_price(stock, exchange):
+    try:
+        data = await get(f'/real-time/{stock}.{exchange}')
+        if data['previousClose'] == 'NA':
+            logger.warning('No data for stock: ' + stock + '.' + exchange)
+            return None
+        return data
+    except rate_limiter.RateLimitException:
+        raise
+    except Exception as e:
+        logger.exception(e)
+        return None
+
+
+async def get_price_changes(stock, exchange, begin, end, period='d'):
+    params = {'period': period}
+    if begin:
+        params['from'] = begin.strftime('%Y-%m-%d')
+    if end:
+        params['to'] = end.strftime('%Y-%m-%d')
+
+    try:
+        return await get(f'/eod/{stock}.{exchange}', params)
+    except rate_limiter.RateLimitException:
+        raise
+    except Exception as e:
+        logger.exception(e)
+        return []
+
+
+async def get_price_changes_from_session(stock, exchange, begin, end):
+    """
+    Async counterpart of eod_service.get_price_changes, prices start with the last session on or before begin.
+    """
+    data = await get_price_changes(stock, exchange, begin, end)
+    if len(data) == 0 or data[0]['date'] != begin.strftime('%Y-%m-%d'):
+        data = await get_price_changes(stock, exchange, begin - timedelta(days=HOLIDAY_LOOKBACK_DAYS), end)
+        begin_date = begin.strftime('%Y-%m-%d')
+        first_index = 0
+        for i, price_change in enumerate(data):
+            if price_change['date'] <= begin_date:
+                first_index = i
+        data = data[first_index:]
+    return data
+
+
+async def search(query):
+    return await get(f'/search/{query}', timeout=30.0)
+
+
+async def get_stock_news(stock):
+    try:
+        return await get('/news', {'limit': 50, 's': stock})
+    except Exception as e:
+        logger.exception(e)
+        return []
+
+
+async def gather_by_key(coroutines_by_key):
+    keys = list(coroutines_by_key.keys())
+    results = await asyncio.gather(*coroutines_by_key.values(), return_exceptions=True)
+    result_by_key = dict()
+    for key, result in zip(keys, results):
+        if isinstance(result, rate_limiter.RateLimitException):
+            raise result
+        if isinstance(result, Exception):
+            logger.exception(result)
+            result = None
+        result_by_key[key] = result
+    return result_by_key
+
+
+async def get_current_prices(symbols):
+    return await gather_by_key({(stock, exchange): get_current_price(stock, exchange) for stock, exchange in symbols})
+
+
+async def search_many(queries):
+    return await gather_by_key({query: search(query) for query in queries})
+
+
+async def get_price_changes_many(ranges):
+    """
+    Fetches prices for many (stock, exchange, begin, end) ranges at once, keyed by (stock, exchange).
+    """
+    return await gather_by_key({(stock, exchange): get_price_changes_from_session(stock, exchange, begin, end)
+                                for stock, exchange, begin, end in ranges})
+
+
+def _get_background_loop():
+    global _background_loop, _background_loop_pid
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop_pid != os.getpid():
+            _background_loop = asyncio.new_event_loop()
+            _background_loop_pid = os.getpid()
+            threading.Thread(target=_background_loop.run_forever, name='eod-client', daemon=True).start()
+    return _background_loop
+
+
+def run(coroutine):
+    """
+    Runs coroutine on the shared background event loop and waits for the result. Lets sync code (views, celery
+    tasks) fan out requests without creating threads or event loops per call.
+    """
+    with tracing.span(f'eod.{coroutine.__name__}'):
+        return asyncio.run_coroutine_threadsafe(coroutine, _get_background_loop()).result()
+
+
+def run_all(*coroutines):
+    async def gather():
+        return await asyncio.gather(*coroutines)
+
+    return run(gather())
@@ -1,31 +1,30 @@
-import concurrent
 import logging
-from datetime import datetime, timedelta
-
-import pandas as pd
-import requests
-from dateutil.relativedelta import relativedelta
+import time
+from datetime import datetime
 
 from ams import models
-from main.settings import EOD_TOKEN, EOD_API_URL
+from ams.services import eod_client, rate_limiter, trading_calendar_service
 
 logger = logging.getLogger(__name__)
 
 
-def get_current_price(stock, exchange):
-    params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json'
-    }
-    url = f'{EOD_API_URL}/real-time/{stock}.{exchange}'
+def get(path, params=None, timeout=10.0):
+    """
+    Sends a request through eod_client, so sync callers share its rate limiter and circuit breaker. Raises
+    RateLimitException when the budget is exhausted, so batch jobs stop instead of saving balances without prices.
+    """
+    return eod_client.run(eod_client.get(path, params, timeout))
 
+
+def get_current_price(stock, exchange):
     try:
-        response = requests.get(url, timeout=10.0, params=params)
-        data = response.json()
+        data = get(f'/real-time/{stock}.{exchange}')
         if data['previousClose'] == 'NA':
             logger.warning('No data for stock: ' + stock + '.' + exchange)
             return None
         return data
+    except rate_limiter.RateLimitException:
+        raise
     except Exception as e:
         logger.exception(e)
         return None
@@ -33,64 +32,55 @@ def get_current_price(stock, exchange):
 
 def get_bulk_last_day_price(stocks, exchange, date):
     params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json',
         'date': date.strftime('%Y-%m-%d'),
         'symbols': ','.join([f"{stock.ticker}.{exchange.code}" for stock in stocks])
     }
-    url = f'{EOD_API_URL}/eod-bulk-last-day/{exchange.code}'
     try:
-        response = requests.get(url, timeout=10.0, params=params)
-        data = response.json()
-        while len(data) == 0:
-            date -= timedelta(days=1)
-            params['date'] = date.strftime('%Y-%m-%d')
-            response = requests.get(url, timeout=10.0, params=params)
-            data = response.json()
+        data = get(f'/eod-bulk-last-day/{exchange.code}', params)
+        if len(data) == 0:
+            logger.warning(f'No prices for exchange {exchange.code} on {params["date"]}')
         return {d['code']: d['adjusted_close'] for d in data}
+    except rate_limiter.RateLimitException:
+        raise
     except Exception as e:
         logger.exception(e)
         return {}
 
 
 def search(query):
-    params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json'
-    }
-    url = f'{EOD_API_URL}/search/{query}'
-    response = requests.get(url, timeout=30.0, params=params)
-    data = response.json()
-    return data
+    return get(f'/search/{query}', timeout=30.0)
 
 
 CURRENCY_PRICE_CACHE = dict()
 
 
+def is_currency_price_cached(currency_pair):
+    return currency_pair in CURRENCY_PRICE_CACHE and time.time() < CURRENCY_PRICE_CACHE[currency_pair]['expires']
+
+
+def cache_currency_price(currency_pair, price):
+    timeout = trading_calendar_service.get_symbol_cache_timeout(currency_pair + '.FOREX')
+    CURRENCY_PRICE_CACHE[currency_pair] = {'close': price, 'expires': time.time() + timeout}
+
+
 def get_current_currency_price(currency_pair):
     global CURRENCY_PRICE_CACHE
-    now = datetime.now().date()
-    if currency_pair in CURRENCY_PRICE_CACHE and now == CURRENCY_PRICE_CACHE[currency_pair]['time']:
+    if is_currency_price_cached(currency_pair):
         return {currency_pair: CURRENCY_PRICE_CACHE[currency_pair]['close']}
 
-    params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json'
-    }
-    url = f'{EOD_API_URL}/real-time/{currency_pair}.FOREX'
-
     try:
-        response = requests.get(url, timeout=30.0, params=params)
-        data = response.json()
+        data = get(f'/real-time/{currency_pair}.FOREX', timeout=30.0)
         if data['close'] == 'NA':
             logger.exception('No data for currencies pair')
             return None
         else:
             current_price = data['close']
-            CURRENCY_PRICE_CACHE[currency_pair] = {'close': current_price, 'time': now}
+            cache_currency_price(currency_pair, current_price)
 
         return {currency_pair: current_price}
 
+    except rate_limiter.RateLimitException:
+        raise
     except Exception as e:
         logger.exception(e)
         return None
@@ -99,10 +89,9 @@ def get_current_currency_price(currency_pair):
 def get_current_currency_prices(pairs):
     global CURRENCY_PRICE_CACHE
     result = dict()
-    now = datetime.now().date()
     pairs_copy = pairs.copy()
     for pair in pairs_copy:
-        if pair in CURRENCY_PRICE_CACHE and now == CURRENCY_PRICE_CACHE[pair]['time']:
+        if is_currency_price_cached(pair):
             result[pair] = CURRENCY_PRICE_CACHE[pair]['close']
             pairs.remove(pair)
     if len(pairs) == 1:
@@ -112,85 +101,55 @@ def get_current_currency_prices(pairs):
         return result
 
     params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json',
         's': ".FOREX,".join(pairs[1:]) + ".FOREX"
     }
-    url = f'{EOD_API_URL}/real-time/{pairs[0]}.FOREX'
 
     try:
-        response = requests.get(url, timeout=30.0, params=params)
-        data = response.json()
+        data = get(f'/real-time/{pairs[0]}.FOREX', params, timeout=30.0)
         for item in data:
             if item['close'] == 'NA':
                 logging.exception('No data for currencies pair')
                 return None
             else:
                 current_price = item['close']
-                CURRENCY_PRICE_CACHE[item['code'].split(".")[0]] = {'close': current_price, 'time': now}
+                cache_currency_price(item['code'].split(".")[0], current_price)
 
             result[item['code'].split(".")[0]] = current_price
         return result
 
+    except rate_limiter.RateLimitException:
+        raise
     except Exception as e:
         logger.exception(e)
         return None
 
 
 def get_price_changes(stock, begin, end):
-    params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json',
-        'from': begin.strftime('%Y-%m-%d'),
-        'to': end.strftime('%Y-%m-%d')
-
-    }
-    url = f'{EOD_API_URL}/eod/{stock.ticker}.{stock.exchange.code}'
-
-    try:
-        response = requests.get(url, timeout=10.0, params=params)
-        data = response.json()
-        while len(data) == 0 or data[0]['date'] != begin.strftime('%Y-%m-%d'):
-            begin -= timedelta(days=1)
-            params['from'] = begin.strftime('%Y-%m-%d')
-            response = requests.get(url, timeout=10.0, params=params)
-            data = response.json()
-        return data
-    except Exception as e:
-        logger.exception(e)
-        return []
+    """
+    Returns daily prices from begin to end, starting with the last session on or before begin. Callers are expected
+    to pass a trading day as begin, an unknown holiday costs a single extra request.
+    """
+    return eod_client.run(eod_client.get_price_changes_from_session(stock.ticker, stock.exchange.code, begin, end))
 
 
-def get_price_changes_2(stock, exchange, begin, end, period):
-    params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json',
-        'period': period
-    }
-    if begin:
-        params['from'] = begin.strftime('%Y-%m-%d')
-    if end:
-        params['to'] = end.strftime('%Y-%m-%d')
+def search_many(queries):
+    return eod_client.run(eod_client.search_many(queries))
 
-    url = f'{EOD_API_URL}/eod/{stock}.{exchange}'
 
-    try:
-        response = requests.get(url, timeout=10.0, params=params)
-        data = response.json()
-        return data
-    except Exception as e:
-        logger.exception(e)
-        return []
+def get_price_changes_many(ranges):
+    return eod_client.run(eod_client.get_price_changes_many(ranges))
 
 
 def get_stock_details(stock, exchange, period, from_date, to_date):
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        price_changes_future = executor.submit(get_price_changes_2, stock, exchange, from_date, to_date, period)
-        current_price_future = executor.submit(get_current_price, stock, exchange)
-
-    price_changes = price_changes_future.result()
-    current_info = current_price_future.result()
+    price_changes, current_info = eod_client.run_all(
+        eod_client.get_price_changes(stock, exchange, from_date, to_date, period),
+        eod_client.get_current_price(stock, exchange)
+    )
     exchange_info = models.Exchange.objects.filter(code=exchange).first()
+    return build_stock_details(price_changes, current_info, exchange_info)
+
+
+def build_stock_details(price_changes, current_info, exchange_info):
     percentage_change = ((current_info['close'] - current_info['previousClose']) / current_info['previousClose']) * 100
     stock_details = {
         'price_changes': price_changes,
@@ -203,80 +162,41 @@ def get_stock_details(stock, exchange, period, from_date, to_date):
     return stock_details
 
 
-def get_stock_history(stock, exchange, from_date, to_date):
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        price_changes_future = executor.submit(get_price_changes_2, stock, exchange, from_date, to_date, 'd')
-        current_price_future = executor.submit(get_current_price, stock, exchange)
-
-    eod_data = price_changes_future.result()
-    current_info = current_price_future.result()
-
-    df = pd.DataFrame(eod_data)
-    df["date"] = pd.to_datetime(df["date"])
-    oldest_date = df["date"].min()
-    newest_date = df["date"].max()
-    date_range = pd.date_range(start=oldest_date, end=newest_date)
-    merged_df = pd.merge(df, pd.DataFrame(date_range, columns=["date"]), on="date", how="right")
-    merged_df = merged_df.sort_values(by="date")
-
-    merged_df["close"].fillna(method='ffill', inplace=True)
-    merged_df["adjusted_close"].fillna(method='ffill', inplace=True)
-    merged_df["high"].fillna(method='ffill', inplace=True)
-    current_date = datetime.now()
-
-    current_price = current_info['close']
-    time_deltas = [
-        relativedelta(days=7),
-        relativedelta(months=1),
-        relativedelta(months=3),
-        relativedelta(months=6),
-        relativedelta(years=1),
-        relativedelta(years=3),
-        relativedelta(years=5),
-    ]
-
-    percentage_changes = {}
-
-    for delta in time_deltas:
-        start_date = current_date - delta
-        on_day = merged_df[merged_df['date'] == start_date.strftime('%Y-%m-%d')]
-        start_price = on_day.iloc[0]['adjusted_close']
-        percentage_change = round(((current_price - start_price) / start_price) * 100, 2)
-        percentage_changes[delta] = percentage_change
-
-    all_time = merged_df.iloc[0]['adjusted_close']
-    all_time = round(((current_price - all_time) / all_time) * 100, 2)
-
-    yesterday = current_info['previousClose']
-    today = round((current_info['close'] - yesterday) / yesterday * 100, 2)
-
-    stock_history = {
-        'today': today,
-        'week': percentage_changes[time_deltas[0]],
-        'month': percentage_changes[time_deltas[1]],
-        'three_months': percentage_changes[time_deltas[2]],
-        'six_months': percentage_changes[time_deltas[3]],
-        'year': percentage_changes[time_deltas[4]],
-        'three_years': percentage_changes[time_deltas[5]],
-        'five_years': percentage_changes[time_deltas[6]],
-        'all_time': all_time
+def get_exchange_details(exchange_code, begin, end):
+    params = {
+        'from': begin.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d')
     }
 
-    return stock_history
+    try:
+        return get(f'/exchange-details/{exchange_code}', params)
+    except rate_limiter.RateLimitException:
+        raise
+    except Exception as e:
+        logger.exception(e)
+        return {}
+
+
+def get_exchange_symbols(exchange_code):
+    try:
+        return get(f'/exchange-symbol-list/{exchange_code}', timeout=60.0)
+    except rate_limiter.RateLimitException:
+        raise
+    except Exception as e:
+        logger.exception(e)
+        return []
 
 
 def get_stock_news(stock):
-    params = {
-        'api_token': EOD_TOKEN,
-        'fmt': 'json',
-        'limit': 50,
-        's': stock
-    }
-    url = f'{EOD_API_URL}/news'
+    try:
+        return build_stock_news(get('/news', {'limit': 50, 's': stock}))
+    except Exception as e:
+        logger.exception(e)
+        return []
+
 
+def build_stock_news(data):
     try:
-        response = requests.get(url, timeout=10.0, params=params)
-        data = response.json()
         news_list = []
         for item in data:
             utc_time = datetime.fromisoformat(item['date']).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 
 from ams import models
+from ams.services import asset_history_service
 
 
 def save_account_history():
@@ -29,16 +30,25 @@ def save_stock_balance_history():
     date = datetime.now().date()
     history_date = date - timedelta(days=1)
 
-    stock_balances = models.AssetBalance.objects.all()
+    stock_balances = list(models.AssetBalance.objects.filter(account__deleted_at__isnull=True).select_related('account'))
+    latest_histories = models.AssetBalanceHistory.objects.filter(valid_from__lte=history_date,
+                                                                 valid_to__gte=history_date - timedelta(days=1))
+    latest_history_by_key = {(history.account_id, history.asset_id): history for history in
+                             latest_histories.order_by('valid_from')}
 
+    to_save = []
+    to_update = []
     for stock_balance in stock_balances:
-        models.AssetBalanceHistory.objects.create(
-            asset_id=stock_balance.asset_id,
-            account=stock_balance.account,
-            date=history_date,
-            quantity=stock_balance.quantity,
-            price=stock_balance.price,
-            result=stock_balance.result,
-        )
+        latest_history = latest_history_by_key.get((stock_balance.account_id, stock_balance.asset_id))
+        if latest_history and latest_history.valid_to >= history_date:
+            continue
+        history = asset_history_service.append_day(latest_history, to_save, stock_balance.account,
+                                                   stock_balance.asset_id, history_date, stock_balance.quantity,
+                                                   stock_balance.price, stock_balance.result)
+        if history is latest_history:
+            to_update.append(history)
         stock_balance.last_save_date = history_date
-        stock_balance.save()
+
+    models.AssetBalanceHistory.objects.bulk_update(to_update, ['valid_to'])
+    models.AssetBalanceHistory.objects.bulk_create(to_save)
+    models.AssetBalance.objects.bulk_update(stock_balances, ['last_save_date'])
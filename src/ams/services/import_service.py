@@ -7,7 +7,8 @@ from django.db import transaction
 from pandas.core.dtypes.common import is_integer_dtype, is_numeric_dtype
 
 from ams import models
-from ams.services import eod_service, stock_balance_service, account_balance_service, account_xirr_service
+from ams.services import eod_service, stock_balance_service, account_balance_service, account_xirr_service, \
+    symbol_universe_service
 from ams.services.stock_balance_service import NotEnoughStockException
 
 
@@ -41,16 +42,25 @@ class ImportStockTransactionsStrategy(ABC):
 
     def find_stocks(self, stocks):
         result = dict()
+        missing_stocks = []
         for stock in stocks:
             search = self.find_stock(stock)
             if search:
                 result[stock] = (search.ticker, search.exchange.code)
+                continue
+            symbol = models.ExchangeSymbol.objects.filter(isin=stock).select_related('exchange').first()
+            if symbol:
+                result[stock] = (symbol.code, symbol.exchange.code)
             else:
-                search = eod_service.search(stock)
-                if len(search) > 0:
-                    result[stock] = (search[0]['Code'], search[0]['Exchange'])
-                else:
-                    raise UnknownAssetException("Unknown asset: " + stock)
+                missing_stocks.append(stock)
+
+        search_results = eod_service.search_many(missing_stocks) if missing_stocks else {}
+        for stock in missing_stocks:
+            search = search_results[stock]
+            if search and len(search) > 0:
+                result[stock] = (search[0]['Code'], search[0]['Exchange'])
+            else:
+                raise UnknownAssetException("Unknown asset: " + stock)
         return result
 
     @abstractmethod
@@ -283,6 +293,57 @@ def get_strategy(broker, file):
     return None
 
 
+def find_assets(stock_transactions_list):
+    keys = [(stock_transactions.iloc[0]["ticker"], stock_transactions.iloc[0]["exchange"])
+            for stock_transactions in stock_transactions_list]
+
+    exchanges = dict()
+    stocks = dict()
+    for ticker, exchange_code in keys:
+        if exchange_code not in exchanges:
+            try:
+                exchanges[exchange_code] = models.Exchange.objects.get(code=exchange_code)
+            except models.Exchange.DoesNotExist:
+                raise Exception('Exchange does not exist.')
+        stock = symbol_universe_service.get_or_create_asset(ticker, exchanges[exchange_code])
+        if stock:
+            stocks[(ticker, exchange_code)] = stock
+
+    missing_keys = [key for key in keys if key not in stocks]
+    search_results = eod_service.search_many([f'{ticker}.{exchange_code}' for ticker, exchange_code in missing_keys])
+    for ticker, exchange_code in missing_keys:
+        search_result = search_results[f'{ticker}.{exchange_code}']
+        if not search_result:
+            raise Exception('Stock does not exist.')
+        stock_from_api = search_result[0]
+        stocks[(ticker, exchange_code)] = models.Asset.objects.create(
+            isin=stock_from_api['ISIN'],
+            ticker=ticker,
+            name=stock_from_api['Name'],
+            currency=stock_from_api['Currency'],
+            exchange=exchanges[exchange_code],
+            type="STOCK"
+        )
+    return [stocks[key] for key in keys]
+
+
+def prefetch_missing_price_changes(stock_transactions_list, stocks, account):
+    """
+    Fetches price history of every asset new to the account in one concurrent batch, keyed by (ticker, exchange code).
+    """
+    held_asset_ids = set(models.AssetBalance.objects.filter(account=account, asset_id__in=[stock.id for stock in stocks])
+                         .values_list('asset_id', flat=True))
+    ranges = []
+    for stock_transactions, stock in zip(stock_transactions_list, stocks):
+        if stock.id in held_asset_ids:
+            continue
+        begin, end = stock_balance_service.get_missing_price_range(None, stock, stock_transactions["date"].min().date())
+        ranges.append((stock.ticker, stock.exchange.code, begin, end))
+    if not ranges:
+        return {}
+    return eod_service.get_price_changes_many(ranges)
+
+
 def import_csv(file, account):
     names = ["ticker", "exchange", "date", "type", "quantity", "price", "pay_currency", "exchange_rate", "commission"]
     transactions = pd.read_csv(file, names=names)
@@ -307,29 +368,11 @@ def import_csv(file, account):
         current = transactions[transactions['ticker_exchange'] == ticker]
         stock_transactions_list.append(current)
 
+    stocks = find_assets(stock_transactions_list)
+    price_changes_by_stock = prefetch_missing_price_changes(stock_transactions_list, stocks, account)
+
     account_rebuild_date = None
-    for stock_transactions in stock_transactions_list:
-        try:
-            exchange = models.Exchange.objects.get(code=stock_transactions.iloc[0]["exchange"])
-        except models.Exchange.DoesNotExist:
-            raise Exception('Exchange does not exist.')
-        try:
-            stock = models.Asset.objects.get(ticker=stock_transactions.iloc[0]["ticker"],
-                                             exchange=exchange)
-        except models.Asset.DoesNotExist:
-            search_result = eod_service.search(
-                stock_transactions.iloc[0]["ticker"] + '.' + stock_transactions.iloc[0]["exchange"])
-            if len(search_result) == 0:
-                raise Exception('Stock does not exist.')
-            stock_from_api = search_result[0]
-            stock = models.Asset.objects.create(
-                isin=stock_from_api['ISIN'],
-                ticker=stock_transactions.iloc[0]["ticker"],
-                name=stock_from_api['Name'],
-                currency=stock_from_api['Currency'],
-                exchange=exchange,
-                type="STOCK"
-            )
+    for stock_transactions, stock in zip(stock_transactions_list, stocks):
         try:
             with transaction.atomic():
                 stock_transactions_to_save = []
@@ -372,7 +415,10 @@ def import_csv(file, account):
                 first_date = stock_transactions["date"].min()
                 account_rebuild_date = min(account_rebuild_date, first_date.date()) if account_rebuild_date else first_date.date()
                 if created:
-                    stock_balance_service.fetch_missing_price_changes(stock_balance, stock, first_date.date())
+                    stock_balance_service.fetch_missing_price_changes(
+                        stock_balance, stock, first_date.date(),
+                        price_changes_by_stock.get((stock.ticker, stock.exchange.code))
+                    )
                 else:
                     if not stock_balance.first_event_date or stock_balance.first_event_date >= first_date.date():
                         stock_balance_service.fetch_missing_price_changes(stock_balance, stock, first_date.date())
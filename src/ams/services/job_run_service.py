@@ -0,0 +1,152 @@
+import json
+import logging
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db.models import Count
+
+from ams import models
+from ams.services import tracing, deletion_service
+
+logger = logging.getLogger(__name__)
+
+QUEUED_AT_HEADER = 'queued_at'
+ARGUMENTS_LENGTH = 255
+ERROR_LENGTH = 2000
+# A run still marked running after this long is assumed to have died with its worker
+OVERLAP_WINDOW = timedelta(days=1)
+RETENTION = timedelta(days=90)
+
+# task id -> (run, trace, trace token) of the runs in progress in this worker process
+_active_runs = dict()
+
+STATES = {
+    'SUCCESS': models.JobRun.SUCCESS,
+    'FAILURE': models.JobRun.FAILURE,
+    'RETRY': models.JobRun.RETRY,
+}
+
+
+def get_arguments(args, kwargs):
+    return json.dumps([list(args or []), kwargs or {}], default=str)[:ARGUMENTS_LENGTH]
+
+
+def get_queue_wait(queued_at, eta, now):
+    """
+    Returns seconds between the moment the task could first run, its publish time or its eta, and now.
+    """
+    ready_at = [timestamp for timestamp in [queued_at, datetime.fromisoformat(eta).timestamp() if eta else None]
+                if timestamp is not None]
+    return max(now - max(ready_at), 0.0) if ready_at else None
+
+
+def start_run(task_id, task_name, args, kwargs, queued_at=None, eta=None):
+    now = time.time()
+    started_at = datetime.fromtimestamp(now)
+    arguments = get_arguments(args, kwargs)
+    overlapped = models.JobRun.objects.filter(task_name=task_name, arguments=arguments, status=models.JobRun.RUNNING,
+                                              started_at__gte=started_at - OVERLAP_WINDOW).exists()
+    if overlapped:
+        logger.warning(f'{task_name} started while an earlier run is still in progress')
+
+    run = models.JobRun.objects.create(
+        task_name=task_name,
+        task_id=task_id,
+        arguments=arguments,
+        queued_at=datetime.fromtimestamp(queued_at) if queued_at else None,
+        started_at=started_at,
+        queue_wait=get_queue_wait(queued_at, eta, now),
+        overlapped=overlapped,
+    )
+    trace = tracing.Trace(task_name)
+    _active_runs[task_id] = (run, trace, tracing.TRACE.set(trace))
+
+
+def finish_run(task_id, state, retval=None):
+    if task_id not in _active_runs:
+        return
+    run, trace, token = _active_runs.pop(task_id)
+    trace.finish()
+    tracing.TRACE.reset(token)
+
+    run.status = STATES.get(state, models.JobRun.FAILURE)
+    run.finished_at = datetime.now()
+    run.duration = trace.duration
+    run.queries = trace.queries
+    run.rows_written = trace.rows
+    run.upstream_calls = trace.upstream_calls
+    if run.status != models.JobRun.SUCCESS:
+        run.error = repr(retval)[:ERROR_LENGTH]
+    run.save()
+    logger.info(f'{run.task_name} {run.status} in {run.duration:.1f}s, {run.queries} queries, '
+                f'{run.rows_written} rows written, {run.upstream_calls} EOD calls')
+
+
+def get_latest_runs():
+    """
+    Returns the last finished run of every task.
+    """
+    return list(models.JobRun.objects.exclude(status=models.JobRun.RUNNING)
+                .order_by('task_name', '-started_at').distinct('task_name'))
+
+
+def get_run_counts(since):
+    return list(models.JobRun.objects.filter(started_at__gte=since).values('task_name', 'status')
+                .annotate(count=Count('id')))
+
+
+def get_cadence(runs):
+    """
+    Returns the median time between starts of runs with the same arguments, the interval the task is scheduled at.
+    """
+    starts = defaultdict(list)
+    for run in runs:
+        starts[run.arguments].append(run.started_at)
+    gaps = [(later - earlier).total_seconds() for dates in starts.values() for earlier, later in zip(dates, dates[1:])]
+    return statistics.median(gaps) if gaps else None
+
+
+def summarize(runs):
+    finished = [run for run in runs if run.duration is not None]
+    waits = [run.queue_wait for run in runs if run.queue_wait is not None]
+    return {
+        'runs': len(runs),
+        'failures': sum(1 for run in runs if run.status == models.JobRun.FAILURE),
+        'overlaps': sum(1 for run in runs if run.overlapped),
+        'mean_duration': statistics.mean(run.duration for run in finished) if finished else None,
+        'max_duration': max((run.duration for run in finished), default=None),
+        'mean_queue_wait': statistics.mean(waits) if waits else None,
+        'rows_written': sum(run.rows_written for run in runs),
+        'upstream_calls': sum(run.upstream_calls for run in runs),
+    }
+
+
+def get_trends(days=14, now=None):
+    """
+    Returns per task totals and daily summaries of the last days. schedule_usage is the longest run as a share of
+    the interval between runs, a task nearing 1 is about to run into its next schedule.
+    """
+    since = (now or datetime.now()) - timedelta(days=days)
+    runs_by_task = defaultdict(list)
+    for run in models.JobRun.objects.filter(started_at__gte=since).order_by('task_name', 'started_at'):
+        runs_by_task[run.task_name].append(run)
+
+    trends = dict()
+    for task_name, runs in runs_by_task.items():
+        runs_by_day = defaultdict(list)
+        for run in runs:
+            runs_by_day[run.started_at.date()].append(run)
+        summary = summarize(runs)
+        cadence = get_cadence(runs)
+        summary['cadence_seconds'] = cadence
+        summary['schedule_usage'] = summary['max_duration'] / cadence if cadence and summary['max_duration'] else None
+        summary['daily'] = [{'date': day.isoformat(), **summarize(day_runs)} for day, day_runs in runs_by_day.items()]
+        trends[task_name] = summary
+    return trends
+
+
+def prune_job_runs(now=None):
+    return deletion_service.delete_in_batches(
+        models.JobRun.objects.filter(started_at__lt=(now or datetime.now()) - RETENTION))
@@ -0,0 +1,202 @@
+import contextlib
+import contextvars
+import logging
+import time
+from datetime import datetime, timedelta
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+from ams.services import rate_limiter, tracing, query_log
+from main.settings import PROMETHEUS_MULTIPROC_DIR
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+NO_ROUTE = 'none'
+
+REQUEST_LATENCY = Histogram('ams_request_duration_seconds', 'Latency of API requests', ['route', 'method', 'status'])
+REQUEST_QUERIES = Histogram('ams_request_db_queries', 'SQL queries run by one API request', ['route'],
+                            buckets=QUERY_COUNT_BUCKETS)
+DB_QUERIES = Counter('ams_db_queries_total', 'SQL queries by statement type', ['route', 'statement'])
+DB_QUERY_SECONDS = Counter('ams_db_query_seconds_total', 'Time spent in SQL queries', ['route', 'statement'])
+DB_QUERY_LATENCY = Histogram('ams_db_query_duration_seconds', 'Latency of SQL queries', ['statement'])
+EOD_REQUESTS = Counter('ams_eod_requests_total', 'Requests sent to the EOD API', ['endpoint', 'status'])
+EOD_LATENCY = Histogram('ams_eod_request_duration_seconds', 'Latency of EOD API requests', ['endpoint'])
+EOD_STALE_RESPONSES = Counter('ams_eod_stale_responses_total', 'EOD responses served from the last known good value',
+                              ['endpoint'])
+
+QUERY_STATS = contextvars.ContextVar('query_stats', default=None)
+
+STATEMENTS = ['SELECT', 'INSERT', 'UPDATE', 'DELETE']
+
+
+class QueryStats:
+    def __init__(self):
+        self.queries = dict()
+
+    def add(self, statement, duration):
+        count, seconds = self.queries.get(statement, (0, 0.0))
+        self.queries[statement] = (count + 1, seconds + duration)
+
+    @property
+    def count(self):
+        return sum(count for count, _ in self.queries.values())
+
+
+def get_statement(sql):
+    statement = sql.lstrip()[:6].upper()
+    return statement if statement in STATEMENTS else 'OTHER'
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing every query, installed on each connection when it is created.
+    """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        statement = get_statement(sql)
+        cursor = context.get('cursor')
+        rows = max(getattr(cursor, 'rowcount', 0) or 0, 0)
+        tracing.record_query(statement, rows)
+        query_log.record(sql, duration, rows)
+        DB_QUERY_LATENCY.labels(statement).observe(duration)
+        stats = QUERY_STATS.get()
+        if stats is None:
+            DB_QUERIES.labels(NO_ROUTE, statement).inc()
+            DB_QUERY_SECONDS.labels(NO_ROUTE, statement).inc(duration)
+        else:
+            stats.add(statement, duration)
+
+
+def install_query_wrapper(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextlib.contextmanager
+def track_queries():
+    """
+    Collects the queries run while the block runs, including the ones run from sync_to_async threads.
+    """
+    stats = QueryStats()
+    token = QUERY_STATS.set(stats)
+    try:
+        yield stats
+    finally:
+        QUERY_STATS.reset(token)
+
+
+def observe_queries(route, stats):
+    for statement, (count, seconds) in stats.queries.items():
+        DB_QUERIES.labels(route, statement).inc(count)
+        DB_QUERY_SECONDS.labels(route, statement).inc(seconds)
+
+
+def observe_request(route, method, status, duration, stats):
+    REQUEST_LATENCY.labels(route, method, status).observe(duration)
+    REQUEST_QUERIES.labels(route).observe(stats.count)
+    observe_queries(route, stats)
+
+
+def observe_eod_request(path, status, duration):
+    endpoint = rate_limiter.get_endpoint(path)
+    tracing.record_upstream_call()
+    EOD_REQUESTS.labels(endpoint, status).inc()
+    EOD_LATENCY.labels(endpoint).observe(duration)
+
+
+def observe_eod_stale(path):
+    EOD_STALE_RESPONSES.labels(rate_limiter.get_endpoint(path)).inc()
+
+
+class JobRunCollector:
+    """
+    Reads the last runs of Celery tasks from the job run table when /metrics is scraped, the workers running them
+    are not scraped themselves.
+    """
+
+    def describe(self):
+        # keeps registration from querying the database before it is ready
+        return []
+
+    def collect(self):
+        # imported here, models are not loaded yet when the metrics are registered
+        from ams.services import job_run_service
+
+        duration = GaugeMetricFamily('ams_job_last_duration_seconds', 'Duration of the last run of a task',
+                                     labels=['task'])
+        finished = GaugeMetricFamily('ams_job_last_run_timestamp_seconds', 'End of the last run of a task',
+                                     labels=['task', 'status'])
+        queue_wait = GaugeMetricFamily('ams_job_last_queue_wait_seconds',
+                                       'Time the last run of a task waited in the queue', labels=['task'])
+        rows = GaugeMetricFamily('ams_job_last_rows_written', 'Rows written by the last run of a task', labels=['task'])
+        upstream = GaugeMetricFamily('ams_job_last_upstream_calls', 'EOD requests sent by the last run of a task',
+                                     labels=['task'])
+        runs = GaugeMetricFamily('ams_job_runs_last_day', 'Runs of a task started in the last 24 hours',
+                                 labels=['task', 'status'])
+        try:
+            for run in job_run_service.get_latest_runs():
+                duration.add_metric([run.task_name], run.duration or 0)
+                finished.add_metric([run.task_name, run.status], run.finished_at.timestamp() if run.finished_at else 0)
+                queue_wait.add_metric([run.task_name], run.queue_wait or 0)
+                rows.add_metric([run.task_name], run.rows_written)
+                upstream.add_metric([run.task_name], run.upstream_calls)
+            for count in job_run_service.get_run_counts(datetime.now() - timedelta(days=1)):
+                runs.add_metric([count['task_name'], count['status']], count['count'])
+        except Exception:
+            logger.exception('Could not read job runs')
+            return
+        yield from [duration, finished, queue_wait, rows, upstream, runs]
+
+
+class EodUsageCollector:
+    """
+    Reads today's EOD usage from the rate limiter's counters in the shared cache when /metrics is scraped. The
+    request counters above only cover the scraped process, these also count the requests sent by Celery workers.
+    """
+
+    def describe(self):
+        # keeps registration from reaching the cache
+        return []
+
+    def collect(self):
+        used = GaugeMetricFamily('ams_eod_daily_calls', 'EOD API calls charged today by all processes')
+        quota = GaugeMetricFamily('ams_eod_daily_quota', 'Daily EOD API call quota')
+        throttled = GaugeMetricFamily('ams_eod_daily_throttled', 'EOD requests held back by the rate limit today')
+        endpoints = GaugeMetricFamily('ams_eod_daily_endpoint_calls', 'EOD API calls charged today per endpoint',
+                                      labels=['endpoint'])
+        try:
+            usage = rate_limiter.get_usage()
+        except Exception:
+            logger.exception('Could not read EOD usage')
+            return
+        used.add_metric([], usage['day']['used'])
+        quota.add_metric([], usage['day']['limit'])
+        throttled.add_metric([], usage['throttled'])
+        for endpoint, calls in usage['endpoints'].items():
+            endpoints.add_metric([endpoint], calls)
+        yield from [used, quota, throttled, endpoints]
+
+
+# read from shared stores, so they are collected once per scrape and not per worker
+SHARED_COLLECTORS = [JobRunCollector(), EodUsageCollector()]
+for collector in SHARED_COLLECTORS:
+    REGISTRY.register(collector)
+
+
+def get_registry():
+    """
+    Returns the registry /metrics serves. With PROMETHEUS_MULTIPROC_DIR the request and EOD metrics are merged from the
+    files every worker process writes, instead of taken from the process that answers the scrape.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, PROMETHEUS_MULTIPROC_DIR)
+    for collector in SHARED_COLLECTORS:
+        registry.register(collector)
+    return registry
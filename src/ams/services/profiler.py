@@ -0,0 +1,191 @@
+import cProfile
+import contextlib
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+from collections import Counter
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from ams import models
+from ams.services import query_log
+from main.settings import PROFILE_SAMPLE_RATE, PROFILE_SAMPLE_MODE, PROFILE_SAMPLE_INTERVAL, PROFILE_KEEP
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+LIST_LIMIT = 50
+LIST_FIELDS = ['id', 'created_at', 'method', 'path', 'route', 'account_id', 'user_id', 'status_code', 'duration',
+               'mode', 'sampled']
+
+# threads with a profile running, a thread takes one profile at a time
+_profiled_threads = set()
+
+DOWNLOADS = {
+    models.RequestProfile.CPROFILE: ('application/octet-stream', 'prof'),
+    models.RequestProfile.SAMPLE: ('text/plain', 'collapsed.txt'),
+}
+
+
+def get_file_name(code):
+    file_name = query_log.get_file_name(code)
+    if file_name is not None:
+        return file_name
+    _, _, package_path = code.co_filename.rpartition('site-packages' + os.sep)
+    return package_path or os.path.basename(code.co_filename)
+
+
+def get_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({get_file_name(code)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread from a background thread. The dump is in the collapsed stack format read by
+    flamegraph.pl and speedscope, one line per distinct stack with the number of samples it was seen in.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[get_stack(frame)] += 1
+
+    def dump(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()).encode()
+
+
+class CProfiler:
+    """
+    Deterministic profile of the calling thread, the dump is the marshalled stats read by pstats and snakeviz.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self):
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+
+def is_staff(request):
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def get_requested_mode(request):
+    """
+    Returns the mode asked for in the X-Profile header, only staff users may profile their requests.
+    """
+    mode = request.headers.get(PROFILE_HEADER)
+    if mode not in DOWNLOADS or not is_staff(request):
+        return None
+    return mode
+
+
+def get_sampled_mode():
+    return PROFILE_SAMPLE_MODE if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE else None
+
+
+@contextlib.contextmanager
+def profile(mode):
+    """
+    Profiles the block in the calling thread. With async views that is the event loop, the work they hand to
+    sync_to_async threads shows up as waiting. Yields None when the thread is already profiled, as with overlapping
+    async requests, the block then runs unprofiled.
+    """
+    thread_id = threading.get_ident()
+    if thread_id in _profiled_threads:
+        yield None
+        return
+    profiler = CProfiler() if mode == models.RequestProfile.CPROFILE else StackSampler(thread_id)
+    _profiled_threads.add(thread_id)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _profiled_threads.discard(thread_id)
+
+
+def get_account_id(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return None
+    account_id = resolver_match.kwargs.get('account_id')
+    if account_id is None and resolver_match.url_name == 'account-detail':
+        account_id = resolver_match.kwargs.get('pk')
+    return int(account_id) if account_id is not None else None
+
+
+def save_profile(request, response, route, mode, profiler, duration, sampled):
+    # DRF sets the user it authenticated on the underlying request
+    user = getattr(request, 'user', None)
+    saved = models.RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:255],
+        route=route,
+        account_id=get_account_id(request),
+        user_id=user.id if user is not None and user.is_authenticated else None,
+        status_code=response.status_code,
+        duration=duration,
+        mode=mode,
+        sampled=sampled,
+        data=profiler.dump(),
+    )
+    logger.info(f'Saved {mode} profile {saved.id} of {request.method} {route} taking {duration:.3f}s')
+    prune_profiles()
+    return saved
+
+
+def prune_profiles():
+    ids = models.RequestProfile.objects.order_by('-id').values_list('id', flat=True)
+    kept = list(ids[PROFILE_KEEP - 1:PROFILE_KEEP])
+    if kept:
+        models.RequestProfile.objects.filter(id__lt=kept[0]).delete()
+
+
+def get_profiles(route=None, account_id=None):
+    profiles = models.RequestProfile.objects.order_by('-id')
+    if route:
+        profiles = profiles.filter(route=route)
+    if account_id is not None:
+        profiles = profiles.filter(account_id=account_id)
+    return list(profiles.values(*LIST_FIELDS)[:LIST_LIMIT])
+
+
+def get_download(profile):
+    content_type, extension = DOWNLOADS[profile.mode]
+    return content_type, f'profile-{profile.id}.{extension}'
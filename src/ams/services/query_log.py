@@ -0,0 +1,132 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from main.settings import SLOW_QUERY_SECONDS, SLOW_QUERY_REPORT_SIZE
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# files of the query instrumentation itself, never the call site of a query
+SKIPPED_FILES = {os.path.join('ams', 'services', name) for name in ['metrics.py', 'query_log.py']}
+UNKNOWN_CALL_SITE = 'outside project code'
+SQL_LOG_LENGTH = 2000
+
+LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+_file_names = dict()
+_call_sites = dict()
+_lock = threading.Lock()
+_started_at = time.time()
+
+
+def normalize_sql(sql):
+    """
+    Replaces literals and parameters with ? and collapses IN lists, so queries differing in values group together.
+    """
+    for pattern, replacement in LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def get_file_name(code):
+    """
+    Returns the path of project code relative to src and None for library code, cached per code object.
+    """
+    if code not in _file_names:
+        filename = code.co_filename
+        _file_names[code] = os.path.relpath(filename, SOURCE_DIR) if filename.startswith(SOURCE_DIR) else None
+    return _file_names[code]
+
+
+def get_call_site(depth=1):
+    """
+    Returns the innermost frame of project code on the stack, the service function that built the query. The search
+    starts depth frames up from the code calling this function, 1 being that code itself.
+    """
+    frame = sys._getframe(depth)
+    while frame is not None:
+        file_name = get_file_name(frame.f_code)
+        if file_name is not None and file_name not in SKIPPED_FILES:
+            return f'{file_name}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return UNKNOWN_CALL_SITE
+
+
+class CallSiteStats:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.slow = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+
+    def add(self, duration, rows, slow):
+        self.count += 1
+        self.slow += slow
+        self.seconds += duration
+        self.max_seconds = max(self.max_seconds, duration)
+        self.rows += rows
+
+    def to_dict(self, call_site):
+        return {
+            'call_site': call_site,
+            'count': self.count,
+            'slow': self.slow,
+            'seconds': round(self.seconds, 6),
+            'mean_seconds': round(self.seconds / self.count, 6),
+            'max_seconds': round(self.max_seconds, 6),
+            'rows': self.rows,
+            'sql': self.sql,
+        }
+
+
+def record(sql, duration, rows):
+    """
+    Adds the query to the totals of its call site and logs it when it took longer than SLOW_QUERY_SECONDS.
+    """
+    call_site = get_call_site()
+    slow = duration >= SLOW_QUERY_SECONDS
+    with _lock:
+        stats = _call_sites.get(call_site)
+        if stats is None:
+            stats = _call_sites[call_site] = CallSiteStats(normalize_sql(sql))
+        stats.add(duration, rows, slow)
+    if slow:
+        logger.warning(f'Slow query {duration:.3f}s at {call_site}, {rows} rows: '
+                       f'{normalize_sql(sql)[:SQL_LOG_LENGTH]}')
+
+
+def get_report(limit=SLOW_QUERY_REPORT_SIZE):
+    """
+    Returns the call sites of this process that spent the most time in the database.
+    """
+    with _lock:
+        top = sorted(_call_sites.items(), key=lambda item: item[1].seconds, reverse=True)[:limit]
+        call_sites = [stats.to_dict(call_site) for call_site, stats in top]
+    return {
+        'pid': os.getpid(),
+        'since': _started_at,
+        'call_sites': call_sites,
+    }
+
+
+def log_report(limit=SLOW_QUERY_REPORT_SIZE):
+    for stats in get_report(limit)['call_sites']:
+        logger.info(f"{stats['seconds']:.3f}s in {stats['count']} queries ({stats['slow']} slow) at "
+                    f"{stats['call_site']}: {stats['sql'][:SQL_LOG_LENGTH]}")
+
+
+def reset():
+    with _lock:
+        _call_sites.clear()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from ams import models
+from ams.services import eod_client, trading_calendar_service
+
+logger = logging.getLogger(__name__)
+
+QUOTE_CHUNK_SIZE = 50
+
+
+def get_quote_cache_key(symbol):
+    return 'quote:' + symbol
+
+
+def get_account_symbols(account):
+    asset_ids = models.AssetBalance.objects.filter(account=account).values('asset_id')
+    return [f'{ticker}.{exchange_code}' for ticker, exchange_code in
+            models.Asset.objects.filter(id__in=asset_ids).values_list('ticker', 'exchange__code')]
+
+
+def get_favourite_symbols(user):
+    return [f'{code}.{exchange}' for code, exchange in
+            models.FavoriteAsset.objects.filter(user=user, exchange__isnull=False).values_list('code', 'exchange')]
+
+
+async def fetch_quotes(symbols):
+    """
+    Fetches quotes for up to QUOTE_CHUNK_SIZE symbols with one request, the first symbol goes into the path and the
+    rest into the s= list.
+    """
+    params = {'s': ','.join(symbols[1:])} if len(symbols) > 1 else None
+    data, stale = await eod_client.get_with_staleness(f'/real-time/{symbols[0]}', params, timeout=30.0)
+    if isinstance(data, dict):
+        data = [data]
+    return {quote['code'].upper(): {**quote, 'stale': stale} for quote in data if quote.get('close') != 'NA'}
+
+
+def get_cache_timeouts(symbols):
+    return {symbol: trading_calendar_service.get_symbol_cache_timeout(symbol) for symbol in symbols}
+
+
+async def get_quotes(symbols):
+    """
+    Returns quotes keyed by "CODE.EXCHANGE", answering from the cache and fetching the rest in chunked requests.
+    Quotes are cached until their market moves them, see trading_calendar_service.get_cache_timeout. Quotes served
+    from the last known good response while EOD is down are flagged as stale and not cached. Symbols without data
+    are left out.
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    cached = await cache.aget_many([get_quote_cache_key(symbol) for symbol in symbols])
+    quotes = {symbol: cached[get_quote_cache_key(symbol)] for symbol in symbols
+              if get_quote_cache_key(symbol) in cached}
+
+    missing = [symbol for symbol in symbols if symbol not in quotes]
+    chunks = [missing[i:i + QUOTE_CHUNK_SIZE] for i in range(0, len(missing), QUOTE_CHUNK_SIZE)]
+    results = await asyncio.gather(*[fetch_quotes(chunk) for chunk in chunks], return_exceptions=True)
+
+    fetched = dict()
+    for result in results:
+        if isinstance(result, Exception):
+            logger.exception(result)
+            continue
+        fetched.update(result)
+    if fetched:
+        by_timeout = defaultdict(dict)
+        timeouts = await sync_to_async(get_cache_timeouts)(list(fetched.keys()))
+        for symbol, quote in fetched.items():
+            if not quote['stale']:
+                by_timeout[timeouts[symbol]][get_quote_cache_key(symbol)] = quote
+        for timeout, entries in by_timeout.items():
+            await cache.aset_many(entries, timeout)
+    quotes.update(fetched)
+    return quotes
+
+
+async def get_quote(stock, exchange):
+    symbol = f'{stock}.{exchange}'.upper()
+    return (await get_quotes([symbol])).get(symbol)
@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from main.settings import EOD_RATE_LIMIT_PER_MINUTE, EOD_DAILY_QUOTA, EOD_BATCH_SHARE
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITY = contextvars.ContextVar('eod_priority', default=INTERACTIVE)
+
+# API calls charged by EOD per request, real-time requests are charged per symbol.
+EOD_ENDPOINT_COSTS = {
+    'eod-bulk-last-day': 100,
+    'news': 5,
+}
+TRACKED_ENDPOINTS = ['real-time', 'eod', 'eod-bulk-last-day', 'search', 'news', 'exchange-details',
+                     'exchange-symbol-list']
+
+MINUTE = 60
+DAY = 60 * 60 * 24
+# Longest an interactive request waits for the minute window to reset, a longer wait fails the request instead of
+# holding its worker.
+INTERACTIVE_MAX_WAIT = 2
+
+
+class RateLimitException(Exception):
+    pass
+
+
+class QuotaExceededException(RateLimitException):
+    pass
+
+
+class TooManyRequestsException(RateLimitException):
+    pass
+
+
+@contextlib.contextmanager
+def priority(value):
+    token = PRIORITY.set(value)
+    try:
+        yield
+    finally:
+        PRIORITY.reset(token)
+
+
+def get_endpoint(path):
+    return path.strip('/').split('/')[0]
+
+
+def get_cost(path, params=None):
+    endpoint = get_endpoint(path)
+    if endpoint == 'real-time' and params and params.get('s'):
+        return 1 + len(params['s'].split(','))
+    return EOD_ENDPOINT_COSTS.get(endpoint, 1)
+
+
+def get_limits(priority_class):
+    """
+    Batch work may only use EOD_BATCH_SHARE of each budget, the rest is kept for interactive requests.
+    """
+    share = 1 if priority_class == INTERACTIVE else EOD_BATCH_SHARE
+    return int(EOD_RATE_LIMIT_PER_MINUTE * share), int(EOD_DAILY_QUOTA * share)
+
+
+def get_minute_key(now):
+    return f'eod-rate:minute:{int(now // MINUTE)}'
+
+
+def get_day_keys(now):
+    day = datetime.fromtimestamp(now, timezone.utc).date().isoformat()
+    return f'eod-rate:day:{day}', f'eod-rate:throttled:{day}', f'eod-rate:endpoint:{day}:'
+
+
+def increment(key, delta, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # the key expired between add and incr
+        cache.add(key, 0, timeout)
+        return cache.incr(key, delta)
+
+
+def take(key, cost, limit, timeout):
+    if increment(key, cost, timeout) > limit:
+        cache.decr(key, cost)
+        return False
+    return True
+
+
+def reserve(path, params=None, now=None):
+    """
+    Takes the request's cost from the shared minute window and daily quota. Returns 0 when the request may be sent,
+    otherwise the number of seconds until the minute window resets.
+    """
+    now = now or time.time()
+    cost = get_cost(path, params)
+    minute_limit, day_limit = get_limits(PRIORITY.get())
+    day_key, throttled_key, endpoint_prefix = get_day_keys(now)
+
+    if not take(day_key, cost, day_limit, 2 * DAY):
+        raise QuotaExceededException(f'Daily EOD quota exhausted for {PRIORITY.get()} requests')
+    if not take(get_minute_key(now), cost, minute_limit, 2 * MINUTE):
+        cache.decr(day_key, cost)
+        increment(throttled_key, 1, 2 * DAY)
+        return MINUTE - now % MINUTE
+
+    increment(endpoint_prefix + get_endpoint(path), cost, 2 * DAY)
+    return 0
+
+
+def check_wait(path, wait):
+    if PRIORITY.get() == INTERACTIVE and wait > INTERACTIVE_MAX_WAIT:
+        raise TooManyRequestsException(f'EOD rate limit reached, {path} would wait {wait:.1f}s')
+    logger.debug(f'EOD rate limit reached, waiting {wait:.1f}s')
+
+
+def acquire(path, params=None):
+    while True:
+        wait = reserve(path, params)
+        if not wait:
+            return
+        check_wait(path, wait)
+        time.sleep(wait)
+
+
+async def acquire_async(path, params=None):
+    while True:
+        wait = await sync_to_async(reserve, thread_sensitive=False)(path, params)
+        if not wait:
+            return
+        check_wait(path, wait)
+        await asyncio.sleep(wait)
+
+
+def penalize(now=None):
+    """
+    Closes the current minute window for every worker after EOD answered 429.
+    """
+    now = now or time.time()
+    cache.set(get_minute_key(now), EOD_RATE_LIMIT_PER_MINUTE, 2 * MINUTE)
+
+
+def get_usage(now=None):
+    now = now or time.time()
+    day_key, throttled_key, endpoint_prefix = get_day_keys(now)
+    endpoint_keys = [endpoint_prefix + endpoint for endpoint in TRACKED_ENDPOINTS]
+    values = cache.get_many([day_key, throttled_key, get_minute_key(now), *endpoint_keys])
+
+    return {
+        'minute': {'used': values.get(get_minute_key(now), 0), 'limit': EOD_RATE_LIMIT_PER_MINUTE},
+        'day': {'used': values.get(day_key, 0), 'limit': EOD_DAILY_QUOTA},
+        'batch_share': EOD_BATCH_SHARE,
+        'throttled': values.get(throttled_key, 0),
+        'endpoints': {endpoint: values.get(endpoint_prefix + endpoint, 0) for endpoint in TRACKED_ENDPOINTS},
+    }
@@ -0,0 +1,102 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.db.models import Q, Case, When, Value, IntegerField
+
+from ams import models
+from ams.services import eod_client, trading_calendar_service
+
+SEARCH_LIMIT = 15
+SEARCH_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def to_search_result(code, exchange_code, name, type, country, currency, isin):
+    """
+    Builds a search result in the same shape as EOD's search endpoint, so clients can't tell the two apart.
+    """
+    return {
+        'Code': code,
+        'Exchange': exchange_code,
+        'Name': name,
+        'Type': type,
+        'Country': country,
+        'Currency': currency,
+        'ISIN': isin,
+    }
+
+
+def split_exchange_code(query):
+    """
+    Returns (code, exchange code) for a CODE.EXCHANGE query naming a known exchange, otherwise None, so tickers and
+    names containing a dot, like BRK.B, are searched as they are.
+    """
+    if '.' not in query or ' ' in query:
+        return None
+    code, exchange_code = query.upper().rsplit('.', 1)
+    if not code or exchange_code not in trading_calendar_service.get_exchanges_by_code():
+        return None
+    return code, exchange_code
+
+
+def search_local(query):
+    query = query.strip()
+    if not query:
+        return []
+    code = query.upper()
+    symbol_filter = Q(code__startswith=code) | Q(isin=code) | Q(name__trigram_similar=query)
+    asset_filter = Q(ticker__istartswith=query) | Q(isin__iexact=query) | Q(name__icontains=query)
+    code_on_exchange = split_exchange_code(query)
+    if code_on_exchange is not None:
+        code, exchange_code = code_on_exchange
+        symbol_filter = Q(code=code, exchange__code=exchange_code)
+        asset_filter = Q(ticker__iexact=code, exchange__code=exchange_code)
+
+    symbols = models.ExchangeSymbol.objects.filter(symbol_filter).select_related('exchange').annotate(
+        rank=Case(
+            When(code=code, then=Value(2)),
+            When(code__startswith=code, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField()
+        ),
+        similarity=TrigramSimilarity('name', query)
+    ).order_by('-rank', '-similarity', 'code')[:SEARCH_LIMIT]
+
+    results = dict()
+    for symbol in symbols:
+        results[(symbol.code, symbol.exchange.code)] = to_search_result(
+            symbol.code, symbol.exchange.code, symbol.name, symbol.type, symbol.country, symbol.currency, symbol.isin
+        )
+
+    assets = models.Asset.objects.filter(asset_filter).select_related('exchange')[:SEARCH_LIMIT]
+    for asset in assets:
+        key = (asset.ticker, asset.exchange.code)
+        if key not in results:
+            results[key] = to_search_result(
+                asset.ticker, asset.exchange.code, asset.name, 'Common Stock' if asset.type == 'STOCK' else 'Currency',
+                asset.exchange.country, asset.currency, asset.isin
+            )
+    return list(results.values())[:SEARCH_LIMIT]
+
+
+def get_search_cache_key(query):
+    return 'eod-search:' + hashlib.md5(query.strip().lower().encode()).hexdigest()
+
+
+async def search(query):
+    """
+    Answers from the local symbol index and only falls back to EOD on a miss. Non-empty EOD responses are memoized,
+    an empty one may come from an upstream error and is asked again next time.
+    """
+    results = await sync_to_async(search_local)(query)
+    if results:
+        return results
+
+    key = get_search_cache_key(query)
+    results = await cache.aget(key)
+    if results is None:
+        results = await eod_client.search(query)
+        if results:
+            await cache.aset(key, results, SEARCH_CACHE_TIMEOUT)
+    return results
@@ -1,30 +1,34 @@
 import datetime
 import decimal
+import logging
 from collections import defaultdict
 
 import pytz
-from django.db import transaction
 from pytz import timezone
 
 from ams import models
-from ams.services import eod_service, account_balance_service
+from ams.services import eod_service, account_balance_service, asset_history_service, trading_calendar_service, \
+    symbol_universe_service, tracing, unit_of_work, dirty_balance_service, account_xirr_service, account_lock
+from main.settings import LAZY_REBUILD
+
+logger = logging.getLogger(__name__)
 
 
 class NotEnoughStockException(Exception):
     pass
 
 
+@tracing.traced
 def add_stock_transaction_to_balance(stock_transaction, stock, account):
-    stock_balance, created = models.AssetBalance.objects.get_or_create(
-        asset_id=stock_transaction.asset_id,
-        account=account,
-        defaults={
-            'quantity': 0,
-            'result': 0,
-            'price': 0,
-            'average_price': 0
-        }
-    )
+    if stock_transaction.transaction_type == models.AssetTransaction.PRICE:
+        if dirty_balance_service.defer_price(account.id, stock_transaction.asset_id):
+            return None
+    elif dirty_balance_service.defer_rebuild(account.id, stock_transaction.asset_id, stock_transaction.date.date()):
+        if stock_transaction.transaction_type == models.AssetTransaction.SELL:
+            check_quantity(account, stock_transaction.asset_id)
+        return None
+
+    stock_balance, created = unit_of_work.get_or_create_asset_balance(account, stock_transaction.asset_id)
     if created:
         fetch_missing_price_changes(stock_balance, stock, stock_transaction.date.date())
     else:
@@ -40,10 +44,28 @@ def add_stock_transaction_to_balance(stock_transaction, stock, account):
                     stock_transaction.transaction_type == models.AssetTransaction.SELL:
                 update_average_price(stock_balance)
             update_current_result(stock_balance)
-            stock_balance.save()
+            unit_of_work.save(stock_balance)
     return stock_balance
 
 
+def check_quantity(account, asset_id):
+    """
+    Raises NotEnoughStockException when a sell exceeds the quantity held at its date, the check a rebuild would
+    make, for writes whose rebuild is deferred.
+    """
+    quantity = 0
+    for transaction_type, transaction_quantity in models.AssetTransaction.objects.filter(
+            account=account, asset_id=asset_id,
+            transaction_type__in=[models.AssetTransaction.BUY, models.AssetTransaction.SELL]
+    ).order_by('date').values_list('transaction_type', 'quantity'):
+        if transaction_type == models.AssetTransaction.BUY:
+            quantity += transaction_quantity
+        elif quantity < transaction_quantity:
+            raise NotEnoughStockException
+        else:
+            quantity -= transaction_quantity
+
+
 def update_stock_balance(stock_transaction, stock_balance):
     if stock_transaction.transaction_type == 'buy':
         stock_balance.quantity += stock_transaction.quantity
@@ -60,6 +82,7 @@ def update_stock_balance(stock_transaction, stock_balance):
         stock_balance.last_transaction_date = stock_transaction.date
 
 
+@tracing.traced
 def update_average_price(stock_balance):
     stock_transactions = list(models.AssetTransaction.objects.filter(
         asset_id=stock_balance.asset_id,
@@ -108,56 +131,74 @@ def update_current_result(stock_balance):
     stock_balance.result = (stock_balance.price - stock_balance.average_price) / stock_balance.average_price
 
 
-def update_stock_price(utc_now=datetime.datetime.utcnow()):
+PRICE_UPDATE_DELAY = datetime.timedelta(hours=4)
+
+
+def update_stock_price(utc_now=None):
+    if utc_now is None:
+        utc_now = datetime.datetime.utcnow()
+    utc_now_tz = utc_now.replace(minute=0, second=0, microsecond=0).astimezone(pytz.UTC)
+    window_start = utc_now_tz - PRICE_UPDATE_DELAY - datetime.timedelta(hours=1)
+    for exchange, utc_closing_time in trading_calendar_service.get_exchanges_closing_in_hour(window_start):
+        update_exchange_stock_price(exchange, utc_closing_time)
+
+
+def get_upcoming_price_updates(utc_now=None):
+    """
+    Returns (exchange, utc_update_time) pairs for exchanges whose prices become due within the next hour.
+    """
+    if utc_now is None:
+        utc_now = datetime.datetime.utcnow()
     utc_now_tz = utc_now.replace(minute=0, second=0, microsecond=0).astimezone(pytz.UTC)
-    window_start = utc_now_tz - datetime.timedelta(hours=5)
-    window_end = utc_now_tz - datetime.timedelta(hours=4)
-    weekday = window_start.weekday()
-    if weekday == 5 or weekday == 6:
+    closing_hour = utc_now_tz - PRICE_UPDATE_DELAY
+    return [(exchange, utc_closing_time + PRICE_UPDATE_DELAY) for exchange, utc_closing_time in
+            trading_calendar_service.get_exchanges_closing_in_hour(closing_hour)]
+
+
+def update_exchange_stock_price(exchange, utc_closing_time):
+    local_closing_date = utc_closing_time.astimezone(timezone(exchange.timezone)).date()
+    if not trading_calendar_service.is_trading_day(exchange, local_closing_date):
         return
-    exchanges = models.Exchange.objects.all()
-    for exchange in exchanges:
-        tz = timezone(exchange.timezone)
-        closing_time = window_start.replace(
-            hour=exchange.closing_hour.hour,
-            minute=exchange.closing_hour.minute,
-            second=exchange.closing_hour.second,
-            microsecond=exchange.closing_hour.microsecond,
-            tzinfo=None
-        )
-        utc_closing_time = tz.localize(closing_time).astimezone(pytz.UTC)
-        if not (window_start <= utc_closing_time < window_end):
-            continue
-        stocks = models.Asset.objects.filter(exchange=exchange)
-        if len(stocks) == 0:
+    stocks = models.Asset.objects.filter(exchange=exchange)
+    if len(stocks) == 0:
+        return
+    current_prices = eod_service.get_bulk_last_day_price(stocks, exchange, local_closing_date)
+    for stock in stocks:
+        if stock.ticker not in current_prices:
             continue
-        current_prices = eod_service.get_bulk_last_day_price(stocks, exchange, utc_closing_time)
-        for stock in stocks:
-            if stock.ticker not in current_prices:
-                continue
-            current_price = current_prices[stock.ticker]
-            stock_balances = models.AssetBalance.objects.filter(asset_id=stock.id)
-            for stock_balance in stock_balances:
+        current_price = current_prices[stock.ticker]
+        stock_balances = models.AssetBalance.objects.filter(asset_id=stock.id, account__deleted_at__isnull=True) \
+            .select_related('account')
+        for stock_balance in stock_balances:
+            # under the account's lock, so the price is never added while a rebuild of its dirty balances runs
+            with unit_of_work.atomic(stock_balance.account):
                 stock_transaction = models.AssetTransaction.objects.create(
                     asset_id=stock_balance.asset_id,
                     account=stock_balance.account,
                     transaction_type='price',
                     quantity=0,
                     price=current_price,
-                    date=utc_closing_time.replace(hour=0, minute=0, second=0, microsecond=0,
-                                                  tzinfo=None) + datetime.timedelta(days=1)
+                    date=datetime.datetime.combine(local_closing_date, datetime.time()) + datetime.timedelta(days=1)
                 )
                 stock_transaction.save()
                 add_stock_transaction_to_balance(stock_transaction, stock, stock_balance.account)
 
 
-def fetch_missing_price_changes(stock_balance, stock, begin):
-    end = stock_balance.first_event_date if stock_balance.first_event_date else datetime.datetime.now().date()
+def get_missing_price_range(first_event_date, stock, begin):
+    end = first_event_date if first_event_date else datetime.datetime.now().date()
     begin = begin - datetime.timedelta(days=1)
     end = end - datetime.timedelta(days=1)
     if begin > end:
         begin = end
-    price_changes = eod_service.get_price_changes(stock, begin, end)
+    begin = trading_calendar_service.get_last_trading_day(stock.exchange, begin)
+    return begin, end
+
+
+@tracing.traced
+def fetch_missing_price_changes(stock_balance, stock, begin, price_changes=None):
+    begin, end = get_missing_price_range(stock_balance.first_event_date, stock, begin)
+    if price_changes is None:
+        price_changes = eod_service.get_price_changes(stock, begin, end)
 
     first_event_date = begin
     to_save = []
@@ -177,14 +218,11 @@ def fetch_missing_price_changes(stock_balance, stock, begin):
     rebuild_stock_balance(stock_balance, first_event_date)
 
 
+@tracing.traced
+@unit_of_work.serialized(lambda stock_balance, *args: stock_balance.account)
 def rebuild_stock_balance(stock_balance, rebuild_date):
-    history_date = rebuild_date - datetime.timedelta(days=1)
-    stock_balance_history = models.AssetBalanceHistory.objects.filter(asset_id=stock_balance.asset_id,
-                                                                      account=stock_balance.account,
-                                                                      date=history_date).first()
-    models.AssetBalanceHistory.objects.filter(asset_id=stock_balance.asset_id,
-                                              account=stock_balance.account,
-                                              date__gte=rebuild_date).delete()
+    stock_balance_history = asset_history_service.cut_history(stock_balance.account, stock_balance.asset_id,
+                                                              rebuild_date)
     is_any_history = False
     if stock_balance_history:
         stock_balance.quantity = stock_balance_history.quantity
@@ -206,20 +244,19 @@ def rebuild_stock_balance(stock_balance, rebuild_date):
         stock_transactions_by_date[stock_transaction.date.date()].append(stock_transaction)
 
     to_save = []
+    current_history = stock_balance_history
     for day in range((yesterday - rebuild_date).days + 1):
-        for stock_transaction in stock_transactions_by_date[rebuild_date + datetime.timedelta(days=day)]:
+        date = rebuild_date + datetime.timedelta(days=day)
+        for stock_transaction in stock_transactions_by_date[date]:
             update_stock_balance(stock_transaction, stock_balance)
         if stock_balance.quantity != 0:
             is_any_history = True
         if is_any_history:
-            to_save.append(models.AssetBalanceHistory(
-                asset_id=stock_balance.asset_id,
-                account=stock_balance.account,
-                date=rebuild_date + datetime.timedelta(days=day),
-                quantity=stock_balance.quantity,
-                price=stock_balance.price,
-                result=stock_balance.result,
-            ))
+            current_history = asset_history_service.append_day(current_history, to_save, stock_balance.account,
+                                                               stock_balance.asset_id, date, stock_balance.quantity,
+                                                               stock_balance.price, stock_balance.result)
+    if stock_balance_history:
+        stock_balance_history.save(update_fields=['valid_to'])
     models.AssetBalanceHistory.objects.bulk_create(to_save)
 
     today_transactions = models.AssetTransaction.objects.filter(asset_id=stock_balance.asset_id,
@@ -231,22 +268,21 @@ def rebuild_stock_balance(stock_balance, rebuild_date):
     stock_balance.last_save_date = yesterday
     update_average_price(stock_balance)
     update_current_result(stock_balance)
-    stock_balance.save()
+    unit_of_work.save(stock_balance)
 
 
-@transaction.atomic
+@unit_of_work.atomic()
 def buy_stocks(buy_command):
     try:
-        account = models.Account.objects.get(id=buy_command.account_id)
+        account = unit_of_work.get_account(buy_command.account_id)
     except models.Account.DoesNotExist:
         raise Exception('Account does not exist.')
     try:
         exchange = models.Exchange.objects.get(code=buy_command.exchange_code)
     except models.Exchange.DoesNotExist:
         raise Exception('Exchange does not exist.')
-    try:
-        stock = models.Asset.objects.get(ticker=buy_command.ticker, exchange=exchange)
-    except models.Asset.DoesNotExist:
+    stock = symbol_universe_service.get_or_create_asset(buy_command.ticker, exchange)
+    if not stock:
         search_result = eod_service.search(buy_command.ticker + '.' + buy_command.exchange_code)
         if len(search_result) == 0:
             raise Exception('Stock does not exist.')
@@ -277,26 +313,31 @@ def buy_stocks(buy_command):
 
 
 def modify_stock_transaction(stock_transaction, old_stock_transaction_date):
-    stock_balance = models.AssetBalance.objects.get(asset_id=stock_transaction.asset_id,
-                                                    account=stock_transaction.account)
+    account = unit_of_work.get_account(stock_transaction.account_id)
+    stock_balance = unit_of_work.get_asset_balance(account, stock_transaction.asset_id)
     stock = models.Asset.objects.get(id=stock_transaction.asset_id)
     older_transaction_date = min(old_stock_transaction_date.date(), stock_transaction.date.date())
-    if stock_balance.first_event_date > older_transaction_date:
+    if dirty_balance_service.defer_rebuild(account.id, stock_transaction.asset_id, older_transaction_date):
+        check_quantity(account, stock_transaction.asset_id)
+    elif stock_balance.first_event_date > older_transaction_date:
         fetch_missing_price_changes(stock_balance, stock, older_transaction_date)
     else:
         rebuild_stock_balance(stock_balance, older_transaction_date)
 
     if models.AccountTransaction.objects.filter(correlation_id=stock_transaction.id).exists():
-        account_balance_service.modify_transaction_from_stock(stock_transaction, stock, stock_transaction.account)
+        account_balance_service.modify_transaction_from_stock(stock_transaction, stock, account)
 
 
-@transaction.atomic
+@unit_of_work.atomic()
 def delete_stock_transaction(stock_transaction):
-    stock_balance = models.AssetBalance.objects.get(asset_id=stock_transaction.asset_id,
-                                                    account=stock_transaction.account)
+    account = unit_of_work.get_account(stock_transaction.account_id)
+    stock_balance = unit_of_work.get_asset_balance(account, stock_transaction.asset_id)
     stock_transaction_id = stock_transaction.id
     stock_transaction.delete()
-    rebuild_stock_balance(stock_balance, stock_transaction.date.date())
+    if dirty_balance_service.defer_rebuild(account.id, stock_transaction.asset_id, stock_transaction.date.date()):
+        check_quantity(account, stock_transaction.asset_id)
+    else:
+        rebuild_stock_balance(stock_balance, stock_transaction.date.date())
 
     if models.AccountTransaction.objects.filter(correlation_id=stock_transaction_id).exists():
         account_transaction = models.AccountTransaction.objects.get(correlation_id=stock_transaction_id)
@@ -312,3 +353,55 @@ def get_stock_price_in_base_currency(stock_balance, stock):
     rates = eod_service.get_current_currency_price(currency_pair)
     value_in_base = stock_balance.price * decimal.Decimal(rates[currency_pair])
     return value_in_base.quantize(decimal.Decimal('0.01')), base_currency
+
+
+def rebuild_dirty_balances(account, wait=True):
+    """
+    Rebuilds the balances of the account left dirty by deferred writes, each once from its earliest dirty date.
+    Holds the account's lock, a caller waiting on a rebuild in flight finds the rows it already rebuilt gone.
+    Without wait raises AccountLockedException instead of waiting.
+    """
+    with unit_of_work.atomic(account, wait=wait):
+        dirty_balances = list(models.DirtyBalance.objects.select_for_update().filter(account=account))
+        if not dirty_balances:
+            return
+        asset_dates = {dirty.asset_id: dirty.dirty_from for dirty in dirty_balances if dirty.asset_id is not None}
+        stocks = models.Asset.objects.select_related('exchange').in_bulk(asset_dates)
+        for asset_id, dirty_from in asset_dates.items():
+            stock_balance, created = unit_of_work.get_or_create_asset_balance(account, asset_id)
+            if created or not stock_balance.first_event_date or stock_balance.first_event_date > dirty_from:
+                fetch_missing_price_changes(stock_balance, stocks[asset_id], dirty_from)
+            else:
+                rebuild_stock_balance(stock_balance, dirty_from)
+
+        account_dates = [dirty.dirty_from for dirty in dirty_balances if dirty.asset_id is None]
+        if account_dates:
+            account_balance_service.rebuild_account_balance(account, min(account_dates))
+        else:
+            account_xirr_service.calculate_account_xirr(account)
+        models.DirtyBalance.objects.filter(id__in=[dirty.id for dirty in dirty_balances]).delete()
+    logger.info(f'Rebuilt {len(asset_dates)} asset balances of account {account.id}'
+                f'{" and its account balances" if account_dates else ""}')
+
+
+def refresh_balances(accounts):
+    """
+    Rebuilds dirty balances of the accounts, a queryset, before they are read. Does nothing unless in lazy rebuild
+    mode.
+    """
+    if not LAZY_REBUILD:
+        return
+    for account_id in dirty_balance_service.get_dirty_account_ids(accounts):
+        rebuild_dirty_balances(unit_of_work.get_account(account_id))
+
+
+def rebuild_all_dirty_balances():
+    account_ids = set(models.DirtyBalance.objects.filter(account__deleted_at__isnull=True)
+                      .values_list('account_id', flat=True))
+    for account_id in account_ids:
+        try:
+            rebuild_dirty_balances(unit_of_work.get_account(account_id), wait=False)
+        except account_lock.AccountLockedException:
+            logger.info(f'Skipped dirty balances of account {account_id}, a rebuild of it is in flight')
+        except Exception:
+            logger.exception(f'Could not rebuild dirty balances of account {account_id}')
@@ -0,0 +1,176 @@
+import bisect
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+
+from ams import models
+from ams.services import deletion_service, eod_client, quote_service, symbol_universe_service
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = {
+    'week_price': relativedelta(days=7),
+    'month_price': relativedelta(months=1),
+    'three_months_price': relativedelta(months=3),
+    'six_months_price': relativedelta(months=6),
+    'year_price': relativedelta(years=1),
+    'three_years_price': relativedelta(years=3),
+    'five_years_price': relativedelta(years=5),
+}
+# Prices older than the longest horizon are only needed for the all-time anchor, which the snapshot keeps.
+PRICE_RETENTION = relativedelta(years=5, days=14)
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24
+# Snapshots of symbols whose prices could not be fetched are neither stored nor cached for long, so they are retried.
+UNRESOLVED_CACHE_TIMEOUT = 60 * 5
+SNAPSHOT_COLUMNS = ['code', 'exchange_code', 'as_of', 'first_price', *HORIZONS.keys()]
+
+
+def get_snapshot_cache_key(code, exchange_code, day):
+    return f'symbol-returns:{code}.{exchange_code}:{day.isoformat()}'
+
+
+def update_price_series(code, exchange_code, today):
+    """
+    Fetches the prices missing from the local series, the whole history on the first call. Returns the first price
+    of the symbol when the whole history was fetched. Errors of the EOD request are raised.
+    """
+    last_date = models.SymbolPrice.objects.filter(code=code, exchange_code=exchange_code) \
+        .order_by('-date').values_list('date', flat=True).first()
+    if last_date and last_date >= today:
+        return None
+    begin = last_date + timedelta(days=1) if last_date else None
+
+    params = {'period': 'd', 'to': today.strftime('%Y-%m-%d')}
+    if begin:
+        params['from'] = begin.strftime('%Y-%m-%d')
+    data = eod_client.run(eod_client.get(f'/eod/{code}.{exchange_code}', params))
+    prices = [models.SymbolPrice(
+        code=code,
+        exchange_code=exchange_code,
+        date=datetime.strptime(price['date'], '%Y-%m-%d').date(),
+        adjusted_close=Decimal(str(price['adjusted_close']))
+    ) for price in data if price.get('adjusted_close') is not None]
+    models.SymbolPrice.objects.bulk_create(prices, ignore_conflicts=True)
+
+    if begin is None and prices:
+        return prices[0].adjusted_close
+    return None
+
+
+def get_anchor_price(dates, prices, day):
+    """
+    Returns the last price on or before day, the way the forward-filled calendar used to, or None before the series.
+    """
+    index = bisect.bisect_right(dates, day)
+    return prices[index - 1] if index else None
+
+
+def build_snapshot(code, exchange_code, today, first_price):
+    series = models.SymbolPrice.objects.filter(
+        code=code, exchange_code=exchange_code, date__gte=today - PRICE_RETENTION
+    ).order_by('date').values_list('date', 'adjusted_close')
+    dates = [date for date, _ in series]
+    prices = [price for _, price in series]
+
+    snapshot = {'code': code, 'exchange_code': exchange_code, 'as_of': today, 'first_price': first_price}
+    for field, delta in HORIZONS.items():
+        snapshot[field] = get_anchor_price(dates, prices, today - delta)
+    return snapshot
+
+
+def is_resolved(snapshot):
+    return any(snapshot[field] is not None for field in ['first_price', *HORIZONS.keys()])
+
+
+def refresh_snapshot(code, exchange_code, today=None):
+    """
+    Updates the price series and stores the snapshot built from it. When the prices could not be fetched or the
+    symbol has none, the snapshot is only cached for UNRESOLVED_CACHE_TIMEOUT.
+    """
+    today = today or datetime.now().date()
+    stored = models.SymbolReturnSnapshot.objects.filter(code=code, exchange_code=exchange_code)
+    try:
+        first_price = update_price_series(code, exchange_code, today)
+        fetched = True
+    except Exception as e:
+        logger.warning(f'Could not fetch prices of {code}.{exchange_code}: {e}')
+        first_price, fetched = None, False
+    if first_price is None:
+        first_price = stored.values_list('first_price', flat=True).first()
+
+    snapshot = build_snapshot(code, exchange_code, today, first_price)
+    if not fetched or not is_resolved(snapshot):
+        if fetched:
+            # EOD answered without prices, the symbol does not exist
+            stored.delete()
+        cache.set(get_snapshot_cache_key(code, exchange_code, today), snapshot, UNRESOLVED_CACHE_TIMEOUT)
+        return snapshot
+
+    symbol_universe_service.upsert(models.SymbolReturnSnapshot, SNAPSHOT_COLUMNS, ['code', 'exchange_code'],
+                                   [tuple(snapshot[column] for column in SNAPSHOT_COLUMNS)])
+    cache.set(get_snapshot_cache_key(code, exchange_code, today), snapshot, SNAPSHOT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def get_snapshot(code, exchange_code):
+    """
+    Returns today's anchor prices for the symbol. They are normally precomputed by the nightly task, a symbol seen
+    for the first time costs one history download.
+    """
+    today = datetime.now().date()
+    snapshot = cache.get(get_snapshot_cache_key(code, exchange_code, today))
+    if snapshot is not None:
+        return snapshot
+
+    stored = models.SymbolReturnSnapshot.objects.filter(code=code, exchange_code=exchange_code, as_of=today) \
+        .values(*SNAPSHOT_COLUMNS).first()
+    if stored is None:
+        return refresh_snapshot(code, exchange_code, today)
+    cache.set(get_snapshot_cache_key(code, exchange_code, today), stored, SNAPSHOT_CACHE_TIMEOUT)
+    return stored
+
+
+def refresh_all_snapshots():
+    today = datetime.now().date()
+    deletion_service.delete_in_batches(models.SymbolPrice.objects.filter(date__lt=today - PRICE_RETENTION))
+    models.SymbolReturnSnapshot.objects.filter(
+        **{f'{field}__isnull': True for field in ['first_price', *HORIZONS.keys()]}).delete()
+    symbols = list(models.SymbolReturnSnapshot.objects.exclude(as_of=today).values_list('code', 'exchange_code'))
+    for code, exchange_code in symbols:
+        try:
+            refresh_snapshot(code, exchange_code, today)
+        except Exception as e:
+            logger.exception(e)
+    logger.info(f'Refreshed {len(symbols)} return snapshots')
+
+
+def get_percentage_change(current_price, start_price):
+    if not start_price:
+        return None
+    start_price = float(start_price)
+    return round(((current_price - start_price) / start_price) * 100, 2)
+
+
+def build_stock_history(snapshot, current_info):
+    current_price = current_info['close']
+    yesterday = current_info['previousClose']
+
+    return {
+        'today': round((current_price - yesterday) / yesterday * 100, 2),
+        'week': get_percentage_change(current_price, snapshot['week_price']),
+        'month': get_percentage_change(current_price, snapshot['month_price']),
+        'three_months': get_percentage_change(current_price, snapshot['three_months_price']),
+        'six_months': get_percentage_change(current_price, snapshot['six_months_price']),
+        'year': get_percentage_change(current_price, snapshot['year_price']),
+        'three_years': get_percentage_change(current_price, snapshot['three_years_price']),
+        'five_years': get_percentage_change(current_price, snapshot['five_years_price']),
+        'all_time': get_percentage_change(current_price, snapshot['first_price'])
+    }
+
+
+def get_stock_history(stock, exchange):
+    current_info = eod_client.run(quote_service.get_quote(stock, exchange))
+    return build_stock_history(get_snapshot(stock, exchange), current_info)
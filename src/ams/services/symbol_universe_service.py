@@ -0,0 +1,118 @@
+import csv
+import json
+import logging
+
+from django.db import connection
+from django.utils.dateparse import parse_time
+
+from ams import models
+from ams.services import eod_service, trading_calendar_service
+
+logger = logging.getLogger(__name__)
+
+UPSERT_BATCH_SIZE = 1000
+
+
+def upsert(model, columns, conflict_columns, rows):
+    """
+    Inserts rows with INSERT ... ON CONFLICT DO UPDATE, UPSERT_BATCH_SIZE rows per statement.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    quoted_columns = [connection.ops.quote_name(column) for column in columns]
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column, name in zip(quoted_columns, columns)
+                        if name not in conflict_columns)
+    conflict = ', '.join(connection.ops.quote_name(column) for column in conflict_columns)
+    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[i:i + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(quoted_columns)}) '
+                f'VALUES {", ".join([row_placeholder] * len(batch))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}',
+                [value for row in batch for value in row]
+            )
+    return len(rows)
+
+
+def upsert_exchanges(entries):
+    rows = dict()
+    for entry in entries:
+        rows[entry['code']] = (
+            entry['name'],
+            entry['mic'].split(' ')[0],
+            entry['country'],
+            entry['code'],
+            entry['timezone'],
+            parse_time(entry['open']) if entry['open'] else None,
+            parse_time(entry['close']) if entry['close'] else None,
+        )
+    count = upsert(models.Exchange, ['name', 'mic', 'country', 'code', 'timezone', 'opening_hour', 'closing_hour'],
+                   ['code'], list(rows.values()))
+    trading_calendar_service.invalidate_close_schedule()
+    return count
+
+
+def upsert_exchange_symbols(exchange, entries):
+    rows = dict()
+    for entry in entries:
+        if not entry.get('Code'):
+            continue
+        rows[entry['Code']] = (
+            exchange.id,
+            entry['Code'][:20],
+            (entry.get('Name') or '')[:255],
+            entry.get('Country') or None,
+            entry.get('Currency') or None,
+            entry.get('Type') or None,
+            entry['Isin'][:12] if entry.get('Isin') else None,
+        )
+    return upsert(models.ExchangeSymbol, ['exchange_id', 'code', 'name', 'country', 'currency', 'type', 'isin'],
+                  ['exchange_id', 'code'], list(rows.values()))
+
+
+def read_entries(path):
+    """
+    Reads a JSON list or a CSV file with a header row, e.g. a saved EOD exchange-symbol-list response.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            return list(csv.DictReader(file))
+        return json.load(file)
+
+
+def load_exchange_symbols(exchange, path=None):
+    entries = read_entries(path) if path else eod_service.get_exchange_symbols(exchange.code)
+    count = upsert_exchange_symbols(exchange, entries)
+    logger.info(f'Loaded {count} symbols for {exchange.code}')
+    return count
+
+
+def load_symbol_universe(exchanges_path, exchange_codes=None, symbols_path=None):
+    upsert_exchanges(read_entries(exchanges_path))
+    exchanges = models.Exchange.objects.all()
+    if exchange_codes:
+        exchanges = exchanges.filter(code__in=exchange_codes)
+    return {exchange.code: load_exchange_symbols(exchange, symbols_path) for exchange in exchanges}
+
+
+def get_or_create_asset(ticker, exchange):
+    """
+    Returns the asset for ticker, creating it from the symbol universe when needed. Returns None when the symbol is
+    not known locally and has to be looked up in EOD.
+    """
+    asset = models.Asset.objects.filter(ticker=ticker, exchange=exchange).first()
+    if asset:
+        return asset
+    symbol = models.ExchangeSymbol.objects.filter(exchange=exchange, code=ticker).first()
+    if not symbol or not symbol.currency:
+        return None
+    return models.Asset.objects.create(
+        isin=symbol.isin,
+        ticker=ticker,
+        name=symbol.name[:128],
+        currency=symbol.currency[:3],
+        exchange=exchange,
+        type="STOCK" if exchange.code != "CC" else "CRYPTO"
+    )
@@ -0,0 +1,144 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+TRACE = contextvars.ContextVar('trace', default=None)
+CURRENT_SPAN = contextvars.ContextVar('current_span', default=None)
+
+WRITE_STATEMENTS = ['INSERT', 'UPDATE', 'DELETE']
+
+
+class Span:
+    def __init__(self, span_id, name, parent_id, start, queries, rows):
+        self.span_id = span_id
+        self.name = name
+        self.parent_id = parent_id
+        self.start = start
+        self.start_queries = queries
+        self.start_rows = rows
+        self.duration = None
+        self.queries = 0
+        self.rows = 0
+
+
+class Trace:
+    """
+    Spans of one request or task. Query and row counts of a span include the ones of its children.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.queries = 0
+        self.rows = 0
+        self.upstream_calls = 0
+
+    def record_query(self, statement, rows):
+        self.queries += 1
+        if statement in WRITE_STATEMENTS and rows > 0:
+            self.rows += rows
+
+    def open_span(self, name):
+        span = Span(len(self.spans), name, CURRENT_SPAN.get(), time.perf_counter(), self.queries, self.rows)
+        self.spans.append(span)
+        return span
+
+    def close_span(self, span):
+        span.duration = time.perf_counter() - span.start
+        span.queries = self.queries - span.start_queries
+        span.rows = self.rows - span.start_rows
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def get_server_timing(self):
+        """
+        Returns a Server-Timing header value with spans of the same name added up, so repeated calls stay one entry.
+        """
+        totals = dict()
+        for span in self.spans:
+            if span.duration is not None:
+                duration, count, queries = totals.get(span.name, (0.0, 0, 0))
+                totals[span.name] = (duration + span.duration, count + 1, queries + span.queries)
+        entries = [f'{name};dur={duration * 1000:.1f};desc="{count}x {queries}q"'
+                   for name, (duration, count, queries) in totals.items()]
+        entries.append(f'total;dur={(self.duration or 0) * 1000:.1f};desc="{self.queries}q {self.rows}rows"')
+        return ', '.join(entries)
+
+    def to_dict(self):
+        return {
+            'trace': self.name,
+            'duration_ms': round((self.duration or 0) * 1000, 1),
+            'queries': self.queries,
+            'rows': self.rows,
+            'upstream_calls': self.upstream_calls,
+            'spans': [{
+                'id': span.span_id,
+                'parent': span.parent_id,
+                'name': span.name,
+                'start_ms': round((span.start - self.start) * 1000, 1),
+                'duration_ms': round(span.duration * 1000, 1) if span.duration is not None else None,
+                'queries': span.queries,
+                'rows': span.rows,
+            } for span in self.spans],
+        }
+
+    def log(self, level=logging.INFO):
+        logger.log(level, json.dumps(self.to_dict()))
+
+
+@contextlib.contextmanager
+def start_trace(name):
+    trace = Trace(name)
+    token = TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        TRACE.reset(token)
+        trace.finish()
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Times the block as a span of the current trace, does nothing outside of a trace.
+    """
+    trace = TRACE.get()
+    if trace is None:
+        yield
+        return
+    current = trace.open_span(name)
+    token = CURRENT_SPAN.set(current.span_id)
+    try:
+        yield
+    finally:
+        CURRENT_SPAN.reset(token)
+        trace.close_span(current)
+
+
+def traced(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def record_query(statement, rows):
+    trace = TRACE.get()
+    if trace is not None:
+        trace.record_query(statement, rows)
+
+
+def record_upstream_call():
+    trace = TRACE.get()
+    if trace is not None:
+        trace.upstream_calls += 1
@@ -0,0 +1,184 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, time as day_time, timedelta
+
+import pytz
+from django.core.cache import cache
+
+from ams import models
+from ams.services import eod_service
+
+logger = logging.getLogger(__name__)
+
+# Markets quoted around the clock.
+ALWAYS_OPEN_EXCHANGES = ['CC']
+# FX trades 24 hours on weekdays, from Sunday 17:00 to Friday 17:00 New York time. It has no row in the exchange
+# table and no holidays.
+FOREX = 'FOREX'
+FOREX_TIMEZONE = 'America/New_York'
+FOREX_ROLLOVER = day_time(17, 0)
+WEEKEND = (5, 6)
+HOLIDAYS_RANGE = timedelta(days=365)
+
+HOLIDAY_CACHE = dict()
+
+CLOSE_SCHEDULE_VERSION_KEY = 'close-schedule-version'
+CLOSE_SCHEDULE_CACHE = dict()
+EXCHANGE_CACHE = dict()
+
+INTRADAY_CACHE_TIMEOUT = 60
+MAX_CLOSED_CACHE_TIMEOUT = 60 * 60 * 24 * 4
+# EOD keeps adjusting the last quote for a while after the closing bell.
+QUOTE_SETTLE_DELAY = timedelta(minutes=30)
+
+
+def get_holidays(exchange):
+    global HOLIDAY_CACHE
+    now = datetime.now().date()
+    if exchange.id in HOLIDAY_CACHE and now == HOLIDAY_CACHE[exchange.id]['time']:
+        return HOLIDAY_CACHE[exchange.id]['holidays']
+
+    holidays = set(models.ExchangeHoliday.objects.filter(exchange=exchange).values_list('date', flat=True))
+    HOLIDAY_CACHE[exchange.id] = {'holidays': holidays, 'time': now}
+    return holidays
+
+
+def is_trading_day(exchange, day):
+    if exchange.code in ALWAYS_OPEN_EXCHANGES:
+        return True
+    if day.weekday() in WEEKEND:
+        return False
+    return exchange.code == FOREX or day not in get_holidays(exchange)
+
+
+def get_last_trading_day(exchange, day):
+    while not is_trading_day(exchange, day):
+        day -= timedelta(days=1)
+    return day
+
+
+def get_next_trading_day(exchange, day):
+    while not is_trading_day(exchange, day):
+        day += timedelta(days=1)
+    return day
+
+
+def update_exchange_holidays(exchange):
+    today = datetime.now().date()
+    details = eod_service.get_exchange_details(exchange.code, today - HOLIDAYS_RANGE, today + HOLIDAYS_RANGE)
+    holidays = details.get('ExchangeHolidays', {}) if details else {}
+
+    to_save = []
+    for holiday in holidays.values():
+        to_save.append(models.ExchangeHoliday(
+            exchange=exchange,
+            date=datetime.strptime(holiday['Date'], '%Y-%m-%d').date(),
+            name=holiday['Holiday'][:255],
+        ))
+    models.ExchangeHoliday.objects.bulk_create(to_save, ignore_conflicts=True)
+    HOLIDAY_CACHE.pop(exchange.id, None)
+    return len(to_save)
+
+
+def update_all_exchange_holidays():
+    for exchange in models.Exchange.objects.exclude(code__in=ALWAYS_OPEN_EXCHANGES + [FOREX]):
+        count = update_exchange_holidays(exchange)
+        logger.info(f'Fetched {count} holidays for {exchange.code}')
+
+
+def get_close_schedule(day):
+    """
+    Returns an index mapping each UTC hour of the given UTC day to the exchanges closing in it, as
+    (exchange, utc_closing_time) pairs. A session can close on the UTC day before or after its local date, so the
+    local dates around the day are checked too. Offsets are taken for each local date, so the index follows DST
+    changes.
+    """
+    global CLOSE_SCHEDULE_CACHE
+    version = cache.get(CLOSE_SCHEDULE_VERSION_KEY, 0)
+    if CLOSE_SCHEDULE_CACHE.get('day') == day and CLOSE_SCHEDULE_CACHE.get('version') == version:
+        return CLOSE_SCHEDULE_CACHE['index']
+
+    index = defaultdict(list)
+    exchanges = models.Exchange.objects.exclude(timezone__isnull=True).exclude(closing_hour__isnull=True)
+    for exchange in exchanges:
+        exchange_timezone = pytz.timezone(exchange.timezone)
+        for local_day in [day - timedelta(days=1), day, day + timedelta(days=1)]:
+            closing_time = datetime.combine(local_day, exchange.closing_hour)
+            utc_closing_time = exchange_timezone.localize(closing_time).astimezone(pytz.UTC)
+            if utc_closing_time.date() == day:
+                index[utc_closing_time.replace(minute=0, second=0, microsecond=0)].append((exchange, utc_closing_time))
+
+    CLOSE_SCHEDULE_CACHE = {'day': day, 'version': version, 'index': index}
+    return index
+
+
+def get_exchanges_closing_in_hour(utc_hour):
+    utc_hour = utc_hour.replace(minute=0, second=0, microsecond=0)
+    return get_close_schedule(utc_hour.date()).get(utc_hour, [])
+
+
+def get_exchanges_by_code():
+    global EXCHANGE_CACHE
+    version = cache.get(CLOSE_SCHEDULE_VERSION_KEY, 0)
+    if EXCHANGE_CACHE.get('version') != version:
+        EXCHANGE_CACHE = {'version': version,
+                          'exchanges': {exchange.code: exchange for exchange in models.Exchange.objects.all()}}
+    return EXCHANGE_CACHE['exchanges']
+
+
+def get_cache_timeout(exchange, utc_now=None):
+    """
+    Returns how many seconds a quote of the exchange stays valid: INTRADAY_CACHE_TIMEOUT while the session is open,
+    otherwise until the next session opens.
+    """
+    if exchange is not None and exchange.code == FOREX:
+        return get_forex_cache_timeout(utc_now)
+    if exchange is None or exchange.code in ALWAYS_OPEN_EXCHANGES or not exchange.timezone \
+            or not exchange.opening_hour or not exchange.closing_hour:
+        return INTRADAY_CACHE_TIMEOUT
+
+    tz = pytz.timezone(exchange.timezone)
+    local_now = (utc_now or datetime.now(pytz.UTC)).astimezone(tz)
+    day = local_now.date()
+    if is_trading_day(exchange, day):
+        session_open = tz.localize(datetime.combine(day, exchange.opening_hour))
+        session_close = tz.localize(datetime.combine(day, exchange.closing_hour)) + QUOTE_SETTLE_DELAY
+        if session_open <= local_now < session_close:
+            return INTRADAY_CACHE_TIMEOUT
+        if local_now < session_open:
+            return max(INTRADAY_CACHE_TIMEOUT, int((session_open - local_now).total_seconds()))
+
+    next_day = get_next_trading_day(exchange, day + timedelta(days=1))
+    next_open = tz.localize(datetime.combine(next_day, exchange.opening_hour))
+    return max(INTRADAY_CACHE_TIMEOUT, min(MAX_CLOSED_CACHE_TIMEOUT, int((next_open - local_now).total_seconds())))
+
+
+def get_forex_cache_timeout(utc_now=None):
+    """
+    Returns INTRADAY_CACHE_TIMEOUT while FX trades, over the weekend the seconds until it reopens on Sunday.
+    """
+    tz = pytz.timezone(FOREX_TIMEZONE)
+    local_now = (utc_now or datetime.now(pytz.UTC)).astimezone(tz)
+    weekday, now_time = local_now.weekday(), local_now.time()
+    closed = (weekday == 4 and now_time >= FOREX_ROLLOVER) or weekday == 5 \
+        or (weekday == 6 and now_time < FOREX_ROLLOVER)
+    if not closed:
+        return INTRADAY_CACHE_TIMEOUT
+
+    reopen_day = local_now.date() + timedelta(days=6 - weekday)
+    reopen = tz.localize(datetime.combine(reopen_day, FOREX_ROLLOVER))
+    return max(INTRADAY_CACHE_TIMEOUT, min(MAX_CLOSED_CACHE_TIMEOUT, int((reopen - local_now).total_seconds())))
+
+
+def get_symbol_cache_timeout(symbol, utc_now=None):
+    exchange_code = symbol.rsplit('.', 1)[-1]
+    if exchange_code in ALWAYS_OPEN_EXCHANGES:
+        return INTRADAY_CACHE_TIMEOUT
+    if exchange_code == FOREX:
+        return get_forex_cache_timeout(utc_now)
+    return get_cache_timeout(get_exchanges_by_code().get(exchange_code), utc_now)
+
+
+def invalidate_close_schedule():
+    cache.set(CLOSE_SCHEDULE_VERSION_KEY, time.time_ns(), timeout=None)
@@ -0,0 +1,253 @@
+import contextlib
+import contextvars
+import functools
+
+from django.db import transaction
+
+from ams import models
+from ams.services import account_lock
+
+UNIT_OF_WORK = contextvars.ContextVar('unit_of_work', default=None)
+
+ASSET_BALANCE_DEFAULTS = {
+    'quantity': 0,
+    'result': 0,
+    'price': 0,
+    'average_price': 0,
+}
+
+# account fields written by rebuilds, reloaded once the account is locked
+LOCKED_FIELDS = ['last_transaction_date', 'last_save_date', 'xirr']
+
+
+class UnitOfWork:
+    """
+    Working set of the accounts written to by one request or task. Accounts, their balances and assets are loaded
+    once and shared by every service function. Objects passed to save() are written when the unit of work commits,
+    with one UPDATE per model.
+    """
+
+    def __init__(self):
+        self.accounts = dict()
+        # account id -> {currency: AccountBalance}
+        self.account_balances = dict()
+        # account id -> {asset id: AssetBalance}
+        self.asset_balances = dict()
+        self.assets = dict()
+        # (model, pk) -> object, in the order they were first saved
+        self.dirty = dict()
+
+    def add_account(self, account):
+        return self.accounts.setdefault(account.id, account)
+
+    def lock_accounts(self, accounts, wait=True):
+        """
+        Takes the balance locks of accounts new to the unit, in id order, and reloads the fields another writer may
+        have changed while this one waited. Without wait raises AccountLockedException when one is held elsewhere.
+        """
+        accounts = sorted((account for account in accounts if account.id not in self.accounts),
+                          key=lambda account: account.id)
+        if not accounts:
+            return
+        for account in accounts:
+            if wait:
+                account_lock.lock(account.id)
+            elif not account_lock.try_lock(account.id):
+                raise account_lock.AccountLockedException()
+        accounts_by_id = {account.id: account for account in accounts}
+        for values in models.Account.all_objects.filter(id__in=accounts_by_id).values('id', *LOCKED_FIELDS):
+            for field in LOCKED_FIELDS:
+                setattr(accounts_by_id[values['id']], field, values[field])
+        for account in accounts:
+            self.add_account(account)
+
+    def get_objects(self):
+        return [*self.accounts.values(), *self.assets.values(),
+                *(obj for objects in self.account_balances.values() for obj in objects.values()),
+                *(obj for objects in self.asset_balances.values() for obj in objects.values()), *self.dirty.values()]
+
+    def get_state(self):
+        values = {id(obj): (obj, get_values(obj)) for obj in self.get_objects()}
+        return (dict(self.accounts), {key: dict(value) for key, value in self.account_balances.items()},
+                {key: dict(value) for key, value in self.asset_balances.items()}, dict(self.assets), dict(self.dirty),
+                values)
+
+    def reset_state(self, state):
+        """
+        Forgets what a rolled back block loaded, locked and saved, and puts back the field values the unit's objects
+        had when it started, so the changes of the block are never flushed.
+        """
+        self.accounts, self.account_balances, self.asset_balances, self.assets, self.dirty, values = state
+        for obj, field_values in values.values():
+            for name, value in field_values.items():
+                setattr(obj, name, value)
+
+    def flush(self):
+        objects_by_model = dict()
+        for (model, _), obj in self.dirty.items():
+            objects_by_model.setdefault(model, []).append(obj)
+        for model, objects in objects_by_model.items():
+            model.objects.bulk_update(objects, get_fields(model))
+        self.dirty.clear()
+
+
+def get_fields(model):
+    return [field.name for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def get_values(obj):
+    return {field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields}
+
+
+@contextlib.contextmanager
+def atomic(*accounts, wait=True):
+    """
+    Runs the block in a transaction with a unit of work, seeded with accounts the caller already loaded. Accounts of
+    the unit stay locked until the transaction ends. Dirty objects are flushed just before it commits. Inside an
+    active unit of work the block joins it in a savepoint, when it fails the unit forgets what the block did.
+    """
+    current = UNIT_OF_WORK.get()
+    if current is not None:
+        state = current.get_state()
+        try:
+            with transaction.atomic():
+                current.lock_accounts(accounts, wait)
+                yield current
+        except Exception:
+            current.reset_state(state)
+            raise
+        return
+
+    unit = UnitOfWork()
+    token = UNIT_OF_WORK.set(unit)
+    try:
+        with transaction.atomic():
+            unit.lock_accounts(accounts, wait)
+            yield unit
+            unit.flush()
+    finally:
+        UNIT_OF_WORK.reset(token)
+
+
+def serialized(get_account):
+    """
+    Runs the decorated function in a unit of work holding the lock of the account get_account(*args) returns, so
+    rebuilds of one account never interleave their deletes and inserts of history rows.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with atomic(get_account(*args, **kwargs)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def save(*objects):
+    """
+    Saves the objects, inside a unit of work only once it commits.
+    """
+    unit = UNIT_OF_WORK.get()
+    for obj in objects:
+        if unit is None or obj.pk is None:
+            obj.save()
+        else:
+            unit.dirty[(type(obj), obj.pk)] = obj
+
+
+def get_account(account_id, user=None):
+    """
+    Returns the account with its preferences loaded. Raises Account.DoesNotExist when it does not belong to user.
+    """
+    unit = UNIT_OF_WORK.get()
+    account = unit.accounts.get(int(account_id)) if unit is not None else None
+    if account is None:
+        if unit is not None:
+            account_lock.lock(int(account_id))
+        filters = {'user': user} if user is not None else {}
+        account = models.Account.objects.select_related('account_preferences').get(pk=account_id, **filters)
+        return unit.add_account(account) if unit is not None else account
+    if user is not None and account.user_id != user.id:
+        raise models.Account.DoesNotExist()
+    return account
+
+
+def get_account_balances(accounts):
+    """
+    Returns {account id: {currency: AccountBalance}}, querying only the accounts not loaded yet.
+    """
+    unit = UNIT_OF_WORK.get()
+    balances = unit.account_balances if unit is not None else dict()
+    missing = [account.id for account in accounts if account.id not in balances]
+    if missing:
+        for account_id in missing:
+            balances[account_id] = dict()
+        for balance in models.AccountBalance.objects.filter(account_id__in=missing):
+            balances[balance.account_id][balance.currency] = balance
+    return {account.id: balances[account.id] for account in accounts}
+
+
+def get_asset_balances(accounts):
+    """
+    Returns {account id: {asset id: AssetBalance}}, querying only the accounts not loaded yet.
+    """
+    unit = UNIT_OF_WORK.get()
+    balances = unit.asset_balances if unit is not None else dict()
+    accounts_by_id = {account.id: account for account in accounts}
+    missing = [account_id for account_id in accounts_by_id if account_id not in balances]
+    if missing:
+        for account_id in missing:
+            balances[account_id] = dict()
+        for balance in models.AssetBalance.objects.filter(account_id__in=missing):
+            balance.account = accounts_by_id[balance.account_id]
+            balances[balance.account_id][balance.asset_id] = balance
+    return {account_id: balances[account_id] for account_id in accounts_by_id}
+
+
+def get_asset_balance(account, asset_id):
+    unit = UNIT_OF_WORK.get()
+    if unit is None:
+        return models.AssetBalance.objects.get(asset_id=asset_id, account=account)
+    try:
+        return get_asset_balances([account])[account.id][asset_id]
+    except KeyError:
+        raise models.AssetBalance.DoesNotExist()
+
+
+def get_or_create_account_balance(account, currency):
+    unit = UNIT_OF_WORK.get()
+    if unit is None:
+        return models.AccountBalance.objects.get_or_create(account_id=account.id, currency=currency,
+                                                           defaults={'amount': 0})
+    balances = get_account_balances([account])[account.id]
+    if currency in balances:
+        return balances[currency], False
+    balances[currency] = models.AccountBalance.objects.create(account_id=account.id, currency=currency, amount=0)
+    return balances[currency], True
+
+
+def get_or_create_asset_balance(account, asset_id):
+    unit = UNIT_OF_WORK.get()
+    if unit is None:
+        return models.AssetBalance.objects.get_or_create(asset_id=asset_id, account=account,
+                                                         defaults=ASSET_BALANCE_DEFAULTS)
+    balances = get_asset_balances([account])[account.id]
+    if asset_id in balances:
+        return balances[asset_id], False
+    balances[asset_id] = models.AssetBalance.objects.create(asset_id=asset_id, account=account,
+                                                            **ASSET_BALANCE_DEFAULTS)
+    return balances[asset_id], True
+
+
+def get_assets(asset_ids):
+    """
+    Returns {asset id: Asset}, querying only the assets not loaded yet.
+    """
+    unit = UNIT_OF_WORK.get()
+    assets = unit.assets if unit is not None else dict()
+    missing = [asset_id for asset_id in set(asset_ids) if asset_id not in assets]
+    if missing:
+        assets.update(models.Asset.objects.in_bulk(missing))
+    return {asset_id: assets[asset_id] for asset_id in asset_ids if asset_id in assets}
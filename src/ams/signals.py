@@ -0,0 +1,54 @@
+import logging
+import time
+
+from celery.signals import before_task_publish, task_prerun, task_postrun, worker_process_shutdown
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ams import models
+from ams.services import rate_limiter, trading_calendar_service, metrics, job_run_service, query_log
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=models.Exchange)
+@receiver(post_delete, sender=models.Exchange)
+def exchange_changed(sender, **kwargs):
+    trading_calendar_service.invalidate_close_schedule()
+
+
+@before_task_publish.connect
+def task_published(headers=None, **kwargs):
+    if headers is not None:
+        headers[job_run_service.QUEUED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, args=None, kwargs=None, **other):
+    rate_limiter.PRIORITY.set(rate_limiter.BATCH)
+    # instrumentation must never keep the task itself from running
+    try:
+        job_run_service.start_run(task_id, task.name, args, kwargs, task.request.get(job_run_service.QUEUED_AT_HEADER),
+                                  task.request.eta)
+    except Exception:
+        logger.exception(f'Could not record the start of {task.name}')
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, retval=None, state=None, **kwargs):
+    rate_limiter.PRIORITY.set(rate_limiter.INTERACTIVE)
+    try:
+        job_run_service.finish_run(task_id, state, retval)
+    except Exception:
+        logger.exception(f'Could not record the end of {task.name}')
+
+
+@worker_process_shutdown.connect
+def worker_process_stopped(**kwargs):
+    query_log.log_report()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.install_query_wrapper(connection)
@@ -1,8 +1,13 @@
+import datetime
 import logging
+import os
 
 from celery import shared_task
+from django.conf import settings
 
-from ams.services import stock_balance_service, history_service
+from ams import models
+from ams.services import stock_balance_service, history_service, deletion_service, trading_calendar_service, \
+    symbol_universe_service, symbol_returns_service, job_run_service
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +19,17 @@ def add(x, y):
 
 @shared_task
 def update_stock_price_task():
+    for exchange, utc_update_time in stock_balance_service.get_upcoming_price_updates():
+        logger.info(f"Scheduling stock price update for {exchange.code} at {utc_update_time}")
+        update_exchange_stock_price_task.apply_async((exchange.id, utc_update_time.isoformat()), eta=utc_update_time)
+
+
+@shared_task
+def update_exchange_stock_price_task(exchange_id, utc_update_time):
     logger.info("Updating stock price")
-    stock_balance_service.update_stock_price()
+    exchange = models.Exchange.objects.get(id=exchange_id)
+    utc_closing_time = datetime.datetime.fromisoformat(utc_update_time) - stock_balance_service.PRICE_UPDATE_DELAY
+    stock_balance_service.update_exchange_stock_price(exchange, utc_closing_time)
 
 
 @shared_task
@@ -29,3 +43,38 @@ def save_stock_balance_history():
     logger.info("Saving stock balance history")
     history_service.save_stock_balance_history()
 
+
+@shared_task
+def delete_account(account_id):
+    logger.info(f"Deleting account {account_id}")
+    deletion_service.delete_account(account_id)
+
+
+@shared_task
+def update_exchange_holidays():
+    logger.info("Updating exchange holidays")
+    trading_calendar_service.update_all_exchange_holidays()
+
+
+@shared_task
+def refresh_symbol_returns():
+    logger.info("Refreshing symbol return snapshots")
+    symbol_returns_service.refresh_all_snapshots()
+
+
+@shared_task
+def load_symbol_universe():
+    logger.info("Loading symbol universe")
+    symbol_universe_service.load_symbol_universe(os.path.join(settings.BASE_DIR, 'ams', 'data', 'exchanges.json'))
+
+
+@shared_task
+def prune_job_runs():
+    logger.info("Pruning job runs")
+    job_run_service.prune_job_runs()
+
+
+@shared_task
+def rebuild_dirty_balances():
+    logger.info("Rebuilding dirty balances")
+    stock_balance_service.rebuild_all_dirty_balances()
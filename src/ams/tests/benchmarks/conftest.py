@@ -0,0 +1,148 @@
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import pytest
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from ams import models
+from ams.devtools import portfolio_generator
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+BENCH_SEED = 41
+DATASET_SIZES = {
+    'small': {'users': 2, 'accounts_per_user': 2, 'assets': 20, 'years': 2, 'trades_per_year': 40},
+    'medium': {'users': 20, 'accounts_per_user': 3, 'assets': 200, 'years': 5, 'trades_per_year': 60},
+    'large': {'users': 200, 'accounts_per_user': 3, 'assets': 1000, 'years': 10, 'trades_per_year': 100},
+}
+RESULTS = dict()
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--bench'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with --bench')
+    for item in items:
+        if str(item.fspath).startswith(os.path.dirname(__file__)):
+            item.add_marker(skip)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_baseline(name):
+    with open(os.path.join(BASELINE_DIR, f'{name}.json'), 'r', encoding='utf-8') as file:
+        return json.load(file)['results']
+
+
+def pytest_sessionfinish(session):
+    name = session.config.getoption('--bench-save', None)
+    if not name or not RESULTS:
+        return
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(os.path.join(BASELINE_DIR, f'{name}.json'), 'w', encoding='utf-8') as file:
+        json.dump({
+            'commit': get_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'size': session.config.getoption('--bench-size'),
+            'results': RESULTS,
+        }, file, indent=2, sort_keys=True)
+
+
+@pytest.fixture(scope='session')
+def bench_dataset(request, django_db_setup, django_db_blocker, eod_stub_url):
+    size = DATASET_SIZES[request.config.getoption('--bench-size')]
+    with django_db_blocker.unblock():
+        return portfolio_generator.generate(seed=BENCH_SEED, prefix='bench', **size)
+
+
+class Bench:
+    """
+    Measures a callable like pytest-benchmark: one instrumented round for query count and peak memory, then timed
+    rounds. Results are kept under the test's name and checked against the baseline given with --bench-compare.
+    """
+
+    def __init__(self, name, baseline, tolerance):
+        self.name = name
+        self.baseline = baseline
+        self.tolerance = tolerance
+
+    def __call__(self, func, *args, rounds=3, setup=None, **kwargs):
+        if setup:
+            setup()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            result = func(*args, **kwargs)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        timings = []
+        for _ in range(rounds):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+
+        measurement = {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'rounds': rounds,
+            'queries': len(queries.captured_queries),
+            'peak_memory': peak_memory,
+        }
+        RESULTS[self.name] = measurement
+        self.compare(measurement)
+        return result
+
+    def compare(self, measurement):
+        if self.baseline is None or self.name not in self.baseline:
+            return
+        baseline = self.baseline[self.name]
+        problems = []
+        if measurement['queries'] > baseline['queries']:
+            problems.append(f"queries {baseline['queries']} -> {measurement['queries']}")
+        if measurement['min'] > baseline['min'] * (1 + self.tolerance):
+            problems.append(f"time {baseline['min']:.4f}s -> {measurement['min']:.4f}s")
+        if measurement['peak_memory'] > baseline['peak_memory'] * (1 + self.tolerance):
+            problems.append(f"peak memory {baseline['peak_memory']} -> {measurement['peak_memory']} bytes")
+        if problems:
+            pytest.fail(f'{self.name} regressed: ' + ', '.join(problems))
+
+
+@pytest.fixture(scope='session')
+def bench_baseline(request):
+    name = request.config.getoption('--bench-compare')
+    return load_baseline(name) if name else None
+
+
+@pytest.fixture
+def bench(request, bench_dataset, bench_baseline, db):
+    return Bench(request.node.name, bench_baseline, request.config.getoption('--bench-tolerance'))
+
+
+@pytest.fixture
+def bench_account(bench_dataset):
+    """
+    The generated account with the most asset transactions, the one a slow path hurts most.
+    """
+    return (models.Account.objects.filter(user__username__startswith='bench_')
+            .annotate(transaction_count=Count('stock_transaction')).order_by('-transaction_count', 'id').first())
+
+
+@pytest.fixture
+def bench_stock_balance(bench_account):
+    busiest = (models.AssetTransaction.objects.filter(account=bench_account).values('asset_id')
+               .annotate(transaction_count=Count('id')).order_by('-transaction_count', 'asset_id').first())
+    return models.AssetBalance.objects.select_related('account').get(account=bench_account,
+                                                                     asset_id=busiest['asset_id'])
@@ -0,0 +1,40 @@
+from ams import models
+from ams.services import stock_balance_service, account_balance_service, account_history_service, \
+    account_xirr_service
+
+
+def get_first_event_date(account):
+    return models.AccountTransaction.objects.filter(account=account).earliest('date').date.date()
+
+
+def rebuild_account(account):
+    rebuild_date = get_first_event_date(account)
+    for stock_balance in models.AssetBalance.objects.filter(account=account).select_related('account'):
+        stock_balance_service.rebuild_stock_balance(stock_balance, rebuild_date)
+    account_balance_service.rebuild_account_balance(account, rebuild_date)
+
+
+def test_rebuild_stock_balance(bench, bench_stock_balance):
+    rebuild_date = get_first_event_date(bench_stock_balance.account)
+    bench(stock_balance_service.rebuild_stock_balance, bench_stock_balance, rebuild_date)
+
+
+def test_rebuild_account_balance(bench, bench_account):
+    bench(account_balance_service.rebuild_account_balance, bench_account, get_first_event_date(bench_account))
+
+
+def test_update_average_price(bench, bench_stock_balance):
+    bench(stock_balance_service.update_average_price, bench_stock_balance, rounds=10)
+
+
+def test_get_account_value(bench, bench_account):
+    bench(account_balance_service.get_account_value, bench_account, rounds=5)
+
+
+def test_get_account_history_dtos(bench, bench_account):
+    rebuild_account(bench_account)
+    bench(account_history_service.get_account_history_dtos, bench_account)
+
+
+def test_calculate_account_xirr(bench, bench_account):
+    bench(account_xirr_service.calculate_account_xirr, bench_account, rounds=5)
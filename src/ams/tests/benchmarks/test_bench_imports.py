@@ -0,0 +1,108 @@
+import csv
+import io
+import random
+from datetime import datetime, timedelta, time
+
+import pytest
+
+from ams import models
+from ams.devtools import eod_stub
+from ams.services import import_service
+
+TRADES = 200
+
+
+def get_trades():
+    """
+    Returns deterministic buys of the generated US assets over the last year, one per trading day at most.
+    """
+    rng = random.Random(41)
+    assets = list(models.Asset.objects.filter(ticker__startswith='SYN', exchange__code='US').order_by('ticker'))
+    day = datetime.now().date() - timedelta(days=1)
+    trades = []
+    while len(trades) < TRADES:
+        day -= timedelta(days=1)
+        if day.weekday() >= 5:
+            continue
+        asset = rng.choice(assets)
+        moment = datetime.combine(day, time(rng.randint(10, 15), rng.randint(0, 59)))
+        price = round(eod_stub.get_price(f'{asset.ticker}.US', day), 2)
+        trades.append((moment, asset, rng.randint(1, 20), price, round(rng.uniform(1, 5), 2)))
+    return trades
+
+
+def degiro(trades):
+    rows = [['Date', 'Time', 'Product', 'ISIN', 'Reference', 'Venue', 'Quantity', 'Price', '', 'Local value', '',
+             'Value', '', 'Exchange rate', 'Transaction costs', '', 'Total', '', 'Order ID']]
+    for moment, asset, quantity, price, commission in trades:
+        rows.append([moment.strftime('%d-%m-%Y'), moment.strftime('%H:%M'), asset.name, asset.isin, 'NSY', 'XNAS',
+                     quantity, price, 'USD', -quantity * price, 'USD', -quantity * price * 4, 'PLN', 4.0, -commission,
+                     'PLN', -quantity * price * 4 - commission, 'PLN', ''])
+    return write(rows)
+
+
+def trading212(trades):
+    rows = [['Action', 'Time', 'ISIN', 'Ticker', 'Name', 'No. of shares', 'Price / share', 'Currency (Price / share)',
+             'Exchange rate', 'Total (PLN)']]
+    for moment, asset, quantity, price, _ in trades:
+        rows.append(['Market buy', moment.strftime('%Y-%m-%d %H:%M:%S'), asset.isin, asset.ticker, asset.name, quantity,
+                     price, 'USD', 0.25, quantity * price * 4])
+    return write(rows)
+
+
+def exante(trades):
+    rows = [['Transaction ID', 'Account ID', 'Symbol ID', 'ISIN', 'Operation type', 'When', 'Sum', 'Asset']]
+    for i, (moment, asset, quantity, price, commission) in enumerate(trades):
+        when = moment.strftime('%Y-%m-%d %H:%M:%S')
+        rows.append([3 * i, 'BENCH', f'{asset.ticker}.NASDAQ', asset.isin, 'TRADE', when, float(quantity),
+                     f'{asset.ticker}.NASDAQ'])
+        rows.append([3 * i + 1, 'BENCH', f'{asset.ticker}.NASDAQ', asset.isin, 'TRADE', when,
+                     round(-quantity * price, 2), 'USD'])
+        rows.append([3 * i + 2, 'BENCH', f'{asset.ticker}.NASDAQ', asset.isin, 'COMMISSION', when, -commission, 'USD'])
+    return write(rows, delimiter='\t', quoting=csv.QUOTE_ALL)
+
+
+def dmbos(trades):
+    rows = [['Data', 'Walor', 'Liczba', 'K/S', 'Kurs', 'Wartosc', 'Prowizja', 'Rynek', 'Waluta', 'Kurs waluty']]
+    for moment, asset, quantity, price, commission in trades:
+        rows.append([moment.strftime('%Y-%m-%d'), asset.isin, quantity, 'K', f'{price * 4:.2f}'.replace('.', ','),
+                     f'{quantity * price * 4:.2f}'.replace('.', ','), f'{commission:.2f}'.replace('.', ','), 'US', 'USD',
+                     '4,0'])
+    return write(rows, delimiter=';')
+
+
+def write(rows, **kwargs):
+    file = io.StringIO()
+    csv.writer(file, **kwargs).writerows(rows)
+    return file.getvalue()
+
+
+BROKER_FILES = {
+    'degiro': degiro,
+    'trading212': trading212,
+    'exante': exante,
+    'dmbos': dmbos,
+}
+
+
+def convert(broker, content):
+    return import_service.get_strategy(broker, io.StringIO(content)).convert()
+
+
+@pytest.mark.parametrize('broker', BROKER_FILES.keys())
+def test_convert(bench, broker):
+    content = BROKER_FILES[broker](get_trades())
+    bench(convert, broker, content)
+
+
+def test_import_csv(bench, bench_account):
+    converted = convert('trading212', trading212(get_trades()))
+    content = converted.to_csv(header=False, index=False)
+    accounts = []
+
+    def new_account():
+        account = models.Account.objects.create(user=bench_account.user, name=f'Import {len(accounts)}')
+        models.AccountPreferences.objects.create(account=account, base_currency='PLN')
+        accounts.append(account)
+
+    bench(lambda: import_service.import_csv(io.StringIO(content), accounts[-1]), setup=new_account, rounds=1)
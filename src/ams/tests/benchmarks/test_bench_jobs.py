@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from ams import models
+from ams.services import stock_balance_service, history_service, trading_calendar_service
+
+
+def get_price_update_time():
+    """
+    Returns the moment update_stock_price picks up the US close of the last weekday.
+    """
+    day = datetime.now().date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    for utc_hour, closing in trading_calendar_service.get_close_schedule(day).items():
+        if any(exchange.code == 'US' for exchange, _ in closing):
+            return utc_hour + stock_balance_service.PRICE_UPDATE_DELAY + timedelta(hours=1)
+
+
+def test_update_stock_price(bench):
+    bench(stock_balance_service.update_stock_price, get_price_update_time(), rounds=1)
+
+
+def get_yesterday():
+    return datetime.now().date() - timedelta(days=1)
+
+
+def test_save_account_history(bench):
+    bench(history_service.save_account_history,
+          setup=lambda: models.AccountHistory.objects.filter(date=get_yesterday()).delete())
+
+
+def test_save_stock_balance_history(bench):
+    # generated accounts have no histories yet, so every run appends a first day for each balance
+    bench(history_service.save_stock_balance_history,
+          setup=lambda: models.AssetBalanceHistory.objects.filter(valid_from=get_yesterday()).delete())
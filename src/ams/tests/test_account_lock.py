@@ -0,0 +1,64 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from django.db import connection, transaction
+
+from ams import models
+from ams.services import account_lock, stock_balance_service, unit_of_work
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unit_of_work_reloads_fields_written_while_it_waited(account):
+    saved_at = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    locked = threading.Event()
+
+    def write_while_locked():
+        try:
+            with transaction.atomic():
+                account_lock.lock(account.id)
+                locked.set()
+                # committed only once the unit of work below is waiting for the lock
+                time.sleep(0.5)
+                models.Account.objects.filter(id=account.id).update(last_save_date=saved_at)
+        finally:
+            connection.close()
+
+    writer = threading.Thread(target=write_while_locked)
+    writer.start()
+    try:
+        assert locked.wait(10)
+        with unit_of_work.atomic(account):
+            assert account.last_save_date == saved_at
+    finally:
+        writer.join()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sweeper_leaves_accounts_locked_by_a_rebuild_in_flight(account):
+    models.DirtyBalance.objects.create(account=account, dirty_from=(datetime.now() - timedelta(days=3)).date())
+    locked = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        try:
+            with transaction.atomic():
+                account_lock.lock(account.id)
+                locked.set()
+                release.wait(10)
+        finally:
+            connection.close()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    try:
+        assert locked.wait(10)
+        stock_balance_service.rebuild_all_dirty_balances()
+        assert models.DirtyBalance.objects.filter(account=account).exists()
+    finally:
+        release.set()
+        holder.join()
+
+    stock_balance_service.rebuild_all_dirty_balances()
+    assert not models.DirtyBalance.objects.exists()
@@ -0,0 +1,84 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from ams import models
+from ams.services import asset_history_service, stock_balance_service
+
+
+def get_intervals(account):
+    return list(models.AssetBalanceHistory.objects.filter(account=account).order_by('valid_from')
+                .values_list('valid_from', 'valid_to', 'quantity', 'price'))
+
+
+def test_append_day_splits_only_on_change():
+    to_save = []
+    history = None
+    days = [(10, Decimal('5.00')), (10, Decimal('5.00')), (10, Decimal('5.00')), (10, Decimal('6.00')),
+            (12, Decimal('6.00'))]
+    start = datetime.date(2024, 1, 1)
+    for i, (quantity, price) in enumerate(days):
+        history = asset_history_service.append_day(history, to_save, None, 1, start + datetime.timedelta(days=i),
+                                                   quantity, price, Decimal('0'))
+
+    assert [(h.valid_from.day, h.valid_to.day, h.quantity) for h in to_save] == [(1, 3, 10), (4, 4, 10), (5, 5, 12)]
+
+
+def test_expand_history_respects_bounds():
+    to_save = []
+    asset_history_service.append_day(None, to_save, None, 1, datetime.date(2024, 1, 1), 1, Decimal('1'),
+                                     Decimal('0'))
+    to_save[0].valid_to = datetime.date(2024, 1, 10)
+
+    dtos = list(asset_history_service.expand_history(to_save[0], datetime.date(2024, 1, 3), datetime.date(2024, 1, 5)))
+
+    assert [dto.date.day for dto in dtos] == [3, 4, 5]
+
+
+@pytest.mark.django_db
+def test_cut_history_drops_intervals_from_the_rebuild_date(account):
+    start = datetime.date(2024, 1, 1)
+    for first_day, last_day in [(0, 2), (3, 5), (6, 8)]:
+        models.AssetBalanceHistory.objects.create(account=account, asset_id=1,
+                                                  valid_from=start + datetime.timedelta(days=first_day),
+                                                  valid_to=start + datetime.timedelta(days=last_day), quantity=1,
+                                                  price=first_day, result=0)
+
+    history = asset_history_service.cut_history(account, 1, datetime.date(2024, 1, 5))
+
+    assert (history.valid_from, history.valid_to) == (datetime.date(2024, 1, 4), datetime.date(2024, 1, 4))
+    assert [(valid_from.day, valid_to.day) for valid_from, valid_to, *_ in get_intervals(account)] == [(1, 3), (4, 6)]
+    assert asset_history_service.cut_history(account, 1, datetime.date(2024, 1, 1)) is None
+    assert not models.AssetBalanceHistory.objects.exists()
+
+
+@pytest.mark.django_db
+def test_rebuild_from_a_later_date_keeps_the_history_of_a_full_rebuild(account):
+    today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for days_ago, transaction_type, quantity, price in [(10, 'buy', 5, 10), (6, 'price', 0, 12), (3, 'sell', 2, 12)]:
+        models.AssetTransaction.objects.create(account=account, asset_id=1, transaction_type=transaction_type,
+                                               quantity=quantity, price=price,
+                                               date=today - datetime.timedelta(days=days_ago))
+    stock_balance = models.AssetBalance.objects.create(account=account, asset_id=1, quantity=0, price=0, result=0,
+                                                       average_price=0)
+
+    stock_balance_service.rebuild_stock_balance(stock_balance, (today - datetime.timedelta(days=10)).date())
+    full_rebuild = get_intervals(account)
+    stock_balance_service.rebuild_stock_balance(stock_balance, (today - datetime.timedelta(days=5)).date())
+
+    assert [(quantity, price) for *_, quantity, price in full_rebuild] == [(5, 0), (5, 12), (3, 12)]
+    assert full_rebuild[-1][1] == (today - datetime.timedelta(days=1)).date()
+    assert get_intervals(account) == full_rebuild
+    assert models.AssetBalance.objects.get(id=stock_balance.id).quantity == 3
+
+
+@pytest.mark.django_db
+def test_history_rejects_malformed_dates(client):
+    client.post('/api/accounts', {'name': 'Main account'}, format='json')
+    account_id = client.get('/api/accounts').data[0]['id']
+
+    response = client.get(f'/api/stock_balances/{account_id}/1/history', {'from': '2024-13-01'})
+
+    assert response.status_code == 400
+    assert client.get(f'/api/stock_balances/{account_id}/1/history', {'from': '2024-03-01'}).status_code == 200
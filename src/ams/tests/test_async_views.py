@@ -0,0 +1,51 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+
+
+@pytest.fixture
+def get(client, eod_stub_url):
+    authorization = client._credentials['HTTP_AUTHORIZATION']
+
+    def get(path, params=None, authorized=True):
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorized else {}
+        return async_to_sync(AsyncClient().get)(path, params or {}, **headers)
+
+    return get
+
+
+@pytest.mark.django_db
+def test_async_views_require_authentication(get):
+    for path in ['/api/search', '/api/get_stock_details', '/api/get_stock_history', '/api/get_stock_news']:
+        assert get(path, authorized=False).status_code == 401
+
+
+@pytest.mark.django_db
+def test_stock_search(get):
+    response = get('/api/search', {'query_string': 'AAPL'})
+
+    assert response.status_code == 200
+    assert 'AAPL' in [result['Code'] for result in response.json()]
+
+
+@pytest.mark.django_db
+def test_stock_details(get):
+    response = get('/api/get_stock_details', {'stock': 'AAPL', 'exchange': 'US', 'from': '2024-03-01',
+                                              'to': '2024-03-08'})
+
+    assert response.status_code == 200
+    assert 'exchange_info' in response.json()
+
+
+@pytest.mark.django_db
+def test_stock_history(get):
+    assert get('/api/get_stock_history', {'stock': 'AAPL', 'exchange': 'US'}).status_code == 200
+
+
+@pytest.mark.django_db
+def test_stock_news(get):
+    response = get('/api/get_stock_news', {'stock': 'AAPL.US'})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+    assert all(news['title'].startswith('AAPL.US') for news in response.json())
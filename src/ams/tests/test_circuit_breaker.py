@@ -0,0 +1,53 @@
+from datetime import date
+
+import pytest
+from django.core.cache import cache
+
+from ams.services import circuit_breaker, eod_client, rate_limiter
+
+
+def test_circuit_opens_after_failures_and_closes_after_probe(monkeypatch):
+    now = 1_700_000_000.0
+    monkeypatch.setattr(circuit_breaker.time, 'time', lambda: now)
+    stale_key = circuit_breaker.get_stale_key('/real-time/AAPL.US', {'api_token': 'secret'})
+    circuit_breaker.record_success('/real-time/AAPL.US', stale_key, {'close': 1}, 0.1)
+
+    for _ in range(circuit_breaker.FAILURE_THRESHOLD):
+        circuit_breaker.record_failure(now)
+
+    assert circuit_breaker.get_state(now) == circuit_breaker.OPEN
+    allowed, stale = circuit_breaker.check(stale_key)
+    assert not allowed and stale['data'] == {'close': 1}
+
+    now += circuit_breaker.OPEN_SECONDS
+    allowed, stale = circuit_breaker.check(stale_key)
+    assert allowed and stale['data'] == {'close': 1}
+    assert circuit_breaker.check(stale_key)[0] is False
+
+    circuit_breaker.record_success('/real-time/AAPL.US', stale_key, {'close': 2}, 0.1)
+    assert circuit_breaker.get_state(now) == circuit_breaker.CLOSED
+
+
+def test_batch_price_changes_raise_while_the_circuit_is_open():
+    circuit_breaker.trip()
+    try:
+        with rate_limiter.priority(rate_limiter.BATCH):
+            with pytest.raises(circuit_breaker.CircuitOpenException):
+                eod_client.run(eod_client.get_price_changes('AAPL', 'US', date(2024, 3, 1), date(2024, 3, 8)))
+            with pytest.raises(circuit_breaker.CircuitOpenException):
+                eod_client.run(eod_client.get_price_changes_many([('AAPL', 'US', date(2024, 3, 1), date(2024, 3, 8))]))
+    finally:
+        cache.delete(circuit_breaker.OPENED_AT_KEY)
+
+
+def test_last_known_good_values_are_kept_only_for_bounded_interactive_reads():
+    def record(path, priority=rate_limiter.INTERACTIVE):
+        stale_key = circuit_breaker.get_stale_key(path, {})
+        with rate_limiter.priority(priority):
+            circuit_breaker.record_success(path, stale_key, [], 0.1)
+        return circuit_breaker.get_stale(stale_key)
+
+    assert record('/real-time/AAPL.US') is not None
+    assert record('/search/apple') is not None
+    assert record('/real-time/MSFT.US', rate_limiter.BATCH) is None
+    assert record('/eod/AAPL.US') is None
@@ -0,0 +1,41 @@
+from datetime import date, datetime
+
+import pytest
+from django.contrib.auth.models import User
+
+from ams import models
+from ams.services import deletion_service
+
+
+def test_every_model_referencing_account_is_deleted_with_it():
+    referencing = {relation.related_model for relation in models.Account._meta.related_objects}
+
+    assert referencing <= set(deletion_service.ACCOUNT_DEPENDENT_MODELS) | {models.AccountHistory}
+
+
+@pytest.mark.django_db
+def test_delete_account_removes_every_dependent_row():
+    user = User.objects.create_user(username='deleted', password='password')
+    account, kept = [models.Account.objects.create(user=user, name=name) for name in ['deleted', 'kept']]
+    for owner in [account, kept]:
+        history = models.AccountHistory.objects.create(account=owner, date=date(2024, 3, 1))
+        models.AccountHistoryBalance.objects.create(account_history=history, amount=10, currency='PLN')
+        models.AccountTransaction.objects.create(account=owner, type=models.AccountTransaction.DEPOSIT, amount=10,
+                                                 currency='PLN', date=datetime(2024, 3, 1))
+        models.AccountBalance.objects.create(account=owner, currency='PLN', amount=10)
+        models.AccountPreferences.objects.create(account=owner, base_currency='PLN')
+        models.AssetTransaction.objects.create(account=owner, asset_id=1, quantity=1, price=10, transaction_type='buy',
+                                               date=datetime(2024, 3, 1))
+        models.AssetBalance.objects.create(account=owner, asset_id=1, quantity=1, price=10, result=0, average_price=10)
+        models.AssetBalanceHistory.objects.create(account=owner, asset_id=1, valid_from=date(2024, 3, 1),
+                                                  valid_to=date(2024, 3, 2), quantity=1, price=10, result=0)
+        models.DirtyBalance.objects.create(account=owner, dirty_from=date(2024, 3, 1))
+
+    deletion_service.delete_account(account.id)
+
+    assert not models.Account.all_objects.filter(id=account.id).exists()
+    assert not models.AccountHistoryBalance.objects.filter(account_history__account_id=account.id).exists()
+    for model in [models.AccountHistory, *deletion_service.ACCOUNT_DEPENDENT_MODELS]:
+        assert not model.objects.filter(account_id=account.id).exists(), model.__name__
+        assert model.objects.filter(account_id=kept.id).exists(), model.__name__
+    assert models.AccountHistoryBalance.objects.filter(account_history__account_id=kept.id).exists()
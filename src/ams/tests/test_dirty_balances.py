@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from ams import models
+from ams.services import account_balance_service, dirty_balance_service, stock_balance_service
+
+
+@pytest.fixture
+def lazy_rebuild(monkeypatch):
+    monkeypatch.setattr(dirty_balance_service, 'LAZY_REBUILD', True)
+    monkeypatch.setattr(stock_balance_service, 'LAZY_REBUILD', True)
+
+
+@pytest.mark.django_db
+def test_deferred_writes_are_rebuilt_once_from_the_earliest_date(lazy_rebuild, account):
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    for days_ago in [2, 5, 3]:
+        deposit = models.AccountTransaction.objects.create(account=account, type=models.AccountTransaction.DEPOSIT,
+                                                           amount=100, currency='PLN',
+                                                           date=today - timedelta(days=days_ago))
+        account_balance_service.add_transaction_to_account_balance(deposit, account)
+
+    dirty = models.DirtyBalance.objects.get(account=account)
+    assert (dirty.asset_id, dirty.dirty_from) == (None, (today - timedelta(days=5)).date())
+    assert not models.AccountBalance.objects.filter(account=account).exists()
+
+    stock_balance_service.refresh_balances([account])
+
+    assert models.AccountBalance.objects.get(account=account).amount == 300
+    assert not models.DirtyBalance.objects.exists()
+
+
+@pytest.mark.django_db
+def test_deferred_sells_are_checked_against_the_quantity_held(account):
+    dates = [datetime(2024, 3, 1), datetime(2024, 3, 5)]
+    for transaction_type, quantity, date in zip(['buy', 'sell'], [5, 6], dates):
+        models.AssetTransaction.objects.create(account=account, asset_id=1, transaction_type=transaction_type,
+                                               quantity=quantity, price=10, date=date)
+
+    with pytest.raises(stock_balance_service.NotEnoughStockException):
+        stock_balance_service.check_quantity(account, 1)
+
+
+@pytest.mark.django_db
+def test_prices_update_clean_balances_and_leave_dirty_ones_to_the_rebuild(lazy_rebuild, account):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for asset_id in [1, 2]:
+        models.AssetBalance.objects.create(account=account, asset_id=asset_id, quantity=5, price=10, result=0,
+                                           average_price=10, last_save_date=(today - timedelta(days=1)).date(),
+                                           first_event_date=(today - timedelta(days=30)).date(),
+                                           last_transaction_date=today - timedelta(days=1))
+    dirty_balance_service.mark_dirty(account.id, 2, (today - timedelta(days=3)).date())
+
+    for asset_id in [1, 2]:
+        price = models.AssetTransaction.objects.create(account=account, asset_id=asset_id, quantity=0, price=12,
+                                                       transaction_type=models.AssetTransaction.PRICE, date=today)
+        stock_balance_service.add_stock_transaction_to_balance(price, None, account)
+
+    assert models.AssetBalance.objects.get(account=account, asset_id=1).price == 12
+    assert models.AssetBalance.objects.get(account=account, asset_id=2).price == 10
+    assert list(models.DirtyBalance.objects.values_list('asset_id', flat=True)) == [2]
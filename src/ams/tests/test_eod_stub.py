@@ -0,0 +1,26 @@
+import json
+import threading
+import urllib.request
+from datetime import date
+
+from ams.devtools import eod_stub
+
+
+def test_stub_serves_deterministic_prices():
+    server = eod_stub.make_server(port=0, config=eod_stub.StubConfig(today=date(2024, 1, 10)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    try:
+        with urllib.request.urlopen(f'{base_url}/eod/AAPL.US?from=2024-01-05&to=2024-01-08') as response:
+            prices = json.load(response)
+        with urllib.request.urlopen(f'{base_url}/real-time/AAPL.US?s=EURUSD.FOREX') as response:
+            quotes = json.load(response)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [price['date'] for price in prices] == ['2024-01-05', '2024-01-08']
+    assert prices[0]['adjusted_close'] == eod_stub.get_price('AAPL.US', date(2024, 1, 5))
+    assert [quote['code'] for quote in quotes] == ['AAPL.US', 'EURUSD.FOREX']
+    assert quotes[0]['close'] == eod_stub.get_price('AAPL.US', date(2024, 1, 10))
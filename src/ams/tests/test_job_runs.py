@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from ams import models
+from ams.services import job_run_service, tracing
+
+NOW = datetime(2024, 3, 15, 12, 0)
+
+
+def create_run(task_name, started_at, duration, arguments='[[], {}]', status=models.JobRun.SUCCESS):
+    return models.JobRun.objects.create(task_name=task_name, task_id=f'{task_name}-{started_at}', arguments=arguments,
+                                        status=status, started_at=started_at, duration=duration)
+
+
+@pytest.mark.django_db
+def test_trends_report_cadence_and_schedule_usage():
+    for hour in range(6):
+        create_run('ams.tasks.update_stock_price_task', NOW - timedelta(hours=hour + 1), 60.0 * (hour + 1))
+    # runs with other arguments interleave but must not shorten the cadence
+    for hour in range(3):
+        create_run('ams.tasks.update_stock_price_task', NOW - timedelta(hours=hour + 1, minutes=30), 10.0,
+                   arguments='[[1], {}]', status=models.JobRun.FAILURE)
+
+    trends = job_run_service.get_trends(days=1, now=NOW)['ams.tasks.update_stock_price_task']
+
+    assert trends['runs'] == 9
+    assert trends['failures'] == 3
+    assert trends['cadence_seconds'] == 3600
+    assert trends['max_duration'] == 360.0
+    assert trends['schedule_usage'] == pytest.approx(0.1)
+
+
+@pytest.mark.django_db
+def test_runs_record_trace_counts_and_overlaps():
+    job_run_service.start_run('first', 'ams.tasks.save_account_history', [], {})
+    job_run_service.start_run('second', 'ams.tasks.save_account_history', [], {})
+    tracing.record_query('INSERT', 4)
+    tracing.record_upstream_call()
+    job_run_service.finish_run('second', 'SUCCESS')
+    job_run_service.finish_run('first', 'FAILURE', ValueError('no prices'))
+
+    first, second = models.JobRun.objects.order_by('id')
+    assert not first.overlapped and second.overlapped
+    assert (second.status, second.rows_written, second.upstream_calls) == (models.JobRun.SUCCESS, 4, 1)
+    assert first.status == models.JobRun.FAILURE and 'no prices' in first.error
+    assert tracing.TRACE.get() is None
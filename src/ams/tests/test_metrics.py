@@ -0,0 +1,56 @@
+import pytest
+from django.test import Client
+from prometheus_client import REGISTRY, generate_latest
+
+from ams import views
+from ams.services import metrics, rate_limiter
+
+
+def test_queries_are_grouped_by_statement():
+    def execute(sql, params, many, context):
+        return sql
+
+    with metrics.track_queries() as stats:
+        metrics.record_query(execute, 'SELECT 1', None, False, {})
+        metrics.record_query(execute, '  select 2', None, False, {})
+        metrics.record_query(execute, 'INSERT INTO ams_account VALUES (1)', None, False, {})
+        metrics.record_query(execute, 'SAVEPOINT s1', None, False, {})
+
+    assert stats.count == 4
+    assert {statement: count for statement, (count, _) in stats.queries.items()} == \
+           {'SELECT': 2, 'INSERT': 1, 'OTHER': 1}
+    assert metrics.QUERY_STATS.get() is None
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_requires_token(monkeypatch):
+    client = Client()
+    monkeypatch.setattr(views, 'METRICS_TOKEN', None)
+    assert client.get('/metrics').status_code == 403
+
+    monkeypatch.setattr(views, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+    assert response.status_code == 200
+    assert b'ams_request_duration_seconds' in response.content
+
+
+def test_eod_usage_of_every_process_is_read_from_the_shared_counters():
+    rate_limiter.reserve('/eod/AAPL.US')
+
+    families = {family.name: family for family in metrics.EodUsageCollector().collect()}
+
+    assert families['ams_eod_daily_calls'].samples[0].value == 1
+    endpoint_calls = {sample.labels['endpoint']: sample.value
+                      for sample in families['ams_eod_daily_endpoint_calls'].samples}
+    assert endpoint_calls['eod'] == 1
+
+
+@pytest.mark.django_db
+def test_multiprocess_registry_keeps_the_shared_collectors(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, 'PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+
+    registry = metrics.get_registry()
+
+    assert registry is not REGISTRY
+    assert b'ams_eod_daily_calls' in generate_latest(registry)
@@ -0,0 +1,39 @@
+import random
+from datetime import date
+
+import pytest
+
+from ams import models
+from ams.devtools import portfolio_generator
+
+
+def simulate(seed):
+    exchange = models.Exchange(id=1, code='US')
+    assets = [models.Asset(id=i, ticker=f'SYN{i:04d}', exchange=exchange, currency='USD', type='STOCK')
+              for i in range(1, 6)]
+    account = models.Account(id=1, name='Account 1')
+    return portfolio_generator.AccountSimulation(random.Random(seed), account, assets, [1, 1 / 2, 1 / 3, 1 / 4, 1 / 5],
+                                                 date(2020, 1, 1), date(2023, 1, 1), 20).run()
+
+
+def test_simulation_is_deterministic_and_never_overdraws():
+    first, second = simulate(7), simulate(7)
+
+    def describe(simulation):
+        return [(day, event.type, event.amount) for day, event, _ in simulation.events]
+
+    assert describe(first) == describe(second)
+    assert all(balance.amount >= 0 for balance in first.get_account_balances())
+    assert all(balance.quantity >= 0 for balance in first.get_asset_balances())
+
+
+@pytest.mark.django_db
+def test_generate_over_the_default_exchanges():
+    stats = portfolio_generator.generate(users=1, accounts_per_user=1, assets=3, years=1, trades_per_year=4, seed=1,
+                                         prefix='generated', with_prices=False)
+
+    assets = list(models.Asset.objects.select_related('exchange').order_by('id'))
+    assert stats['assets'] == 3
+    assert [(asset.ticker, asset.exchange.code) for asset in assets] == [('SYN0000', 'US'), ('SYN0001', 'WAR'),
+                                                                         ('S0002-USD', 'CC')]
+    assert models.AssetTransaction.objects.filter(account__user__username='generated_0').exists()
@@ -0,0 +1,65 @@
+import marshal
+import os
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ams import models
+from ams.services import profiler
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_collapses_stacks_of_the_profiled_thread():
+    with profiler.profile(models.RequestProfile.SAMPLE) as session:
+        busy_wait(0.1)
+
+    lines = session.dump().decode().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any('busy_wait (ams/tests/test_profiler.py' in line for line in lines)
+
+
+def get_authorization(is_staff):
+    user = User.objects.create_user(username=f'profiled_{is_staff}', password='password', is_staff=is_staff)
+    return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+
+def get_client(is_staff):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=get_authorization(is_staff))
+    return client
+
+
+@pytest.mark.django_db
+def test_only_staff_can_profile_a_request():
+    get_client(is_staff=False).get('/api/accounts', HTTP_X_PROFILE='cprofile')
+    assert not models.RequestProfile.objects.exists()
+
+    staff = get_client(is_staff=True)
+    staff.get('/api/accounts', HTTP_X_PROFILE='cprofile')
+    profile = models.RequestProfile.objects.get()
+    assert (profile.route, profile.status_code, profile.sampled) == ('account-list', 200, False)
+
+    assert [listed['id'] for listed in staff.get('/api/profiles').json()] == [profile.id]
+    download = staff.get(f'/api/profiles/{profile.id}')
+    assert download['Content-Disposition'] == f'attachment; filename="profile-{profile.id}.prof"'
+    assert marshal.loads(download.content)
+
+
+@pytest.mark.django_db
+def test_sync_views_served_over_asgi_are_profiled_in_the_view_thread():
+    response = async_to_sync(AsyncClient().get)('/api/accounts', HTTP_AUTHORIZATION=get_authorization(is_staff=True),
+                                                HTTP_X_PROFILE='cprofile')
+
+    assert response.status_code == 200
+    stats = marshal.loads(bytes(models.RequestProfile.objects.get().data))
+    assert any(filename.endswith(os.path.join('ams', 'views.py')) for filename, _, _ in stats)
@@ -0,0 +1,170 @@
+from collections import Counter
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.urls import URLResolver
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ams import models, urls
+from ams.devtools import portfolio_generator
+from ams.services import stock_balance_service, account_balance_service, query_log
+
+# Path and SQL query budget of every GET route in ams/urls.py, keyed by URL name. Counts are taken on a warm
+# request, after a first one filled the caches, and must not grow between the two dataset sizes.
+ENDPOINT_BUDGETS = {
+    'api-root': ('/api/', 1),
+    'account-list': ('/api/accounts', 7),
+    'account-detail': ('/api/accounts/{account_id}', 7),
+    'account-get-preferences': ('/api/accounts/{account_id}/get_preferences', 3),
+    'transaction-list': ('/api/accounts/{account_id}/transactions', 3),
+    'exchange-list': ('/api/exchanges', 2),
+    'stock-list': ('/api/stocks', 2),
+    'stocks_by_exchange-list': ('/api/stocks/{exchange_id}', 2),
+    'stock_transaction-list': ('/api/stock/{account_id}/transaction', 3),
+    'stock_balance-list': ('/api/stock_balances/{account_id}', 3),
+    'stock_balance-dto': ('/api/stock_balances/{account_id}/{asset_id}/dto', 4),
+    'stock_balance-list-dto': ('/api/stock_balances/{account_id}/list_dto', 4),
+    'stock_balance-history': ('/api/stock_balances/{account_id}/{asset_id}/history', 3),
+    'stock_balance-price': ('/api/stock_balances/{account_id}/{asset_id}/price', 4),
+    'favourite_assets-list': ('/api/favourite_assets', 2),
+    'favourite_assets-detail': ('/api/favourite_assets/{favourite_id}', 2),
+    'api-search': ('/api/search?query_string={stock}', 3),
+    'get_stock_details': ('/api/get_stock_details?stock={stock}&exchange={exchange}', 2),
+    'get_stock_history': ('/api/get_stock_history?stock={stock}&exchange={exchange}', 3),
+    'favourite_quotes': ('/api/quotes/favourites', 2),
+    'account_quotes': ('/api/quotes/accounts/{account_id}', 3),
+    'get_stock_news': ('/api/get_stock_news?stock={stock}.{exchange}', 1),
+    'eod_quota': ('/api/eod_quota', 1),
+    'job_runs': ('/api/job_runs', 2),
+    'slow_queries': ('/api/slow_queries', 1),
+    'profiles': ('/api/profiles', 2),
+    'profile_download': ('/api/profiles/{profile_id}', 2),
+    'account_history': ('/api/accounts/{account_id}/history', 7),
+}
+
+DATASETS = {
+    'small': {'accounts_per_user': 1, 'assets': 3, 'years': 1, 'trades_per_year': 12, 'favourites': 1},
+    'large': {'accounts_per_user': 3, 'assets': 12, 'years': 2, 'trades_per_year': 48, 'favourites': 6},
+}
+
+
+def get_routes(patterns=None):
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            yield from get_routes(pattern.url_patterns)
+        else:
+            yield pattern.name, pattern.callback
+
+
+def allows_get(callback):
+    if hasattr(callback, 'actions'):
+        return 'get' in callback.actions
+    view_class = getattr(callback, 'view_class', None)
+    if view_class is not None:
+        return hasattr(view_class, 'get')
+    # plain async views only answer GET
+    return True
+
+
+def get_get_routes():
+    return {name for name, callback in get_routes() if allows_get(callback)}
+
+
+class QueryRecorder:
+    """
+    Counts the queries run on the connection by the innermost frame of project code that issued them.
+    """
+
+    def __init__(self):
+        self.call_sites = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # starts above this wrapper, which is project code itself
+        self.call_sites[query_log.get_call_site(depth=2)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return sum(self.call_sites.values())
+
+
+def build_dataset(prefix, size):
+    portfolio_generator.generate(users=1, accounts_per_user=size['accounts_per_user'], assets=size['assets'],
+                                 years=size['years'], trades_per_year=size['trades_per_year'], seed=42, prefix=prefix)
+    user = User.objects.get(username=f'{prefix}_0')
+    user.is_staff = True
+    user.save(update_fields=['is_staff'])
+
+    accounts = list(models.Account.objects.filter(user=user).order_by('id'))
+    for account in accounts:
+        rebuild_date = models.AccountTransaction.objects.filter(account=account).earliest('date').date.date()
+        for stock_balance in models.AssetBalance.objects.filter(account=account).select_related('account'):
+            stock_balance_service.rebuild_stock_balance(stock_balance, rebuild_date)
+        account_balance_service.rebuild_account_balance(account, rebuild_date)
+
+    stock_balance = models.AssetBalance.objects.filter(account=accounts[0]).order_by('asset_id').first()
+    asset = models.Asset.objects.select_related('exchange').get(id=stock_balance.asset_id)
+    # favourites are unique per symbol across users, so each dataset takes symbols nobody favourited yet
+    taken = set(models.FavoriteAsset.objects.values_list('code', 'exchange'))
+    assets = [asset for asset in models.Asset.objects.filter(ticker__startswith='SYN').select_related('exchange')
+              .order_by('ticker') if (asset.ticker, asset.exchange.code) not in taken]
+    favourites = models.FavoriteAsset.objects.bulk_create(
+        [models.FavoriteAsset(user=user, code=favourite.ticker, exchange=favourite.exchange.code)
+         for favourite in assets[:size['favourites']]])
+    profile = models.RequestProfile.objects.create(method='GET', path='/api/accounts', route='account-list',
+                                                   status_code=200, duration=0.1,
+                                                   mode=models.RequestProfile.SAMPLE, data=b'main 1')
+    return user, {
+        'account_id': accounts[0].id,
+        'asset_id': asset.id,
+        'exchange_id': asset.exchange_id,
+        'favourite_id': favourites[0].id,
+        'profile_id': profile.id,
+        'stock': asset.ticker,
+        'exchange': asset.exchange.code,
+    }
+
+
+def measure(user, values):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    recorders = dict()
+    for name, (path, _) in ENDPOINT_BUDGETS.items():
+        path = path.format(**values)
+        assert client.get(path).status_code == 200, f'{name} failed on {path}'
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            client.get(path)
+        recorders[name] = recorder
+    return recorders
+
+
+def describe(call_sites):
+    return '\n'.join(f'    {count:>4} {site}' for site, count in call_sites.most_common())
+
+
+def test_every_get_route_has_a_budget():
+    assert get_get_routes() - set(ENDPOINT_BUDGETS) == set()
+    assert set(ENDPOINT_BUDGETS) - get_get_routes() == set()
+
+
+@pytest.mark.django_db
+def test_query_counts_stay_within_budget(eod_stub_url):
+    small = measure(*build_dataset('small', DATASETS['small']))
+    large = measure(*build_dataset('large', DATASETS['large']))
+
+    failures = []
+    for name, (_, budget) in ENDPOINT_BUDGETS.items():
+        if large[name].count > small[name].count:
+            grown = Counter({site: count - small[name].call_sites[site]
+                             for site, count in large[name].call_sites.items()
+                             if count > small[name].call_sites[site]})
+            failures.append(f'{name}: {small[name].count} queries on the small dataset, {large[name].count} on the '
+                            f'large one, grown at\n{describe(grown)}')
+        elif large[name].count > budget:
+            failures.append(f'{name}: {large[name].count} queries over the budget of {budget}\n'
+                            f'{describe(large[name].call_sites)}')
+    assert not failures, '\n'.join(failures)
@@ -0,0 +1,27 @@
+from ams.services import metrics, query_log
+
+
+def execute(sql, params, many, context):
+    return sql
+
+
+def run_query(sql):
+    metrics.record_query(execute, sql, None, False, {})
+
+
+def test_sql_is_normalized():
+    assert query_log.normalize_sql("SELECT *  FROM ams_asset WHERE id IN (%s, %s, %s) AND ticker = 'A''B' LIMIT 21") \
+           == 'SELECT * FROM ams_asset WHERE id IN (...) AND ticker = ? LIMIT ?'
+
+
+def test_queries_are_attributed_to_their_call_site(monkeypatch, caplog):
+    query_log.reset()
+    for asset_id in range(3):
+        run_query(f'SELECT * FROM ams_asset WHERE id = {asset_id}')
+    monkeypatch.setattr(query_log, 'SLOW_QUERY_SECONDS', 0)
+    run_query('UPDATE ams_asset SET ticker = %s')
+
+    [stats] = query_log.get_report()['call_sites']
+    assert stats['call_site'].startswith('ams/tests/test_query_log.py:') and stats['call_site'].endswith('in run_query')
+    assert (stats['count'], stats['slow'], stats['sql']) == (4, 1, 'SELECT * FROM ams_asset WHERE id = ?')
+    assert 'Slow query' in caplog.text and 'UPDATE ams_asset SET ticker = ?' in caplog.text
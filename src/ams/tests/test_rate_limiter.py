@@ -0,0 +1,27 @@
+import pytest
+
+from ams.services import rate_limiter
+
+
+def test_batch_requests_leave_headroom_for_interactive(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'EOD_RATE_LIMIT_PER_MINUTE', 10)
+    monkeypatch.setattr(rate_limiter, 'EOD_DAILY_QUOTA', 1000)
+    now = 1_699_999_990.0
+
+    with rate_limiter.priority(rate_limiter.BATCH):
+        for _ in range(8):
+            assert rate_limiter.reserve('/eod/AAPL.US', now=now) == 0
+        assert rate_limiter.reserve('/eod/AAPL.US', now=now) == 50.0
+
+    assert rate_limiter.reserve('/real-time/AAPL.US', {'s': 'MSFT.US'}, now=now) == 0
+    assert rate_limiter.reserve('/eod/AAPL.US', now=now) > 0
+    assert rate_limiter.get_usage(now)['endpoints']['real-time'] == 2
+    assert rate_limiter.get_usage(now)['throttled'] == 2
+
+
+def test_interactive_requests_fail_instead_of_waiting_for_the_window(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'reserve', lambda path, params=None: 30.0)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda wait: pytest.fail('interactive request waited'))
+
+    with pytest.raises(rate_limiter.TooManyRequestsException):
+        rate_limiter.acquire('/real-time/AAPL.US')
@@ -0,0 +1,36 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+
+from ams import models
+from ams.services import eod_client, search_service, trading_calendar_service
+
+
+@pytest.fixture
+def symbols(monkeypatch):
+    monkeypatch.setattr(trading_calendar_service, 'EXCHANGE_CACHE', {})
+    exchange = models.Exchange.objects.create(name='NYSE', mic='XNYS', code='US')
+    for code, name in [('BRK.B', 'Berkshire Hathaway Inc'), ('BRKR', 'Bruker Corp'), ('AAPL', 'Apple Inc')]:
+        models.ExchangeSymbol.objects.create(exchange=exchange, code=code, name=name, type='Common Stock')
+
+
+@pytest.mark.django_db
+def test_search_local_matches_codes_names_and_exchanges(symbols):
+    assert {result['Code'] for result in search_service.search_local('brk')} == {'BRK.B', 'BRKR'}
+    assert [result['Code'] for result in search_service.search_local('AAPL.US')] == ['AAPL']
+    assert [result['Code'] for result in search_service.search_local('BRK.B')] == ['BRK.B']
+    assert search_service.search_local('Apple Inc')[0]['Code'] == 'AAPL'
+
+
+@pytest.mark.django_db
+def test_search_falls_back_to_eod_and_only_memoizes_results(symbols, eod_stub_url, monkeypatch):
+    results = async_to_sync(search_service.search)('MSFT')
+    assert 'MSFT' in [result['Code'] for result in results]
+    assert cache.get(search_service.get_search_cache_key('MSFT')) == results
+
+    async def no_results(query):
+        return []
+
+    monkeypatch.setattr(eod_client, 'search', no_results)
+    assert async_to_sync(search_service.search)('ZZZZ') == []
+    assert cache.get(search_service.get_search_cache_key('ZZZZ')) is None
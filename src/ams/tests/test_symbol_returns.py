@@ -0,0 +1,58 @@
+import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from ams import models
+from ams.services import symbol_returns_service
+
+
+def test_anchor_price_is_last_price_on_or_before_day():
+    dates = [datetime.date(2024, 1, 5), datetime.date(2024, 1, 8)]
+    prices = [Decimal('10'), Decimal('11')]
+
+    assert symbol_returns_service.get_anchor_price(dates, prices, datetime.date(2024, 1, 4)) is None
+    assert symbol_returns_service.get_anchor_price(dates, prices, datetime.date(2024, 1, 7)) == Decimal('10')
+    assert symbol_returns_service.get_anchor_price(dates, prices, datetime.date(2024, 1, 8)) == Decimal('11')
+
+
+def test_stock_history_combines_snapshot_with_quote():
+    snapshot = {field: Decimal('50') for field in symbol_returns_service.HORIZONS}
+    snapshot['first_price'] = Decimal('25')
+    snapshot['five_years_price'] = None
+
+    history = symbol_returns_service.build_stock_history(snapshot, {'close': 100.0, 'previousClose': 80.0})
+
+    assert history['today'] == 25.0
+    assert history['week'] == 100.0
+    assert history['five_years'] is None
+    assert history['all_time'] == 300.0
+
+
+@pytest.mark.django_db
+def test_snapshots_of_failed_fetches_are_not_stored(monkeypatch):
+    def fail(*args):
+        raise httpx.ConnectError('EOD unreachable')
+
+    cache_timeouts = []
+    monkeypatch.setattr(symbol_returns_service, 'update_price_series', fail)
+    monkeypatch.setattr(symbol_returns_service, 'cache',
+                        SimpleNamespace(set=lambda key, value, timeout: cache_timeouts.append(timeout)))
+
+    snapshot = symbol_returns_service.refresh_snapshot('AAPL', 'US', datetime.date(2024, 3, 8))
+
+    assert not symbol_returns_service.is_resolved(snapshot)
+    assert not models.SymbolReturnSnapshot.objects.exists()
+    assert cache_timeouts == [symbol_returns_service.UNRESOLVED_CACHE_TIMEOUT]
+
+
+@pytest.mark.django_db
+def test_symbols_without_prices_are_not_stored(monkeypatch):
+    monkeypatch.setattr(symbol_returns_service, 'update_price_series', lambda *args: None)
+    models.SymbolReturnSnapshot.objects.create(code='NOPE', exchange_code='US', as_of=datetime.date(2024, 3, 7))
+
+    symbol_returns_service.refresh_snapshot('NOPE', 'US', datetime.date(2024, 3, 8))
+
+    assert not models.SymbolReturnSnapshot.objects.exists()
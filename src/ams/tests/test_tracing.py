@@ -0,0 +1,29 @@
+from ams.services import tracing
+
+
+@tracing.traced
+def rebuild(rows):
+    tracing.record_query('SELECT', 1)
+    tracing.record_query('INSERT', rows)
+
+
+def test_spans_nest_and_aggregate_in_server_timing():
+    with tracing.start_trace('POST /api/stock/1/transaction') as trace:
+        with tracing.span('add_stock_transaction_to_balance'):
+            rebuild(3)
+            rebuild(2)
+
+    spans = trace.to_dict()['spans']
+    assert [(span['name'], span['parent'], span['queries'], span['rows']) for span in spans] == [
+        ('add_stock_transaction_to_balance', None, 4, 5),
+        ('rebuild', 0, 2, 3),
+        ('rebuild', 0, 2, 2),
+    ]
+    server_timing = trace.get_server_timing()
+    assert 'rebuild;dur=' in server_timing and 'desc="2x 4q"' in server_timing
+    assert 'desc="4q 5rows"' in server_timing
+
+
+def test_spans_outside_a_trace_do_nothing():
+    rebuild(1)
+    assert tracing.TRACE.get() is None
@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+import pytz
+
+from ams import models
+from ams.services import eod_service, stock_balance_service, trading_calendar_service
+
+
+def test_last_trading_day_skips_weekend_and_holidays(monkeypatch):
+    exchange = models.Exchange(id=1, code='WAR')
+    monkeypatch.setattr(trading_calendar_service, 'HOLIDAY_CACHE', {
+        exchange.id: {'holidays': {datetime.date(2024, 1, 1)}, 'time': datetime.datetime.now().date()}})
+
+    assert trading_calendar_service.get_last_trading_day(exchange, datetime.date(2024, 1, 1)) == \
+           datetime.date(2023, 12, 29)
+    assert trading_calendar_service.get_next_trading_day(exchange, datetime.date(2023, 12, 30)) == \
+           datetime.date(2024, 1, 2)
+
+
+def test_crypto_trades_every_day():
+    exchange = models.Exchange(id=2, code='CC')
+
+    assert trading_calendar_service.is_trading_day(exchange, datetime.date(2024, 1, 6))
+
+
+def test_forex_trades_on_weekdays_only():
+    exchange = models.Exchange(code='FOREX')
+
+    assert not trading_calendar_service.is_trading_day(exchange, datetime.date(2024, 1, 6))
+    assert trading_calendar_service.get_last_trading_day(exchange, datetime.date(2024, 1, 7)) == \
+           datetime.date(2024, 1, 5)
+
+
+def test_cache_timeout_follows_market_hours(monkeypatch):
+    exchange = models.Exchange(id=3, code='US', timezone='America/New_York', opening_hour=datetime.time(9, 30),
+                               closing_hour=datetime.time(16, 0))
+    monkeypatch.setattr(trading_calendar_service, 'HOLIDAY_CACHE', {
+        exchange.id: {'holidays': set(), 'time': datetime.datetime.now().date()}})
+
+    during_session = datetime.datetime(2024, 1, 8, 15, 0, tzinfo=pytz.UTC)
+    friday_evening = datetime.datetime(2024, 1, 5, 22, 0, tzinfo=pytz.UTC)
+
+    assert trading_calendar_service.get_cache_timeout(exchange, during_session) == \
+           trading_calendar_service.INTRADAY_CACHE_TIMEOUT
+    assert trading_calendar_service.get_cache_timeout(exchange, friday_evening) == (2 * 24 + 16) * 3600 + 30 * 60
+    assert trading_calendar_service.get_symbol_cache_timeout('EURUSD.FOREX', during_session) == \
+           trading_calendar_service.INTRADAY_CACHE_TIMEOUT
+    assert trading_calendar_service.get_symbol_cache_timeout('EURUSD.FOREX', friday_evening) == 2 * 24 * 3600
+
+
+@pytest.mark.django_db
+def test_close_schedule_indexes_sessions_by_their_utc_closing_day(monkeypatch):
+    monkeypatch.setattr(trading_calendar_service, 'CLOSE_SCHEDULE_CACHE', {})
+    for code, timezone, closing_hour in [('US', 'America/New_York', datetime.time(16, 0)),
+                                         ('NZ', 'Pacific/Auckland', datetime.time(16, 45)),
+                                         ('LATE', 'America/Los_Angeles', datetime.time(20, 0))]:
+        models.Exchange.objects.create(name=code, mic=code, code=code, timezone=timezone, closing_hour=closing_hour)
+
+    index = trading_calendar_service.get_close_schedule(datetime.date(2024, 1, 9))
+
+    def utc(day, hour, minute=0):
+        return datetime.datetime(2024, 1, day, hour, minute, tzinfo=pytz.UTC)
+
+    assert {utc_hour: [(exchange.code, utc_closing_time) for exchange, utc_closing_time in closing]
+            for utc_hour, closing in index.items()} == {utc(9, 3): [('NZ', utc(9, 3, 45))],
+                                                        utc(9, 4): [('LATE', utc(9, 4))],
+                                                        utc(9, 21): [('US', utc(9, 21))]}
+    late_close = trading_calendar_service.get_exchanges_closing_in_hour(utc(10, 4, 30))
+    assert [(exchange.code, utc_closing_time) for exchange, utc_closing_time in late_close] == [('LATE', utc(10, 4))]
+
+
+@pytest.mark.django_db
+def test_prices_of_a_close_on_the_next_utc_day_are_taken_for_the_local_session(monkeypatch, account):
+    exchange = models.Exchange.objects.create(name='LATE', mic='LATE', code='LATE', timezone='America/Los_Angeles',
+                                              closing_hour=datetime.time(20, 0))
+    monkeypatch.setattr(trading_calendar_service, 'HOLIDAY_CACHE', {
+        exchange.id: {'holidays': set(), 'time': datetime.datetime.now().date()}})
+    asset = models.Asset.objects.create(ticker='LATE', name='Late Corp', currency='USD', exchange=exchange)
+    models.AssetBalance.objects.create(account=account, asset_id=asset.id, quantity=5, price=10, result=0,
+                                       average_price=10, last_save_date=datetime.date(2024, 1, 7),
+                                       first_event_date=datetime.date(2024, 1, 1),
+                                       last_transaction_date=datetime.datetime(2024, 1, 7))
+    requested = []
+
+    def get_bulk_last_day_price(stocks, exchange, date):
+        requested.append(date)
+        return {'LATE': 12}
+
+    monkeypatch.setattr(eod_service, 'get_bulk_last_day_price', get_bulk_last_day_price)
+
+    # Monday's session closes on Tuesday in UTC
+    stock_balance_service.update_exchange_stock_price(exchange, datetime.datetime(2024, 1, 9, 4, tzinfo=pytz.UTC))
+
+    assert requested == [datetime.date(2024, 1, 8)]
+    price = models.AssetTransaction.objects.get(asset_id=asset.id, transaction_type='price')
+    assert price.date == datetime.datetime(2024, 1, 9)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ams import models
+from ams.services import account_balance_service, unit_of_work
+
+
+@pytest.mark.django_db
+def test_saves_are_flushed_once_when_the_unit_of_work_commits(account):
+    now = datetime.now()
+    models.AccountBalance.objects.create(account=account, currency='PLN', amount=100)
+
+    with CaptureQueriesContext(connection) as queries:
+        with unit_of_work.atomic(account):
+            deposit = models.AccountTransaction.objects.create(account=account, amount=50, currency='PLN',
+                                                               type=models.AccountTransaction.DEPOSIT,
+                                                               date=now - timedelta(days=365))
+            account_balance_service.add_transaction_to_account_balance(deposit, account)
+            assert unit_of_work.get_account(account.id, user=account.user) is account
+            assert models.AccountBalance.objects.get(account=account).amount == 100
+
+    assert models.AccountBalance.objects.get(account=account).amount == 150
+    assert models.Account.objects.get(id=account.id).xirr is not None
+    account_updates = [query for query in queries if query['sql'].startswith('UPDATE "ams_account" ')]
+    assert len(account_updates) == 1
+    assert unit_of_work.UNIT_OF_WORK.get() is None
+
+
+@pytest.mark.django_db
+def test_failed_nested_block_is_rolled_back_to_its_savepoint(account):
+    with unit_of_work.atomic(account):
+        balance, _ = unit_of_work.get_or_create_account_balance(account, 'PLN')
+        balance.amount = 50
+        unit_of_work.save(balance)
+        with pytest.raises(ValueError):
+            with unit_of_work.atomic():
+                balance.amount = 100
+                unit_of_work.save(balance, account)
+                account.xirr = 1
+                unit_of_work.get_or_create_account_balance(account, 'USD')
+                raise ValueError()
+
+        assert balance.amount == 50
+        assert account.xirr is None
+        assert list(unit_of_work.get_account_balances([account])[account.id]) == ['PLN']
+
+    assert list(models.AccountBalance.objects.filter(account=account).values_list('currency', 'amount')) == \
+           [('PLN', 50)]
+    assert models.Account.objects.get(id=account.id).xirr is None
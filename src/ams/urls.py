@@ -10,16 +10,23 @@ router.register(r'accounts/(?P<account_id>\d+)/transactions', views.TransactionV
 router.register("exchanges", views.ExchangeViewSet, "exchange")
 router.register("stocks", views.StockViewSet, "stock")
 router.register(r'stocks/(?P<exchange_id>\d+)', views.StockViewSet, "stocks_by_exchange"),
-router.register(r'stock/(?P<account_id>\d+)/transaction', views.StockTransactionViewSet, "transaction")
+router.register(r'stock/(?P<account_id>\d+)/transaction', views.StockTransactionViewSet, "stock_transaction")
 router.register(r'stock_balances/(?P<account_id>\d+)', views.StockBalanceViewSet, "stock_balance")
 router.register(r'favourite_assets', views.FavoriteAssetViewSet, "favourite_assets")
 
 urlpatterns = [
     re_path("", include(router.urls)),
-    re_path(r'search', views.StockSearchAPIView.as_view(), name='api-search'),
-    re_path(r'get_stock_details', views.StockDetailsAPIView.as_view(), name='get_stock_details'),
-    re_path(r'get_stock_history', views.StockPriceHistoryAPIView.as_view(), name='get_stock_history'),
-    re_path(r'get_stock_news', views.StockNewsAPIView.as_view(), name='get_stock_news'),
+    re_path(r'search', views.stock_search, name='api-search'),
+    re_path(r'get_stock_details', views.stock_details, name='get_stock_details'),
+    re_path(r'get_stock_history', views.stock_price_history, name='get_stock_history'),
+    re_path(r'quotes/favourites', views.favourite_quotes, name='favourite_quotes'),
+    re_path(r'quotes/accounts/(?P<account_id>\d+)', views.account_quotes, name='account_quotes'),
+    re_path(r'get_stock_news', views.stock_news, name='get_stock_news'),
+    re_path(r'eod_quota', views.eod_quota, name='eod_quota'),
+    re_path(r'job_runs', views.job_runs, name='job_runs'),
+    re_path(r'slow_queries', views.slow_queries, name='slow_queries'),
+    re_path(r'profiles/(?P<profile_id>\d+)$', views.profile_download, name='profile_download'),
+    re_path(r'profiles$', views.profiles, name='profiles'),
     re_path(r'update_stock', views.update_stock, name='update_stock'),
     re_path(r'accounts/(?P<account_id>\d+)/history', views.AccountHistoryView.as_view(), name="account_history"),
     re_path(r'import_stock_transactions', views.stock_transactions, name="import_stock_transactions"),
@@ -1,26 +1,36 @@
+import asyncio
 import datetime
+import functools
 import logging
 
+from asgiref.sync import sync_to_async
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from django.db import transaction
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from rest_framework import status, viewsets
 from rest_framework.decorators import action, parser_classes
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from ams import models, serializers
+from ams import models, serializers, tasks
 from ams.permissions import IsObjectOwner
 from ams.serializers import ExchangeSerializer
 from ams.services import account_history_service, account_balance_service, \
-    import_service, account_xirr_service
-from ams.services import stock_balance_service, eod_service
+    import_service, account_xirr_service, asset_history_service, job_run_service, profiler, \
+    query_log, unit_of_work
+from ams.services import stock_balance_service, eod_service, eod_client, search_service, symbol_returns_service, \
+    quote_service, rate_limiter
 from ams.services.account_balance_service import add_transaction_from_stock, add_transaction_to_account_balance
 from ams.services.import_service import IncorrectFileFormatException, UnknownAssetException
+from ams.services.metrics import get_registry
 from ams.services.stock_balance_service import update_stock_price
+from main.settings import METRICS_TOKEN, SLOW_QUERY_REPORT_SIZE
 
 logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -49,8 +59,29 @@ class AccountViewSet(viewsets.ModelViewSet):
         logging.info("Account updated")
         return Response({"msg": "Account updated"}, status=status.HTTP_200_OK)
 
+    def destroy(self, request, *args, **kwargs):
+        account = self.get_object()
+        account.deleted_at = datetime.datetime.now()
+        account.save(update_fields=['deleted_at'])
+        transaction.on_commit(lambda: tasks.delete_account.delay(account.id))
+        logging.info("Account scheduled for deletion")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def list(self, request, *args, **kwargs):
+        stock_balance_service.refresh_balances(models.Account.objects.filter(user=request.user))
+        accounts = list(self.get_queryset())
+        values = account_balance_service.get_accounts_value(accounts)
+        context = {**self.get_serializer_context(), 'values': values}
+        serializer = self.get_serializer(accounts, many=True, context=context)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        stock_balance_service.refresh_balances(models.Account.objects.filter(pk=kwargs['pk'], user=request.user))
+        return super().retrieve(request, *args, **kwargs)
+
     def get_queryset(self):
-        return models.Account.objects.filter(user=self.request.user).order_by('id')
+        return (models.Account.objects.filter(user=self.request.user).select_related('account_preferences')
+                .prefetch_related('balances').order_by('id'))
 
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PUT']:
@@ -101,7 +132,7 @@ class TransactionViewSet(viewsets.ViewSet):
 
     def create(self, request, account_id):
         try:
-            account = models.Account.objects.get(pk=account_id, user=self.request.user)
+            account = unit_of_work.get_account(account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found or does not belong to the user"},
                             status=status.HTTP_404_NOT_FOUND)
@@ -109,8 +140,9 @@ class TransactionViewSet(viewsets.ViewSet):
         serializer = serializers.TransactionCreateSerializer(data=request.data, context={'account_id': account.id})
         serializer.is_valid(raise_exception=True)
 
-        transaction = serializer.save()
-        add_transaction_to_account_balance(transaction, account)
+        with unit_of_work.atomic(account):
+            transaction = serializer.save()
+            add_transaction_to_account_balance(transaction, account)
 
         return Response({"msg": "Transaction created."}, status=status.HTTP_201_CREATED)
 
@@ -131,7 +163,7 @@ class TransactionViewSet(viewsets.ViewSet):
 
     def update(self, request, account_id, pk=None):
         try:
-            account = models.Account.objects.get(pk=account_id, user=request.user)
+            account = unit_of_work.get_account(account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
 
@@ -141,7 +173,7 @@ class TransactionViewSet(viewsets.ViewSet):
         serializer = serializers.TransactionSerializer(account_transaction, data=request.data)
         serializer.is_valid(raise_exception=True)
         try:
-            with transaction.atomic():
+            with unit_of_work.atomic(account):
                 account_transaction = serializer.save()
                 account_balance_service.modify_transaction(account_transaction, old_account_transaction_date)
         except Exception as e:
@@ -151,12 +183,13 @@ class TransactionViewSet(viewsets.ViewSet):
 
     def destroy(self, request, account_id, pk=None):
         try:
-            account = models.Account.objects.get(pk=account_id, user=request.user)
+            account = unit_of_work.get_account(account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
 
         account_transaction = get_object_or_404(models.AccountTransaction, pk=pk, account=account)
-        account_balance_service.delete_transaction(account_transaction)
+        with unit_of_work.atomic(account):
+            account_balance_service.delete_transaction(account_transaction)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -209,7 +242,7 @@ class StockTransactionViewSet(viewsets.ViewSet):
 
     def create(self, request, account_id):
         try:
-            account = models.Account.objects.get(pk=account_id, user=request.user)
+            account = unit_of_work.get_account(account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
 
@@ -222,7 +255,7 @@ class StockTransactionViewSet(viewsets.ViewSet):
             return Response({"error": "Stock not found."}, status=404)
 
         try:
-            with transaction.atomic():
+            with unit_of_work.atomic(account):
                 stock_transaction = serializer.save()
                 stock_balance_service.add_stock_transaction_to_balance(stock_transaction, stock, account)
 
@@ -254,18 +287,19 @@ class StockTransactionViewSet(viewsets.ViewSet):
 
     def destroy(self, request, account_id, pk=None):
         try:
-            account = models.Account.objects.get(pk=account_id, user=request.user)
+            account = unit_of_work.get_account(account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
 
         stock_transaction = get_object_or_404(models.AssetTransaction, pk=pk, account=account)
-        stock_balance_service.delete_stock_transaction(stock_transaction)
+        with unit_of_work.atomic(account):
+            stock_balance_service.delete_stock_transaction(stock_transaction)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def update(self, request, account_id, pk=None):
         try:
-            account = models.Account.objects.get(pk=account_id, user=request.user)
+            account = unit_of_work.get_account(account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
 
@@ -275,7 +309,7 @@ class StockTransactionViewSet(viewsets.ViewSet):
         serializer = serializers.StockTransactionSerializer(stock_transaction, data=request.data)
         serializer.is_valid(raise_exception=True)
         try:
-            with transaction.atomic():
+            with unit_of_work.atomic(account):
                 stock_transaction = serializer.save()
                 stock_balance_service.modify_stock_transaction(stock_transaction, old_stock_transaction_date)
         except Exception as e:
@@ -317,6 +351,7 @@ class StockBalanceViewSet(viewsets.ViewSet):
             account = models.Account.objects.get(pk=account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
+        stock_balance_service.refresh_balances([account])
 
         stock_balance = models.AssetBalance.objects.filter(asset_id=pk, account=account).first()
         serializer = serializers.StockBalanceDtoSerializer(stock_balance, many=False)
@@ -328,9 +363,12 @@ class StockBalanceViewSet(viewsets.ViewSet):
             account = models.Account.objects.get(pk=account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
+        stock_balance_service.refresh_balances([account])
 
-        stock_balances = models.AssetBalance.objects.filter(account=account)
-        serializer = serializers.StockBalanceDtoSerializer(stock_balances, many=True)
+        stock_balances = list(models.AssetBalance.objects.filter(account=account))
+        assets = models.Asset.objects.select_related('exchange').in_bulk(
+            {stock_balance.asset_id for stock_balance in stock_balances})
+        serializer = serializers.StockBalanceDtoSerializer(stock_balances, many=True, context={'assets': assets})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['GET'])
@@ -339,23 +377,18 @@ class StockBalanceViewSet(viewsets.ViewSet):
             account = models.Account.objects.get(pk=account_id, user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
+        stock_balance_service.refresh_balances([account])
 
         from_date = request.query_params.get('from')
         to_date = request.query_params.get('to')
+        try:
+            from_date = datetime.date.fromisoformat(from_date) if from_date else None
+            to_date = datetime.date.fromisoformat(to_date) if to_date else None
+        except ValueError:
+            return Response({"error": "from and to must be dates in YYYY-MM-DD format"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        if from_date and to_date:
-            stock_balance_histories = models.AssetBalanceHistory.objects.filter(asset_id=pk, account=account,
-                                                                                date__gte=from_date,
-                                                                                date__lte=to_date).order_by('date')
-        elif from_date:
-            stock_balance_histories = models.AssetBalanceHistory.objects.filter(asset_id=pk, account=account,
-                                                                                date__gte=from_date).order_by('date')
-        elif to_date:
-            stock_balance_histories = models.AssetBalanceHistory.objects.filter(asset_id=pk, account=account,
-                                                                                date__lte=to_date).order_by('date')
-        else:
-            stock_balance_histories = models.AssetBalanceHistory.objects.filter(asset_id=pk, account=account).order_by(
-                'date')
+        stock_balance_histories = asset_history_service.get_series(account, pk, from_date, to_date)
         serializer = serializers.StockBalanceHistoryDtoSerializer(stock_balance_histories, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -369,7 +402,9 @@ class StockBalanceViewSet(viewsets.ViewSet):
         except models.Asset.DoesNotExist:
             return Response({"error": "Stock not found."}, status=404)
 
-        stock_balance = models.AssetBalance.objects.filter(asset_id=pk, account=account).first()
+        stock_balance_service.refresh_balances([account])
+        stock_balance = models.AssetBalance.objects.filter(asset_id=pk, account=account).select_related(
+            'account__account_preferences').first()
         try:
             price, currency = stock_balance_service.get_stock_price_in_base_currency(stock_balance, stock)
             return Response({"price": price, "currency": currency}, status=status.HTTP_200_OK)
@@ -401,71 +436,111 @@ class FavoriteAssetViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class StockSearchAPIView(APIView):
-    permission_classes = (IsAuthenticated,)
+def async_authenticated(view):
+    """
+    Async counterpart of IsAuthenticated for plain Django async views, which DRF does not support.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                                status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if not result:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
 
-    def get(self, request, *args, **kwargs):
-        query_string = request.GET['query_string']
+    return wrapper
 
-        try:
-            data = eod_service.search(query_string)
-            return Response(data, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.exception(e)
-            return Response({'error': 'Internal Server Error'}, status=500)
 
+@async_authenticated
+async def stock_search(request):
+    query_string = request.GET['query_string']
 
-class StockDetailsAPIView(APIView):
-    permission_classes = (IsAuthenticated,)
+    try:
+        data = await search_service.search(query_string)
+        return JsonResponse(data, safe=False, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.exception(e)
+        return JsonResponse({'error': 'Internal Server Error'}, status=500)
 
-    def get(self, request, *args, **kwargs):
-        stock = request.GET.get('stock')
-        exchange = request.GET.get('exchange')
-        period = request.GET.get('period', 'd')
-        from_date = request.GET.get('from', datetime.datetime.now().date().strftime("%Y-%m-%d"))
-        from_date = datetime.datetime.strptime(from_date, "%Y-%m-%d").date()
-        to_date = request.GET.get('to', datetime.datetime.now().date().strftime("%Y-%m-%d"))
-        to_date = datetime.datetime.strptime(to_date, "%Y-%m-%d").date()
 
-        try:
-            stock_details = eod_service.get_stock_details(stock, exchange, period, from_date, to_date)
-            stock_details['exchange_info'] = serializers.ExchangeSerializer(stock_details['exchange_info']).data
-            return Response(data=stock_details, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.exception(e)
-            return Response({'error': 'Internal Server Error'}, status=500)
+@async_authenticated
+async def stock_details(request):
+    stock = request.GET.get('stock')
+    exchange = request.GET.get('exchange')
+    period = request.GET.get('period', 'd')
+    from_date = request.GET.get('from', datetime.datetime.now().date().strftime("%Y-%m-%d"))
+    from_date = datetime.datetime.strptime(from_date, "%Y-%m-%d").date()
+    to_date = request.GET.get('to', datetime.datetime.now().date().strftime("%Y-%m-%d"))
+    to_date = datetime.datetime.strptime(to_date, "%Y-%m-%d").date()
 
+    try:
+        price_changes, current_info = await asyncio.gather(
+            eod_client.get_price_changes(stock, exchange, from_date, to_date, period),
+            quote_service.get_quote(stock, exchange)
+        )
+        exchange_info = await sync_to_async(models.Exchange.objects.filter(code=exchange).first)()
+        stock_details = eod_service.build_stock_details(price_changes, current_info, exchange_info)
+        stock_details['exchange_info'] = serializers.ExchangeSerializer(stock_details['exchange_info']).data
+        return JsonResponse(stock_details, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.exception(e)
+        return JsonResponse({'error': 'Internal Server Error'}, status=500)
 
-class StockPriceHistoryAPIView(APIView):
-    permission_classes = (IsAuthenticated,)
 
-    def get(self, request, *args, **kwargs):
-        stock = request.GET.get('stock')
-        exchange = request.GET.get('exchange')
-        to_date = datetime.datetime.now().date().strftime("%Y-%m-%d")
-        to_date = datetime.datetime.strptime(to_date, "%Y-%m-%d").date()
+@async_authenticated
+async def stock_price_history(request):
+    stock = request.GET.get('stock')
+    exchange = request.GET.get('exchange')
 
-        try:
-            stock_details = eod_service.get_stock_history(stock, exchange, None, to_date)
+    try:
+        snapshot, current_info = await asyncio.gather(
+            sync_to_async(symbol_returns_service.get_snapshot)(stock, exchange),
+            quote_service.get_quote(stock, exchange)
+        )
+        stock_history = symbol_returns_service.build_stock_history(snapshot, current_info)
+        return JsonResponse(stock_history, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.exception(e)
+        return JsonResponse({'error': 'Internal Server Error'}, status=500)
 
-            return Response(data=stock_details, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.exception(e)
-            return Response({'error': 'Internal Server Error'}, status=500)
 
+@async_authenticated
+async def account_quotes(request, account_id):
+    account = await sync_to_async(models.Account.objects.filter(pk=account_id, user=request.user).first)()
+    if account is None:
+        return JsonResponse({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
 
-class StockNewsAPIView(APIView):
-    permission_classes = (IsAuthenticated,)
+    try:
+        symbols = await sync_to_async(quote_service.get_account_symbols)(account)
+        return JsonResponse(await quote_service.get_quotes(symbols), status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.exception(e)
+        return JsonResponse({'error': 'Internal Server Error'}, status=500)
 
-    def get(self, request, *args, **kwargs):
-        stock = request.GET.get('stock')
 
-        try:
-            stock_news = eod_service.get_stock_news(stock)
-            return Response(data=stock_news, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.exception(e)
-            return Response({'error': 'Internal Server Error'}, status=500)
+@async_authenticated
+async def favourite_quotes(request):
+    try:
+        symbols = await sync_to_async(quote_service.get_favourite_symbols)(request.user)
+        return JsonResponse(await quote_service.get_quotes(symbols), status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.exception(e)
+        return JsonResponse({'error': 'Internal Server Error'}, status=500)
+
+
+@async_authenticated
+async def stock_news(request):
+    stock = request.GET.get('stock')
+
+    data = await eod_client.get_stock_news(stock)
+    return JsonResponse(eod_service.build_stock_news(data), safe=False, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -478,15 +553,72 @@ def update_stock(request):
     return Response({"msg": "Stock price updated"}, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def eod_quota(request):
+    return Response(rate_limiter.get_usage(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def job_runs(request):
+    try:
+        days = int(request.query_params.get('days', 14))
+    except ValueError:
+        return Response({"error": "days must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(job_run_service.get_trends(days), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def slow_queries(request):
+    try:
+        limit = int(request.query_params.get('limit', SLOW_QUERY_REPORT_SIZE))
+    except ValueError:
+        return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(query_log.get_report(limit), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profiles(request):
+    try:
+        account_id = int(request.query_params['account_id']) if 'account_id' in request.query_params else None
+    except ValueError:
+        return Response({"error": "account_id must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(profiler.get_profiles(request.query_params.get('route'), account_id), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_download(request, profile_id):
+    profile = get_object_or_404(models.RequestProfile, pk=profile_id)
+    content_type, file_name = profiler.get_download(profile)
+    response = HttpResponse(bytes(profile.data), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
+
+
+def metrics(request):
+    if not METRICS_TOKEN:
+        return JsonResponse({'detail': 'Metrics are disabled, METRICS_TOKEN is not set.'},
+                            status=status.HTTP_403_FORBIDDEN)
+    if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return JsonResponse({'detail': 'Invalid metrics token.'}, status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
 class AccountHistoryView(APIView):
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, account_id):
         try:
-            account = models.Account.objects.get(pk=account_id, user=request.user)
+            account = models.Account.objects.select_related('account_preferences').get(pk=account_id,
+                                                                                       user=request.user)
         except models.Account.DoesNotExist:
             return Response({"error": "Account not found."}, status=404)
 
+        stock_balance_service.refresh_balances([account])
         dtos = account_history_service.get_account_history_dtos(account)
 
         serializer = serializers.AccountHistoryDtoSerializer(dtos, many=True)
@@ -540,7 +672,8 @@ def csv_stock_transactions(request, account_id):
         return Response({"error": "File type not supported"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        import_service.import_csv(file, account)
+        with rate_limiter.priority(rate_limiter.BATCH):
+            import_service.import_csv(file, account)
     except IncorrectFileFormatException:
         return Response({"error": "File has incorrect format"}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
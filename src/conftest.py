@@ -1,7 +1,26 @@
+import threading
+from datetime import datetime, timedelta
+
 import pytest
+from django.contrib.auth.models import User
 
 from rest_framework.test import APIClient
 
+from ams import models
+from ams.devtools import eod_stub
+from ams.services import eod_client
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('ams benchmarks')
+    group.addoption('--bench', action='store_true', help='Run the benchmarks in ams/tests/benchmarks')
+    group.addoption('--bench-size', default='small', choices=['small', 'medium', 'large'],
+                    help='Size of the generated benchmark dataset')
+    group.addoption('--bench-save', metavar='NAME', help='Save benchmark results as baseline NAME')
+    group.addoption('--bench-compare', metavar='NAME', help='Fail benchmarks that regressed against baseline NAME')
+    group.addoption('--bench-tolerance', type=float, default=0.25,
+                    help='Allowed relative slowdown and memory growth when comparing, query counts must not grow')
+
 
 @pytest.fixture
 def client():
@@ -20,3 +39,43 @@ def client():
     client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
 
     return client
+
+
+@pytest.fixture
+def account():
+    """
+    An account with PLN preferences, last saved two years ago so any transaction after that is appended to it.
+    """
+    user = User.objects.create_user(username='owner', password='password')
+    two_years_ago = datetime.now() - timedelta(days=730)
+    account = models.Account.objects.create(user=user, name='account', last_save_date=two_years_ago,
+                                            last_transaction_date=two_years_ago)
+    models.AccountPreferences.objects.create(account=account, base_currency='PLN')
+    return account
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+@pytest.fixture(scope='session')
+def eod_stub_url():
+    """
+    Serves the EOD API from the local stand-in for the whole session, so tests never leave the machine.
+    """
+    server = eod_stub.make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    original_url = eod_client.EOD_API_URL
+    eod_client.EOD_API_URL = url
+    eod_client._sessions.clear()
+    yield url
+    eod_client.EOD_API_URL = original_url
+    eod_client._sessions.clear()
+    server.shutdown()
+    server.server_close()
@@ -14,6 +14,7 @@ from datetime import timedelta
 from pathlib import Path
 
 from celery.schedules import crontab
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -76,6 +77,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     "ams.apps.AMSConfig",
@@ -86,6 +88,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ams.middleware.metrics_middleware',
+    'ams.middleware.tracing_middleware',
+    'ams.middleware.profiling_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,9 +99,12 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'ams.middleware.stale_data_middleware',
 ]
 
 CORS_ORIGIN_ALLOW_ALL = True
+CORS_EXPOSE_HEADERS = ['Warning', 'Server-Timing']
+CORS_ALLOW_HEADERS = list(default_headers) + ['x-profile']
 
 ROOT_URLCONF = 'main.urls'
 
@@ -117,6 +125,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'main.wsgi.application'
+ASGI_APPLICATION = 'main.asgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -182,6 +191,16 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://redis:6379/1',
+    }
+}
+
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
 CELERY_BEAT_SCHEDULE = {
@@ -196,8 +215,63 @@ CELERY_BEAT_SCHEDULE = {
     'save-stock-balance-history': {
         'task': 'ams.tasks.save_stock_balance_history',
         'schedule': crontab(hour='0', minute='0'),
+    },
+    'update-exchange-holidays': {
+        'task': 'ams.tasks.update_exchange_holidays',
+        'schedule': crontab(hour='2', minute='30', day_of_week='sun'),
+    },
+    'refresh-symbol-returns': {
+        'task': 'ams.tasks.refresh_symbol_returns',
+        'schedule': crontab(hour='0', minute='30'),
+    },
+    'load-symbol-universe': {
+        'task': 'ams.tasks.load_symbol_universe',
+        'schedule': crontab(hour='3', minute='0', day_of_week='sun'),
+    },
+    'prune-job-runs': {
+        'task': 'ams.tasks.prune_job_runs',
+        'schedule': crontab(hour='3', minute='30', day_of_week='sun'),
+    },
+    'rebuild-dirty-balances': {
+        'task': 'ams.tasks.rebuild_dirty_balances',
+        'schedule': crontab(minute='*/5'),
     }
 }
 
 EOD_TOKEN = os.getenv('EOD_TOKEN')
-EOD_API_URL = "https://eodhd.com/api"
+EOD_API_URL = os.getenv('EOD_API_URL', 'https://eodhd.com/api')
+EOD_MAX_CONCURRENCY = 10
+EOD_MAX_RETRIES = 3
+EOD_RATE_LIMIT_PER_MINUTE = int(os.getenv('EOD_RATE_LIMIT_PER_MINUTE', 1000))
+EOD_DAILY_QUOTA = int(os.getenv('EOD_DAILY_QUOTA', 100000))
+EOD_BATCH_SHARE = 0.8
+
+BULK_DELETE_BATCH_SIZE = 10000
+
+# With LAZY_REBUILD writes only record the earliest date from which the balances they touch are dirty, balances are
+# rebuilt once when they are next read or by the rebuild-dirty-balances task, so bursts of edits share one rebuild
+LAZY_REBUILD = os.getenv('LAZY_REBUILD', 'false').lower() == 'true'
+
+# /metrics requires an "Authorization: Bearer <token>" header with this token and is closed while it is unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Directory the web workers write their Prometheus metrics to, /metrics then aggregates every worker of the server.
+# prometheus-client reads it from the environment when it is imported, it must be set before the workers start.
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Request traces, TRACE_SERVER_TIMING sends them back as a Server-Timing header, TRACE_LOG logs every trace as JSON.
+# Traces of requests slower than TRACE_SLOW_REQUEST_SECONDS are always logged.
+TRACE_SERVER_TIMING = os.getenv('TRACE_SERVER_TIMING', 'false').lower() == 'true'
+TRACE_LOG = os.getenv('TRACE_LOG', 'false').lower() == 'true'
+TRACE_SLOW_REQUEST_SECONDS = float(os.getenv('TRACE_SLOW_REQUEST_SECONDS', 2.0))
+
+# Queries slower than SLOW_QUERY_SECONDS are logged with the code that ran them, /api/slow_queries reports the
+# SLOW_QUERY_REPORT_SIZE call sites of the process that spent the most time in the database
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', 0.2))
+SLOW_QUERY_REPORT_SIZE = 20
+
+# Request profiles, staff users profile a request by sending "X-Profile: cprofile" or "X-Profile: sample" and
+# PROFILE_SAMPLE_RATE profiles that share of all requests in PROFILE_SAMPLE_MODE. Only the last PROFILE_KEEP are kept.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+PROFILE_SAMPLE_MODE = os.getenv('PROFILE_SAMPLE_MODE', 'sample')
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_KEEP = 200
@@ -1,9 +1,12 @@
 from django.conf.urls import include
 from django.urls import re_path
 
+from ams import views
+
 
 # api and auth routes
 urlpatterns = [
     re_path("^api/", include("ams.urls")),
-    re_path("^auth/", include("authconf.auth_urls"))
+    re_path("^auth/", include("authconf.auth_urls")),
+    re_path("^metrics$", views.metrics, name="metrics"),
 ]